@@ -0,0 +1,48 @@
+# app/core/background.py
+
+from typing import Any, Callable, Optional
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class _TaskSignals(QObject):
+    # QRunnable 不是 QObject，无法直接定义信号，因此由这个辅助对象代为发出
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+
+class BackgroundTask(QRunnable):
+    """
+    在 QThreadPool 中执行一个阻塞函数（例如调用外部工具），
+    结束后通过信号把返回值或异常送回主线程。
+    """
+    def __init__(self, fn: Callable[..., Any], *args: Any):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        # 信号对象在主线程创建，工作线程发出的信号会以队列方式回到主线程执行槽函数
+        self.signals = _TaskSignals()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(e)
+            return
+        self.signals.finished.emit(result)
+
+
+def run_in_background(fn: Callable[..., Any], *args: Any,
+                      on_finished: Optional[Callable[[Any], None]] = None,
+                      on_failed: Optional[Callable[[Exception], None]] = None) -> BackgroundTask:
+    """
+    把 fn(*args) 交给全局线程池执行。
+
+    返回任务对象；调用方应保留其引用直到回调触发，以免信号对象被提前回收。
+    """
+    task = BackgroundTask(fn, *args)
+    if on_finished is not None:
+        task.signals.finished.connect(on_finished)
+    if on_failed is not None:
+        task.signals.failed.connect(on_failed)
+    QThreadPool.globalInstance().start(task)
+    return task
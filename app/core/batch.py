@@ -0,0 +1,36 @@
+# app/core/batch.py
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+
+def _call_in_worker(payload: Tuple[type, tuple, str, tuple]) -> Any:
+    """在工作进程中重新构造一个轻量的包装器实例并调用指定方法。"""
+    cls, ctor_args, method, args = payload
+    return getattr(cls(*ctor_args), method)(*args)
+
+
+def run_batch(cls: type, ctor_args: tuple, method: str,
+              jobs: Iterable[Sequence[Any]], max_workers: Optional[int] = None) -> List[Any]:
+    """
+    并行地对多个文件执行同一个包装器方法（例如 unpack / pack）。
+
+    每个任务在独立进程中运行：传给子进程的只有类、构造参数和路径等字符串，
+    子进程各自启动外部工具并处理自己的文件 I/O，互不依赖。
+    结果按 jobs 的顺序返回；任一任务失败时抛出该任务的异常。
+
+    Args:
+        cls: 包装器类，例如 ThmsgWrapper。
+        ctor_args: 在子进程中构造包装器所用的参数。
+        method: 要调用的方法名。
+        jobs: 每个元素是一次调用的位置参数序列。
+        max_workers: 最大进程数，默认为 CPU 核心数。
+    """
+    payloads = [(cls, tuple(ctor_args), method, tuple(job)) for job in jobs]
+    if len(payloads) <= 1:
+        # 单个任务不值得启动进程池
+        return [_call_in_worker(payload) for payload in payloads]
+    workers = min(len(payloads), max_workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_call_in_worker, payloads))
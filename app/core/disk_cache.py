@@ -0,0 +1,123 @@
+# app/core/disk_cache.py
+
+import hashlib
+import os
+import shutil
+import sys
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+# 缓存内容的格式版本；翻译逻辑或缓存格式变化时递增，使旧缓存自然失效
+CACHE_VERSION = 2
+
+# 本进程中已执行过 prune_once 的缓存子目录
+_pruned = set()
+
+
+def _base_dir() -> Path:
+    """按平台惯例返回用户级缓存根目录。"""
+    if sys.platform == 'win32':
+        root = os.environ.get('LOCALAPPDATA') or Path.home() / 'AppData' / 'Local'
+    else:
+        root = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(root) / 'THTK-Studio'
+
+
+def cache_dir(name: str) -> Optional[Path]:
+    """返回（并按需创建）指定用途的缓存子目录；无法创建时返回 None，调用方应直接跳过缓存。"""
+    path = _base_dir() / name
+    try:
+        path.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    return path
+
+
+def content_key(*parts: Union[bytes, str]) -> str:
+    """根据若干内容片段计算缓存键（blake2b，128 位十六进制）。"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(CACHE_VERSION).encode())
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(part.encode('utf-8') if isinstance(part, str) else part)
+    return digest.hexdigest()
+
+
+def fetch(name: str, filename: str, dest: Path) -> bool:
+    """若缓存中存在 filename，则复制到 dest 并返回 True。"""
+    directory = cache_dir(name)
+    if directory is None:
+        return False
+    cached = directory / filename
+    try:
+        shutil.copyfile(cached, dest)
+    except OSError:
+        return False
+    touch(cached)
+    return True
+
+
+def store(name: str, filename: str, src: Path) -> None:
+    """把 src 复制进缓存；先写临时文件再原子替换，避免并发读到不完整的文件。"""
+    directory = cache_dir(name)
+    if directory is None:
+        return
+    tmp = directory / f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, directory / filename)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+
+def touch(path: Path) -> None:
+    """更新缓存文件的修改时间，使 prune 按最近使用顺序淘汰。"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def prune(name: str, max_bytes: int) -> None:
+    """若缓存子目录总大小超过 max_bytes，则按修改时间从旧到新删除文件，直到不超过上限。"""
+    directory = cache_dir(name)
+    if directory is None:
+        return
+    files = []
+    total = 0
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files.append((st.st_mtime_ns, st.st_size, entry.path))
+                total += st.st_size
+    except OSError:
+        return
+    if total <= max_bytes:
+        return
+    files.sort()
+    for _, size, path in files:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= max_bytes:
+            break
+
+
+def prune_once(name: str, max_bytes: int) -> None:
+    """每个进程中对同一缓存子目录只执行一次 prune，供写入缓存的调用方在每次写入后直接调用。"""
+    if name in _pruned:
+        return
+    _pruned.add(name)
+    prune(name, max_bytes)
@@ -1,40 +1,91 @@
 # touhou_script_editor/app/core/image_manager.py
 
+import mmap
 import os
-from typing import Dict, Optional
-from PIL import Image, UnidentifiedImageError
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+from PIL import Image, UnidentifiedImageError, features
+
+from . import disk_cache
 
 # 'Image.Image' 是 Pillow 库中图像对象的类型注解
 ImageType = Image.Image 
+# 缓存中保存的原始像素数据：(mode, size, bytes)
+RawPixels = Tuple[str, Tuple[int, int], bytes]
+# 这些模式可以用 frombuffer 零拷贝地直接引用缓存中的字节
+_ZERO_COPY_MODES = frozenset(("L", "RGBA", "RGBX"))
+# 后台预取图集的线程数：读取可与解码重叠，多张图集的 I/O 也能并发进行
+_PREFETCH_WORKERS = min(4, os.cpu_count() or 1)
+# PNG 图集的 WebP 副本：首次解码后在后台无损转存到用户缓存目录，之后优先解码副本
+_WEBP_TWINS = features.check("webp")
+_WEBP_CACHE_NAME = 'sheets'
+_WEBP_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+_WEBP_MODES = frozenset(("RGB", "RGBA"))
 
 class ImageManager:
     """
     负责加载、缓存和裁剪精灵图集（spritesheet）。
 
-    这个类维护一个内存缓存，以避免对同一图像文件进行重复的磁盘I/O操作，
-    从而在UI频繁刷新时提升性能。
+    这个类维护一个有上限的 LRU 内存缓存，以避免对同一图像文件进行重复的磁盘I/O操作，
+    从而在UI频繁刷新时提升性能；超出上限时最久未使用的图集会被释放。
+    缓存只保存解码后的原始像素 (mode, size, bytes)，而不长期持有 Pillow 的 Image 对象，
+    需要时再按需重建。
     """
-    def __init__(self, base_path: str = ''):
+    def __init__(self, base_path: str = '', max_entries: int = 16, max_sprites: int = 512, max_recycled: int = 4):
         """
         初始化 ImageManager。
         
         Args:
             base_path: 脚本文件所在的目录，用于解析相对图像路径。
+            max_entries: 图集缓存的最大条目数。加载失败的路径会以 None 存入缓存
+                （负缓存，避免反复尝试加载坏文件），这些条目同样计入上限。
+            max_sprites: 裁剪结果缓存的最大条目数。
+            max_recycled: 被淘汰 / 清空后仍暂存的图集像素数量，用于再次打开同一文件时免于重新解码。
         """
         self.base_path = base_path
-        self.image_cache: Dict[str, Optional[ImageType]] = {}
-        # 缓存裁剪后的精灵（包含偏移），键为 (full_path, x, y, w, h, x_off, y_off)
-        self.sprite_cache: Dict[tuple, Optional[ImageType]] = {}
+        # relative_path -> full_path 的映射缓存，避免每次绘制都做 os.path.join
+        self._path_cache: Dict[str, str] = {}
+        self.max_entries = max(1, int(max_entries))
+        self.image_cache: "OrderedDict[str, Optional[RawPixels]]" = OrderedDict()
+        # 缓存裁剪后的精灵（LRU）：
+        #   get_sprite_image 的键为 (full_path, x, y, w, h)
+        #   get_sprite_image_with_offset 的键为 (full_path, x, y, w, h, x_off, y_off)
+        self.max_sprites = max(1, int(max_sprites))
+        self.sprite_cache: "OrderedDict[tuple, ImageType]" = OrderedDict()
+        # 后台预取：工作线程只负责磁盘读取与解码，结果由主线程在取用时写入缓存
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[str, "Future[Optional[RawPixels]]"] = {}
+        # 回收池：被淘汰的图集像素按文件签名 (mtime_ns, size) 暂存，
+        # 文件未变化时可直接复用，省去重新分配大块缓冲区和解码的开销
+        self.max_recycled = max(0, int(max_recycled))
+        self._signatures: Dict[str, Tuple[int, int]] = {}
+        self._recycled: "OrderedDict[str, Tuple[Tuple[int, int], RawPixels]]" = OrderedDict()
+        # 已提交转存任务的 WebP 副本路径；首次转存时顺带清理一次超限的旧副本
+        self._converting: set = set()
+        self._webp_pruned = False
+
+    def __enter__(self) -> "ImageManager":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
     def set_base_path(self, path: str):
         """设置用于解析相对路径的基准目录。"""
+        if path == self.base_path:
+            return
         self.base_path = path
+        self._path_cache.clear()
         # 更换基准路径意味着不同资源集，清空裁剪缓存以防串用
-        self.sprite_cache.clear()
+        self._clear_sprite_cache()
 
     def _get_full_path(self, relative_path: str) -> str:
-        """根据基准目录计算图像的完整绝对路径。"""
-        return os.path.join(self.base_path, relative_path)
+        """根据基准目录计算图像的完整绝对路径（按相对路径缓存）。"""
+        full_path = self._path_cache.get(relative_path)
+        if full_path is None:
+            full_path = self._path_cache[relative_path] = os.path.join(self.base_path, relative_path)
+        return full_path
 
     def load_spritesheet(self, relative_path: str) -> Optional[ImageType]:
         """
@@ -44,25 +95,215 @@ class ImageManager:
             relative_path: 相对于基准目录的图像文件路径。
 
         Returns:
-            Pillow 的 Image 对象，如果加载失败则返回 None。
+            由缓存像素重建的 Pillow Image 对象，如果加载失败则返回 None。
         """
         full_path = self._get_full_path(relative_path)
         
         if full_path in self.image_cache:
-            return self.image_cache[full_path]
-        
+            self.image_cache.move_to_end(full_path)
+            return self._image_from_raw(self.image_cache[full_path])
+
+        future = self._pending.pop(full_path, None)
+        if future is not None:
+            # 已在后台预取中：等待其完成，避免重复读取同一文件
+            raw = future.result()
+        else:
+            raw = self._take_recycled(full_path) or self._load_blocking(full_path)
+        return self._image_from_raw(self._store_spritesheet(full_path, raw))
+
+    def file_signature(self, relative_path: str) -> Optional[Tuple[int, int]]:
+        """返回图像文件当前的 (mtime_ns, size)；文件不存在时返回 None。可用于判断派生缓存是否过期。"""
+        return self._file_signature(self._get_full_path(relative_path))
+
+    @staticmethod
+    def _file_signature(full_path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _take_recycled(self, full_path: str) -> Optional[RawPixels]:
+        """从回收池取出与磁盘文件仍一致的像素数据；文件已变化时丢弃。"""
+        entry = self._recycled.pop(full_path, None)
+        if entry is None:
+            return None
+        signature, raw = entry
+        if signature != self._file_signature(full_path):
+            return None
+        return raw
+
+    def _recycle(self, full_path: str, raw: Optional[RawPixels]):
+        """把离开缓存的图集像素放入回收池（超出容量时丢弃最旧的）。"""
+        signature = self._signatures.pop(full_path, None)
+        if raw is None or signature is None or self.max_recycled == 0:
+            return
+        self._recycled[full_path] = (signature, raw)
+        self._recycled.move_to_end(full_path)
+        while len(self._recycled) > self.max_recycled:
+            self._recycled.popitem(last=False)
+
+    @classmethod
+    def _webp_twin_path(cls, full_path: str) -> Optional[str]:
+        """返回 PNG 图集在缓存目录中对应的 WebP 副本路径（按路径与文件签名区分）；不适用时返回 None。"""
+        if not _WEBP_TWINS or not full_path.lower().endswith('.png'):
+            return None
+        signature = cls._file_signature(full_path)
+        if signature is None:
+            return None
+        directory = disk_cache.cache_dir(_WEBP_CACHE_NAME)
+        if directory is None:
+            return None
+        key = disk_cache.content_key(os.path.abspath(full_path), f"{signature[0]}:{signature[1]}")
+        return str(directory / f"{key}.webp")
+
+    @staticmethod
+    def _write_webp_twin(raw: RawPixels, twin_path: str):
+        """把已解码的像素无损编码为 WebP 副本（在工作线程中执行，失败时静默放弃）。"""
+        mode, size, data = raw
+        tmp = f"{twin_path}.{os.getpid()}.tmp"
+        try:
+            # exact=True 保留全透明像素的颜色，保证与原 PNG 逐像素一致
+            Image.frombuffer(mode, size, data, "raw", mode, 0, 1).save(
+                tmp, "WEBP", lossless=True, method=4, exact=True)
+            os.replace(tmp, twin_path)
+        except (OSError, ValueError) as e:
+            print(f"警告：无法写入 WebP 副本 '{twin_path}'. 原因: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def _schedule_webp_twin(self, full_path: str, raw: Optional[RawPixels]):
+        """若 PNG 图集还没有 WebP 副本，则在后台线程中由已解码的像素生成一份。"""
+        if raw is None or raw[0] not in _WEBP_MODES:
+            return
+        twin_path = self._webp_twin_path(full_path)
+        if twin_path is None or twin_path in self._converting or os.path.exists(twin_path):
+            return
+        self._converting.add(twin_path)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=_PREFETCH_WORKERS, thread_name_prefix="spritesheet-prefetch")
+        if not self._webp_pruned:
+            self._webp_pruned = True
+            self._pool.submit(disk_cache.prune, _WEBP_CACHE_NAME, _WEBP_CACHE_MAX_BYTES)
+        self._pool.submit(self._write_webp_twin, raw, twin_path)
+
+    @classmethod
+    def _load_blocking(cls, full_path: str) -> Optional[RawPixels]:
+        """从硬盘读取并完整解码图像，返回原始像素；失败时返回 None。可在工作线程中调用。"""
+        twin_path = cls._webp_twin_path(full_path)
+        if twin_path is not None and os.path.exists(twin_path):
+            raw = cls._decode_file(twin_path)
+            if raw is not None:
+                return raw
+        return cls._decode_file(full_path)
+
+    @staticmethod
+    def _decode_file(full_path: str) -> Optional[RawPixels]:
         try:
             print(f"正在从硬盘加载图像: {full_path}")
-            image = Image.open(full_path)
-            # 立即加载图像数据，以便可以关闭文件句柄
-            image.load() 
-            self.image_cache[full_path] = image
-            return image
-        except (FileNotFoundError, UnidentifiedImageError, IOError) as e:
+            # 通过内存映射交给 Pillow 解码：文件内容按需分页载入，不额外复制一份到堆上
+            with open(full_path, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                    Image.open(mm) as image:
+                image.load()
+                # 调色板图像的 tobytes 只包含索引，需先展开为 RGBA 才能脱离调色板重建
+                if image.mode in ("P", "PA"):
+                    converted = image.convert("RGBA")
+                    raw = (converted.mode, converted.size, converted.tobytes())
+                    converted.close()
+                else:
+                    raw = (image.mode, image.size, image.tobytes())
+        except (FileNotFoundError, UnidentifiedImageError, IOError, ValueError) as e:
+            # ValueError: 空文件无法建立内存映射
             print(f"错误：无法加载图像 '{full_path}'. 原因: {e}")
             # 存入 None 以防止后续重复尝试加载这个不存在或损坏的文件
-            self.image_cache[full_path] = None
+            raw = None
+        return raw
+
+    @staticmethod
+    def _image_from_raw(raw: Optional[RawPixels]) -> Optional[ImageType]:
+        """由缓存的 (mode, size, bytes) 重建 Image；常见模式直接引用缓存字节而不复制。"""
+        if raw is None:
             return None
+        mode, size, data = raw
+        if mode in _ZERO_COPY_MODES:
+            return Image.frombuffer(mode, size, data, "raw", mode, 0, 1)
+        return Image.frombytes(mode, size, data)
+
+    def _store_spritesheet(self, full_path: str, raw: Optional[RawPixels]) -> Optional[RawPixels]:
+        """把加载结果写入图集缓存（仅在主线程调用）。"""
+        # 图集被（重新）加载时，丢弃基于旧图像裁剪出的精灵
+        self._invalidate_sprites(full_path)
+        self.image_cache[full_path] = raw
+        if raw is not None:
+            signature = self._file_signature(full_path)
+            if signature is not None:
+                self._signatures[full_path] = signature
+            self._schedule_webp_twin(full_path, raw)
+        self._evict_spritesheets()
+        return raw
+
+    def prefetch(self, relative_paths: Iterable[str]):
+        """
+        在后台线程中预先加载一批图集，隐藏磁盘读取与解码的延迟。
+
+        已缓存或正在预取的路径会被跳过；之后调用 load_spritesheet 时直接取用结果。
+        """
+        self._collect_prefetched()
+        for relative_path in relative_paths:
+            if not relative_path:
+                continue
+            full_path = self._get_full_path(relative_path)
+            if full_path in self.image_cache or full_path in self._pending:
+                continue
+            recycled = self._take_recycled(full_path)
+            if recycled is not None:
+                self._store_spritesheet(full_path, recycled)
+                continue
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=_PREFETCH_WORKERS, thread_name_prefix="spritesheet-prefetch")
+            self._pending[full_path] = self._pool.submit(self._load_blocking, full_path)
+
+    def _collect_prefetched(self):
+        """把已完成的预取结果移入缓存，避免其长期滞留在待处理列表中。"""
+        done = [path for path, future in self._pending.items() if future.done()]
+        for full_path in done:
+            future = self._pending.pop(full_path)
+            if full_path not in self.image_cache:
+                self._store_spritesheet(full_path, future.result())
+
+    def _evict_spritesheets(self):
+        """淘汰最久未使用的图集，直到缓存条目数不超过上限。"""
+        while len(self.image_cache) > self.max_entries:
+            self._recycle(*self.image_cache.popitem(last=False))
+
+    def _get_cached_sprite(self, key: tuple) -> Optional[ImageType]:
+        """查询裁剪缓存，命中时将其标记为最近使用。"""
+        sprite = self.sprite_cache.get(key)
+        if sprite is not None:
+            self.sprite_cache.move_to_end(key)
+        return sprite
+
+    def _cache_sprite(self, key: tuple, sprite: ImageType):
+        """写入裁剪缓存，超出上限时关闭并淘汰最久未使用的精灵。"""
+        self.sprite_cache[key] = sprite
+        self.sprite_cache.move_to_end(key)
+        while len(self.sprite_cache) > self.max_sprites:
+            _, old = self.sprite_cache.popitem(last=False)
+            old.close()
+
+    def _invalidate_sprites(self, full_path: str):
+        """移除某个图集对应的全部裁剪缓存。"""
+        stale = [key for key in self.sprite_cache if key[0] == full_path]
+        for key in stale:
+            self.sprite_cache.pop(key).close()
+
+    def _clear_sprite_cache(self):
+        for sprite in self.sprite_cache.values():
+            sprite.close()
+        self.sprite_cache.clear()
 
     def get_sprite_image(self, relative_path: str, rect: Dict[str, int]) -> Optional[ImageType]:
         """
@@ -75,6 +316,12 @@ class ImageManager:
         Returns:
             裁剪后的 Pillow Image 对象，如果失败则返回 None。
         """
+        full_path = self._get_full_path(relative_path)
+        key = (full_path, rect['x'], rect['y'], rect['w'], rect['h'])
+        cached = self._get_cached_sprite(key)
+        if cached is not None:
+            return cached
+
         spritesheet = self.load_spritesheet(relative_path)
         if not spritesheet:
             return None
@@ -89,6 +336,9 @@ class ImageManager:
         
         try:
             sprite = spritesheet.crop(box)
+            # 立即物化像素数据，保证缓存的是独立于图集的副本
+            sprite.load()
+            self._cache_sprite(key, sprite)
             return sprite
         except Exception as e:
             print(f"错误：裁剪精灵时出错。路径: {relative_path}, 区域: {box}. 原因: {e}")
@@ -120,24 +370,54 @@ class ImageManager:
             应用偏移并裁剪后的 Pillow Image；若裁剪区域超出或无效则返回 None。
         """
         full_path = self._get_full_path(relative_path)
-        # 先检查缓存（使用原始 rect 与偏移作为键）
+        key = self._offset_sprite_key(full_path, rect, x_offset, y_offset)
+        if key is not None:
+            cached = self._get_cached_sprite(key)
+            if cached is not None:
+                return cached
+
+        spritesheet = self.load_spritesheet(relative_path)
+        if not spritesheet:
+            return None
+        return self._crop_with_offset(spritesheet, key, relative_path, rect, x_offset, y_offset)
+
+    @staticmethod
+    def _offset_sprite_key(full_path: str, rect: Dict[str, int], x_offset, y_offset) -> Optional[tuple]:
+        """构造偏移裁剪的缓存键（使用原始 rect 与偏移）；rect 非法时返回 None 以放弃缓存。"""
         try:
-            key = (
+            return (
                 full_path,
                 int(rect.get('x', 0)), int(rect.get('y', 0)), int(rect.get('w', 0)), int(rect.get('h', 0)),
                 int(x_offset or 0), int(y_offset or 0)
             )
         except Exception:
-            # rect 非法时直接放弃缓存使用
-            key = None
-
-        if key is not None and key in self.sprite_cache:
-            return self.sprite_cache[key]
-
-        spritesheet = self.load_spritesheet(relative_path)
-        if not spritesheet:
             return None
 
+    def _crop_with_offset(
+        self,
+        spritesheet: ImageType,
+        key: Optional[tuple],
+        relative_path: str,
+        rect: Dict[str, int],
+        x_offset: int,
+        y_offset: int,
+    ) -> Optional[ImageType]:
+        """在已加载的图集上执行偏移裁剪，并把结果写入缓存。"""
+        sprite = self._try_crop_offset(spritesheet, relative_path, rect, x_offset, y_offset)
+        # 缓存结果
+        if sprite is not None and key is not None:
+            self._cache_sprite(key, sprite)
+        return sprite
+
+    @staticmethod
+    def _try_crop_offset(
+        spritesheet: ImageType,
+        relative_path: str,
+        rect: Dict[str, int],
+        x_offset: int,
+        y_offset: int,
+    ) -> Optional[ImageType]:
+        """偏移裁剪的纯计算部分：不访问任何缓存，可在工作线程中调用。出错或区域无效时返回 None。"""
         try:
             sheet_w, sheet_h = spritesheet.size
 
@@ -175,19 +455,33 @@ class ImageManager:
             sprite = spritesheet.crop(box)
             if sprite.mode != "RGBA":
                 sprite = sprite.convert("RGBA")
-            # 缓存结果
-            if key is not None:
-                self.sprite_cache[key] = sprite
             return sprite
         except Exception as e:
             print(f"错误：偏移裁剪时出错。路径: {relative_path}, rect: {rect}, offset: ({x_offset},{y_offset}). 原因: {e}")
             return None
 
     def clear_cache(self):
-        """清空所有已缓存的图像，用于在关闭或切换项目时释放内存。"""
+        """
+        清空所有已缓存的图像，用于在切换项目时释放内存。
+        最近使用的图集像素会进入回收池，若随后重新打开未变化的同一文件，可直接复用。
+        """
         print("正在清空图像缓存...")
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        for full_path, raw in self.image_cache.items():
+            self._recycle(full_path, raw)
         self.image_cache.clear()
-        self.sprite_cache.clear()
+        self._signatures.clear()
+        self._clear_sprite_cache()
+
+    def close(self):
+        """彻底释放全部缓存（包括回收池）并关闭预取线程池。"""
+        self.clear_cache()
+        self._recycled.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
 
 # --- 使用示例和测试 ---
 if __name__ == '__main__':
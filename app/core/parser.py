@@ -1,114 +1,203 @@
 # app/core/parser.py
 
 import re
-from typing import Dict, Any
+from collections import OrderedDict
+from bisect import bisect_left
+from operator import itemgetter
+from typing import Dict, Any, Callable, Iterator, List, NamedTuple, Optional, Tuple, TypeVar, Union
+
+# --- 预编译的正则表达式（模块级常量，避免每次解析时重复编译） ---
+_SCRIPT_RE = re.compile(r'script\s+(\w+)\s*{')
+_ENTRY_HEADER_RE = re.compile(r'entry\s+(\w+)\s*{')
+_BRACE_RE = re.compile(r'[{}]')
+_NEWLINE_RE = re.compile(r'\n')
+# entry 内容中的字段：图像路径、可选的宽高 / 偏移数值（允许负号，兼容下划线命名）以及 sprites 块的起点。
+# 一次线性扫描即可取得全部字段，而不必对每个字段分别搜索整段内容。
+_FIELDS_RE = re.compile(
+    r'name:\s*"(?P<name>[^"]+)"'
+    r'|(?P<key>width|height|xOffset|yOffset|x_offset|y_offset):\s*(?P<val>-?\d+)'
+    r'|sprites:\s*{'
+)
+# 匹配单个 sprite 定义
+_SPRITE_RE = re.compile(r'(\w+):\s*{\s*x:\s*(\d+),\s*y:\s*(\d+),\s*w:\s*(\d+),\s*h:\s*(\d+)\s*}')
+# 匹配 sprite 定义的起始位置（用于定位行号）
+_SPRITE_HEAD_RE = re.compile(r'(\w+):\s*{')
+
+class SpriteRect(NamedTuple):
+    """
+    单个精灵的裁剪区域。
+
+    使用不可变元组代替 {'x':..,'y':..,'w':..,'h':..} 字典，每个精灵不再携带独立的哈希表；
+    同时保留 rect['x'] / rect.get('x') 的字典式访问，兼容现有调用方。
+    """
+    x: int
+    y: int
+    w: int
+    h: int
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default) if key in self._fields else default
+
+# 解析结果的类型：entry 数据仍是字典（含 'line' / 'sprites' / 'image_path' / 数值字段），
+# 保持具体的容器类型，便于静态检查以及 mypyc 等 AOT 编译器生成专门化代码
+EntryData = Dict[str, Any]
+# 'blocks_by_line' 中的一项：(类型 'entry' / 'script', 名称, 行号)
+Block = Tuple[str, str, int]
+ParsedData = Dict[str, Union[Dict[str, EntryData], List[Block]]]
+_T = TypeVar('_T')
+
+def _iter_entry_bodies(text: str) -> Iterator[Tuple[str, str, int]]:
+    """
+    单遍扫描文本，依次产出每个 entry 的 (entry_name, body, start_offset)。
+
+    先线性定位所有 entry 头，再在“当前头 ~ 下一个头”的窗口内统计花括号深度，
+    找到与头部 '{' 配对的 '}'。若窗口内括号不平衡（例如正在编辑中），
+    则回退为截取到窗口内最后一个 '}'，与旧的贪婪匹配行为保持一致。
+    """
+    headers = list(_ENTRY_HEADER_RE.finditer(text))
+    for i, header in enumerate(headers):
+        window_end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        body_start = header.end()
+        body_end = _find_block_end(text, body_start, window_end)
+        if body_end == -1:
+            continue
+        yield header.group(1), text[body_start:body_end], header.start()
+
+def _find_block_end(text: str, start: int, end: int) -> int:
+    """
+    在 text[start:end] 内查找与 start 之前的 '{' 配对的 '}'，返回其偏移。
+    括号不平衡（例如正在编辑中）时回退为范围内最后一个 '}'；仍找不到则返回 -1。
+    """
+    depth = 1
+    for brace in _BRACE_RE.finditer(text, start, end):
+        if brace.group() == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return brace.start()
+    return text.rfind('}', start, end)
+
+def _make_line_lookup(text: str) -> Callable[[int], int]:
+    """
+    预先计算所有换行符的偏移量，返回一个把字符偏移转换为 1 起始行号的函数。
+    每次查询为 O(log n)，替代每次调用 text.count 统计换行符的 O(n) 扫描。
+    """
+    newline_positions = [m.start() for m in _NEWLINE_RE.finditer(text)]
+    def line_of(pos: int) -> int:
+        return bisect_left(newline_positions, pos) + 1
+    return line_of
 
 class ScriptParser:
     """
     一个健壮的 ANM 脚本解析器。
-    使用分割策略配合贪婪匹配，确保完整捕获包含嵌套括号的块。
+    通过花括号配对单遍定位每个 entry 的内容，确保完整捕获包含嵌套括号的块。
     """
-    def parse(self, text: str) -> Dict[str, Any]:
-        parsed_data = {"entries": {}, "scripts": {}}
+    def __init__(self, cache_size: int = 4):
+        # 以文本为键的小型 LRU：编辑器频繁刷新时，未变化的文本直接复用上次的结果。
+        # str 的哈希值在首次计算后会被缓存，命中判断只需一次哈希比较加一次内容比较。
+        self._cache_max = max(1, int(cache_size))
+        self._parse_cache: "OrderedDict[str, ParsedData]" = OrderedDict()
+        self._locations_cache: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+
+    def _cache_get(self, cache: "OrderedDict[str, _T]", text: str) -> Optional[_T]:
+        hit = cache.get(text)
+        if hit is not None:
+            cache.move_to_end(text)
+        return hit
+
+    def _cache_put(self, cache: "OrderedDict[str, _T]", text: str, result: _T) -> None:
+        cache[text] = result
+        while len(cache) > self._cache_max:
+            cache.popitem(last=False)
+
+    def parse(self, text: str) -> ParsedData:
+        """解析 ANM 脚本文本；返回的结果会被缓存复用，调用方不应修改它。"""
+        cached = self._cache_get(self._parse_cache, text)
+        if cached is not None:
+            return cached
+
+        entries: Dict[str, EntryData] = {}
+        scripts: Dict[str, EntryData] = {}
+        parsed_data: ParsedData = {"entries": entries, "scripts": scripts}
+        line_of = _make_line_lookup(text)
 
         # --- 解析 Scripts ---
-        script_pattern = re.compile(r'script\s+(\w+)\s*{')
-        for match in script_pattern.finditer(text):
-            script_name = match.group(1)
-            line_num = text.count('\n', 0, match.start()) + 1
-            parsed_data["scripts"][script_name] = {'line': line_num}
-
-        # --- 使用分割策略来独立解析每个 Entry ---
-        entry_sections = re.split(r'(?=entry\s+\w+\s*{)', text)
-
-        for section in entry_sections:
-            section = section.strip()
-            if not section.startswith('entry'):
-                continue
+        for match in _SCRIPT_RE.finditer(text):
+            script_name: str = match.group(1)
+            scripts[script_name] = {'line': line_of(match.start())}
+
+        # --- 单遍扫描，独立解析每个 Entry ---
+        for entry_name, entry_content, start_pos in _iter_entry_bodies(text):
+            sprites: Dict[str, SpriteRect] = {}
+            entry_data: EntryData = {'line': line_of(start_pos), 'sprites': sprites}
             
-            # 对每个独立的 entry section 进行贪婪匹配 `((.|\n)*)`
-            entry_match = re.match(r'entry\s+(\w+)\s*{((.|\n)*)}', section)
-            if not entry_match:
-                continue
+            # 单遍扫描 image_path、数值字段和 sprites 块；同名字段以首次出现为准
+            pos: int = 0
+            sprites_seen: bool = False
+            while True:
+                m = _FIELDS_RE.search(entry_content, pos)
+                if not m:
+                    break
+                pos = m.end()
+                if m.group('name') is not None:
+                    entry_data.setdefault('image_path', m.group('name'))
+                elif m.group('key') is not None:
+                    entry_data.setdefault(m.group('key'), int(m.group('val')))
+                elif not sprites_seen:
+                    # sprites 块：只对配对花括号内的片段匹配精灵定义，然后跳过整个块
+                    sprites_seen = True
+                    block_end = _find_block_end(entry_content, pos, len(entry_content))
+                    if block_end == -1:
+                        continue
+                    for sprite_match in _SPRITE_RE.finditer(entry_content, pos, block_end):
+                        sprites[sprite_match.group(1)] = SpriteRect._make(
+                            map(int, sprite_match.group(2, 3, 4, 5)))
+                    pos = block_end + 1
 
-            entry_name = entry_match.group(1)
-            entry_content = entry_match.group(2)
+            entries[entry_name] = entry_data
 
-            try:
-                start_pos = text.find(section)
-                line_num = text.count('\n', 0, start_pos) + 1
-            except:
-                line_num = -1
+        # 全部 entry / script 按行号排好序，供快速跳转等视图直接使用（随解析结果一起缓存）
+        blocks: List[Block] = [("entry", name, data['line']) for name, data in entries.items()]
+        blocks.extend(("script", name, data['line']) for name, data in scripts.items())
+        blocks.sort(key=itemgetter(2))
+        parsed_data["blocks_by_line"] = blocks
 
-            entry_data = {'line': line_num, 'sprites': {}}
-            
-            # 提取 image_path
-            name_match = re.search(r'name:\s*"([^"]+)"', entry_content)
-            if name_match:
-                entry_data['image_path'] = name_match.group(1)
-
-            # 提取可选的宽高 / 偏移 / 其他数值字段（允许负号）
-            int_field_patterns = {
-                'width': r'width:\s*(-?\d+)',
-                'height': r'height:\s*(-?\d+)',
-                'xOffset': r'xOffset:\s*(-?\d+)',
-                'yOffset': r'yOffset:\s*(-?\d+)',
-                # 兼容下划线命名（若脚本使用不同风格）
-                'x_offset': r'x_offset:\s*(-?\d+)',
-                'y_offset': r'y_offset:\s*(-?\d+)',
-            }
-            for key, pattern in int_field_patterns.items():
-                m = re.search(pattern, entry_content)
-                if m:
-                    try:
-                        entry_data[key] = int(m.group(1))
-                    except ValueError:
-                        pass
-
-            # 提取 sprites 块
-            sprites_block_match = re.search(r'sprites:\s*{((.|\n)*)}', entry_content)
-            if sprites_block_match:
-                sprites_content = sprites_block_match.group(1)
-                # 这个 pattern 匹配单个 sprite 定义
-                sprite_pattern = re.compile(r'(\w+):\s*{\s*x:\s*(\d+),\s*y:\s*(\d+),\s*w:\s*(\d+),\s*h:\s*(\d+)\s*}')
-                for sprite_match in sprite_pattern.finditer(sprites_content):
-                    sprite_name = sprite_match.group(1)
-                    entry_data['sprites'][sprite_name] = {
-                        'x': int(sprite_match.group(2)), 'y': int(sprite_match.group(3)),
-                        'w': int(sprite_match.group(4)), 'h': int(sprite_match.group(5)),
-                    }
-            
-            parsed_data["entries"][entry_name] = entry_data
-            
+        self._cache_put(self._parse_cache, text, parsed_data)
         return parsed_data
 
     def get_all_sprite_locations(self, text: str) -> Dict[str, int]:
         """
-        使用健壮的分割策略来解析文本，以查找每个 sprite 定义的行号。
+        以每个 entry 头的起始偏移切分文本，查找每个 sprite 定义的行号。
         """
-        locations = {}
-        entry_sections = re.split(r'(?=entry\s+\w+\s*{)', text)
-        entry_name_pattern = re.compile(r'entry\s+(\w+)')
-        sprite_pattern = re.compile(r'(\w+):\s*{')
+        cached = self._cache_get(self._locations_cache, text)
+        if cached is not None:
+            return cached
 
-        for section in entry_sections:
-            section = section.strip()
-            if not section.startswith('entry'): continue
+        locations: Dict[str, int] = {}
+        line_of = _make_line_lookup(text)
+        headers = list(_ENTRY_HEADER_RE.finditer(text))
 
-            entry_match = entry_name_pattern.match(section)
-            if not entry_match: continue
-            entry_name = entry_match.group(1)
+        for i, header in enumerate(headers):
+            entry_name = header.group(1)
+            section_start = header.start()
+            section_end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
 
-            section_offset = text.find(section)
-            if section_offset == -1: continue
-            
-            for sprite_match in sprite_pattern.finditer(section):
+            for sprite_match in _SPRITE_HEAD_RE.finditer(text, section_start, section_end):
                 sprite_name = sprite_match.group(1)
                 if sprite_name == 'sprites': continue
 
-                absolute_sprite_pos = section_offset + sprite_match.start()
-                line_number = text.count('\n', 0, absolute_sprite_pos) + 1
+                line_number = line_of(sprite_match.start())
                 full_sprite_name = f"{entry_name}/{sprite_name}"
                 locations[full_sprite_name] = line_number
-                
+
+        self._cache_put(self._locations_cache, text, locations)
         return locations
\ No newline at end of file
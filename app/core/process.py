@@ -0,0 +1,17 @@
+# app/core/process.py
+
+import subprocess
+from typing import List, Tuple
+
+# Windows 下启动控制台程序时不弹出黑色控制台窗口；其他平台为 0
+CREATE_NO_WINDOW = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+
+def run_subprocess(command: List[str]) -> Tuple[bytes, bytes, int]:
+    """
+    运行外部工具并等待其结束，返回 (stdout, stderr, 退出码)。
+
+    输出以原始字节返回，由调用方决定何时解码；找不到可执行文件时抛出 FileNotFoundError。
+    """
+    result = subprocess.run(command, capture_output=True, check=False, creationflags=CREATE_NO_WINDOW)
+    return result.stdout, result.stderr, result.returncode
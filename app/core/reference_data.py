@@ -0,0 +1,137 @@
+# app/core/reference_data.py
+
+import functools
+import json
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from . import disk_cache
+
+try:  # orjson 为可选依赖，存在时解析更快
+    import orjson
+except ImportError:
+    orjson = None
+
+# 指令参考表：{指令ID: [签名, 描述]}
+ReferenceTable = Dict[str, List[str]]
+
+# 参考表 pickle 缓存在用户缓存目录中的子目录名
+_REFERENCE_CACHE_NAME = 'reference'
+# load_derived 结果在用户缓存目录中的子目录名
+_DERIVED_CACHE_NAME = 'docs'
+# 以上两个缓存子目录各自的容量上限；每次运行首次写入时清理超出部分
+_PICKLE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+class ReferenceTables(NamedTuple):
+    """参考文件及由其预先派生的查找表，翻译时每行只需一次字典查找。"""
+    forward: ReferenceTable        # 原始表 {指令ID: [签名, 描述]}
+    name_by_id: Dict[str, str]     # {指令ID: 指令名}（签名中 '(' 之前的部分）
+    desc_by_id: Dict[str, str]     # {指令ID: 描述}
+    id_by_name: Dict[str, str]     # {指令名: 指令ID}
+
+
+def read_json(path):
+    """读取 JSON 文件；安装了 orjson 时用它解析。解析失败抛出 json.JSONDecodeError（orjson 的异常是其子类）。"""
+    raw = Path(path).read_bytes()
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _build_tables(forward: ReferenceTable) -> ReferenceTables:
+    name_by_id = {k: v[0].split('(')[0] for k, v in forward.items()}
+    desc_by_id = {k: v[1] for k, v in forward.items() if len(v) > 1}
+    id_by_name = {name: k for k, name in name_by_id.items()}
+    return ReferenceTables(forward, name_by_id, desc_by_id, id_by_name)
+
+
+def load_reference(path) -> ReferenceTables:
+    """
+    加载 thmsg_ref.json / thstd_ref.json 这类指令参考文件，返回原始表及派生的查找表。
+
+    结果在进程内按 (路径, mtime, 大小) 缓存，文件被修改后会自动重新加载；
+    跨进程则在用户缓存目录中保存 pickle，文件未变化时下次启动直接反序列化。
+    返回的字典在多个调用方之间共享，调用方不应修改它们。
+    """
+    path = Path(path)
+    st = path.stat()
+    return _load_reference_cached(str(path.absolute()), st.st_mtime_ns, st.st_size)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_reference_cached(path_str: str, mtime_ns: int, size: int) -> ReferenceTables:
+    cache_file = _cache_file(_REFERENCE_CACHE_NAME, path_str, str(mtime_ns), str(size))
+    tables = _read_pickle(cache_file)
+    if tables is not None:
+        try:
+            return ReferenceTables(*tables)
+        except TypeError:
+            pass
+
+    tables = _build_tables(read_json(path_str))
+    _write_pickle(cache_file, tuple(tables))
+    return tables
+
+
+def load_derived(path, builder: Callable[[Any], Any]) -> Any:
+    """
+    读取 JSON 文件并交给 builder（模块级函数）转换，例如把指令参考表整理为帮助文档字典。
+
+    结果按 (路径, mtime, 大小, builder) 缓存：进程内使用 LRU，跨进程则在用户缓存目录中保存 pickle，
+    文件未变化时下次启动无需重新解析。返回值在调用方之间共享，调用方不应修改它。
+    """
+    path = Path(path)
+    st = path.stat()
+    return _load_derived_cached(str(path.absolute()), st.st_mtime_ns, st.st_size, builder)
+
+
+@functools.lru_cache(maxsize=16)
+def _load_derived_cached(path_str: str, mtime_ns: int, size: int, builder: Callable[[Any], Any]) -> Any:
+    cache_file = _cache_file(_DERIVED_CACHE_NAME, path_str, str(mtime_ns), str(size),
+                             builder.__module__, builder.__qualname__)
+    result = _read_pickle(cache_file)
+    if result is not None:
+        return result
+
+    result = builder(read_json(path_str))
+    _write_pickle(cache_file, result)
+    return result
+
+
+def _cache_file(name: str, *key_parts: str) -> Optional[Path]:
+    """返回用户缓存目录中与 key_parts 对应的 pickle 文件路径；缓存目录不可用时返回 None。"""
+    directory = disk_cache.cache_dir(name)
+    if directory is None:
+        return None
+    return directory / f"{disk_cache.content_key(*key_parts)}.pkl"
+
+
+def _read_pickle(cache_file: Optional[Path]) -> Any:
+    """读取 pickle 缓存；文件不存在或已损坏时返回 None。"""
+    if cache_file is None:
+        return None
+    try:
+        obj = pickle.loads(cache_file.read_bytes())
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError):
+        return None
+    disk_cache.touch(cache_file)
+    return obj
+
+
+def _write_pickle(cache_file: Optional[Path], obj: Any) -> None:
+    """先写临时文件再原子替换，避免并发启动时读到写了一半的缓存；写入失败时仅使用内存缓存。"""
+    if cache_file is None:
+        return
+    # 临时文件名同时包含进程号与线程号：后台预热与主线程可能同时写同一个缓存文件
+    tmp = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_bytes(pickle.dumps(obj, protocol=5))
+        os.replace(tmp, cache_file)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+    disk_cache.prune_once(cache_file.parent.name, _PICKLE_CACHE_MAX_BYTES)
@@ -3,9 +3,13 @@
 import json
 import os
 import sys
+from functools import cached_property
 from pathlib import Path
 from typing import Dict, Any, Optional
 
+# 设置环境变量 THTK_STUDIO_DEBUG 后输出内置资源的查找日志
+_DEBUG = bool(os.environ.get("THTK_STUDIO_DEBUG"))
+
 class Settings:
     """
     一个健壮的设置管理类，用于加载和保存应用配置。
@@ -47,28 +51,10 @@ class Settings:
             "ui_minimap_enabled": True,
             "ui_minimap_width": 64,
         }
+        # get_*_path 的解析结果缓存（键为 user_* 设置键）
+        self._resolved: Dict[str, str] = {}
         
-        # --- 定位并缓存所有内置资源的路径 ---
-        self._internal_thanm_path = self._find_resource("thanm.exe")
-        self._internal_anmm_path = self._find_resource("default.anmm")
-        self._internal_thmsg_path = self._find_resource("thmsg.exe")
-        self._internal_msg_ref_path = self._find_resource("thmsg_ref.json")
-        self._internal_thstd_path = self._find_resource("thstd.exe")
-        self._internal_std_ref_path = self._find_resource("thstd_ref.json")
-        # [NEW] 可选的 thecl / eclmap 内置路径（若打包时提供）
-        self._internal_thecl_path = self._find_resource("thecl.exe")
-        # eclmap 文件名不固定，尝试常见命名；均未找到则为 None
-        self._internal_eclmap_path = (
-            self._find_resource("default.eclm") or
-            self._find_resource("eclmap_th12.txt") or
-            None
-        )
-        self._internal_ecl_ref_path = self._find_resource("thecl_ref.json")
-        self._internal_instructions_path = self._find_resource("instructions.json")
-        self._internal_variables_path = self._find_resource("variables.json")
-        self._internal_anm_syntax_path = self._find_resource("anm_syntax_definitions.json") # 查找内置的 ANM 语法文件
-        # msg_syntax_path 似乎没有默认的内置文件，所以我们不在这里查找它
-    
+        # 内置资源路径在首次使用时才查找并缓存（见下方 _internal_* 属性）
 
         # --- 2. 加载用户保存在文件中的设置 ---
         self.load()
@@ -91,11 +77,69 @@ class Settings:
         res_path = self._get_base_path() / "resources" / name
         # print(res_path)
         if res_path.is_file():
-            print(f"✅ 找到内置资源: {res_path}")
+            if _DEBUG:
+                print(f"✅ 找到内置资源: {res_path}")
             return res_path
-        print(f"ℹ️ 未找到内置资源: {name}")
+        if _DEBUG:
+            print(f"ℹ️ 未找到内置资源: {name}")
         return None
 
+    # --- 内置资源路径（首次访问时查找并缓存） ---
+    @cached_property
+    def _internal_thanm_path(self) -> Optional[Path]:
+        return self._find_resource("thanm.exe")
+
+    @cached_property
+    def _internal_anmm_path(self) -> Optional[Path]:
+        return self._find_resource("default.anmm")
+
+    @cached_property
+    def _internal_thmsg_path(self) -> Optional[Path]:
+        return self._find_resource("thmsg.exe")
+
+    @cached_property
+    def _internal_msg_ref_path(self) -> Optional[Path]:
+        return self._find_resource("thmsg_ref.json")
+
+    @cached_property
+    def _internal_thstd_path(self) -> Optional[Path]:
+        return self._find_resource("thstd.exe")
+
+    @cached_property
+    def _internal_std_ref_path(self) -> Optional[Path]:
+        return self._find_resource("thstd_ref.json")
+
+    @cached_property
+    def _internal_thecl_path(self) -> Optional[Path]:
+        # 可选的 thecl 内置路径（若打包时提供）
+        return self._find_resource("thecl.exe")
+
+    @cached_property
+    def _internal_eclmap_path(self) -> Optional[Path]:
+        # eclmap 文件名不固定，尝试常见命名；均未找到则为 None
+        return (
+            self._find_resource("default.eclm") or
+            self._find_resource("eclmap_th12.txt") or
+            None
+        )
+
+    @cached_property
+    def _internal_ecl_ref_path(self) -> Optional[Path]:
+        return self._find_resource("thecl_ref.json")
+
+    @cached_property
+    def _internal_instructions_path(self) -> Optional[Path]:
+        return self._find_resource("instructions.json")
+
+    @cached_property
+    def _internal_variables_path(self) -> Optional[Path]:
+        return self._find_resource("variables.json")
+
+    @cached_property
+    def _internal_anm_syntax_path(self) -> Optional[Path]:
+        # 内置的 ANM 语法文件；msg_syntax_path 没有默认的内置文件
+        return self._find_resource("anm_syntax_definitions.json")
+
     def load(self):
         """从 JSON 文件加载用户设置。"""
         if self.filepath.is_file():
@@ -105,6 +149,7 @@ class Settings:
                     for key in self.data:
                         if key in user_data:
                             self.data[key] = user_data[key]
+                self._resolved.clear()
             except (json.JSONDecodeError, IOError) as e:
                 print(f"警告: 无法加载设置文件 '{self.filepath}'。错误: {e}")
 
@@ -116,123 +161,79 @@ class Settings:
         except IOError as e:
             print(f"错误: 无法写入设置文件 '{self.filepath}'。错误: {e}")
 
+    def _resolve(self, user_key: str, internal_attr: Optional[str] = None) -> str:
+        """
+        解析最终要使用的路径：用户设置的文件存在时优先，否则回退到内置资源。
+        结果按 user_key 缓存，避免每次调用都触发文件系统 stat；用户路径变化时失效。
+        解析失败（空字符串）不缓存，之后放入的文件下次调用即可被找到。
+        """
+        resolved = self._resolved.get(user_key)
+        if resolved:
+            return resolved
+        user_path = Path(self.data.get(user_key, ""))
+        if user_path.is_file():
+            resolved = str(user_path)
+        else:
+            internal_path = getattr(self, internal_attr, None) if internal_attr else None
+            resolved = str(internal_path) if internal_path else ""
+        if resolved:
+            self._resolved[user_key] = resolved
+        return resolved
+
     # ==================================================================
     # 公共接口 (Public API)
     # ==================================================================
 
     def get_thanm_path(self) -> str:
         """获取最终要使用的 thanm.exe 路径。"""
-        user_path = Path(self.data.get("user_thanm_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if self._internal_thanm_path:
-            return str(self._internal_thanm_path)
-        return ""
+        return self._resolve("user_thanm_path", "_internal_thanm_path")
     
     def get_anmm_path(self) -> str:
         """获取最终要使用的 .anmm 文件的路径。"""
-        user_path = Path(self.data.get("user_anmm_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if self._internal_anmm_path:
-            return str(self._internal_anmm_path)
-        return ""
+        return self._resolve("user_anmm_path", "_internal_anmm_path")
 
     def get_thmsg_path(self) -> str:
         """获取 thmsg.exe 的路径，优先用户设置。"""
-        user_path = Path(self.data.get("user_thmsg_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if self._internal_thmsg_path:
-            return str(self._internal_thmsg_path)
-        return ""
+        return self._resolve("user_thmsg_path", "_internal_thmsg_path")
 
     def get_msg_ref_path(self) -> str:
         """获取 thmsg_ref.json 的路径，优先用户设置。"""
-        user_path = Path(self.data.get("user_msg_ref_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if self._internal_msg_ref_path:
-            return str(self._internal_msg_ref_path)
-        return ""
+        return self._resolve("user_msg_ref_path", "_internal_msg_ref_path")
 
     def get_thstd_path(self) -> str:
         """获取 thstd.exe 的路径，优先用户设置。"""
-        user_path = Path(self.data.get("user_thstd_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if self._internal_thstd_path:
-            return str(self._internal_thstd_path)
-        return ""
+        return self._resolve("user_thstd_path", "_internal_thstd_path")
 
     def get_std_ref_path(self) -> str:
         """获取 thstd_ref.json 的路径，优先用户设置。"""
-        user_path = Path(self.data.get("user_std_ref_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if self._internal_std_ref_path:
-            return str(self._internal_std_ref_path)
-        return ""
+        return self._resolve("user_std_ref_path", "_internal_std_ref_path")
 
     # [NEW] ECL 相关路径
     def get_thecl_path(self) -> str:
         """获取 thecl.exe 的路径，优先用户设置。"""
-        user_path = Path(self.data.get("user_thecl_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if getattr(self, "_internal_thecl_path", None):
-            return str(self._internal_thecl_path)
-        return ""
+        return self._resolve("user_thecl_path", "_internal_thecl_path")
 
     def get_eclmap_path(self) -> str:
         """获取 eclmap 文件的路径（可选），优先用户设置。"""
-        user_path = Path(self.data.get("user_eclmap_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if getattr(self, "_internal_eclmap_path", None):
-            return str(self._internal_eclmap_path)
-        return ""
+        return self._resolve("user_eclmap_path", "_internal_eclmap_path")
     def get_ecl_ref_path(self) -> str:
         """获取 thecl_ref.json 的路径，优先用户设置。"""
-        user_path = Path(self.data.get("user_ecl_ref_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if self._internal_ecl_ref_path:
-            return str(self._internal_ecl_ref_path)
-        return ""
+        return self._resolve("user_ecl_ref_path", "_internal_ecl_ref_path")
     def get_anm_syntax_path(self) -> str:
         """获取 ANM 语法定义文件 (syntax_definitions.json) 的路径，优先用户设置。"""
-        user_path = Path(self.data.get("user_anm_syntax_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if self._internal_anm_syntax_path:
-            return str(self._internal_anm_syntax_path)
-        return ""
+        return self._resolve("user_anm_syntax_path", "_internal_anm_syntax_path")
 
     def get_instructions_path(self) -> str:
         """获取 instructions.json 的路径，优先用户设置。"""
-        user_path = Path(self.data.get("user_instructions_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if self._internal_instructions_path:
-            return str(self._internal_instructions_path)
-        return ""
+        return self._resolve("user_instructions_path", "_internal_instructions_path")
 
     def get_variables_path(self) -> str:
         """获取 variables.json 的路径，优先用户设置。"""
-        user_path = Path(self.data.get("user_variables_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        if self._internal_variables_path:
-            return str(self._internal_variables_path)
-        return ""
+        return self._resolve("user_variables_path", "_internal_variables_path")
 
     def get_msg_syntax_path(self) -> str:
         """获取用户自定义的 msg_syntax.json 路径。"""
-        user_path = Path(self.data.get("user_msg_syntax_path", ""))
-        if user_path.is_file():
-            return str(user_path)
-        return ""
+        return self._resolve("user_msg_syntax_path")
         
     def set_user_path(self, key: str, value: str):
         """
@@ -243,6 +244,8 @@ class Settings:
             value: 文件的路径字符串。
         """
         if key in self.data:
+            if self.data[key] != value:
+                self._resolved.pop(key, None)
             self.data[key] = value
             self.save()
         else:
@@ -3,55 +3,76 @@ import subprocess
 import os
 from typing import List, Optional
 
+from .process import CREATE_NO_WINDOW
+
+def _decode(data: bytes) -> str:
+    return data.decode('utf-8', errors='replace') if data else ""
+
 class ThanmError(Exception):
     def __init__(self, message, stderr):
         super().__init__(message)
         self.stderr = stderr
 
 class ThanmWrapper:
-    def __init__(self, thanm_path: str, anmm_path: Optional[str] = None):
+    def __init__(self, thanm_path: str, anmm_path: Optional[str] = None, verbose: bool = False):
         if not os.path.isfile(thanm_path) or not os.access(thanm_path, os.X_OK):
             raise FileNotFoundError(f"指定的 thanm 路径 '{thanm_path}' 不存在。")
         self.thanm_path = thanm_path
+        self._base_argv = [thanm_path]
         self.anmm_path = anmm_path
+        # 为 True 时打印执行的命令与输出（批量处理时控制台输出本身开销不小）
+        self.verbose = verbose
         if self.anmm_path and not os.path.isfile(self.anmm_path):
             print(f"警告: 指定的 anmm 映射文件 '{self.anmm_path}' 不存在。")
             self.anmm_path = None
         # 简化版：移除了 ref 和 map path 的自动加载，使其更通用
 
     def _run_command(self, args: List[str], working_dir: Optional[str] = None) -> str:
-        command = [self.thanm_path] + args
-        print(f"🚀 正在执行命令: {' '.join(command)}")
-        if working_dir: print(f"   (在目录下: {working_dir})")
         try:
-            result = subprocess.run(
-                command, capture_output=True, text=True, encoding='utf-8', 
-                check=False, cwd=working_dir
-            )
-            if result is None:
-                raise ThanmError("Thanm 编译错误。", "")
-            if result.returncode != 0:
-                raise ThanmError(
-                    f"Thanm 命令执行失败 (退出码 {result.returncode})",
-                    result.stderr.strip()
-                )
-            if result.stdout.strip(): print(f"📋 stdout:\n{result.stdout.strip()}")
-            if result.stderr.strip(): 
-                print(f"ℹ️ stderr:\n{result.stderr.strip()}")
-                raise ThanmError(
-                    "Thanm 命令执行时出现错误输出。", result.stderr.strip()
-                )
-            return result.stdout
+            return self._collect(self._spawn(args, working_dir))
         except Exception as e:
-            raise ThanmError(f"执行命令时发生未知错误: {e}", e.stderr)
+            raise ThanmError(f"执行命令时发生未知错误: {e}", getattr(e, 'stderr', ""))
+
+    def _spawn(self, args: List[str], working_dir: Optional[str] = None) -> subprocess.Popen:
+        """启动 thanm 进程但不等待其结束。"""
+        command = self._base_argv + args
+        if self.verbose:
+            print(f"🚀 正在执行命令: {' '.join(command)}")
+            if working_dir: print(f"   (在目录下: {working_dir})")
+        # 使用二进制管道，仅在结束时对非空输出解码一次
+        return subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=working_dir, creationflags=CREATE_NO_WINDOW
+        )
+
+    def _collect(self, process: subprocess.Popen) -> str:
+        """等待 _spawn 启动的进程结束，检查结果并返回 stdout。"""
+        stdout_bytes, stderr_bytes = process.communicate()
+        stdout = _decode(stdout_bytes)
+        stderr = _decode(stderr_bytes).strip()
+        if process.returncode != 0:
+            raise ThanmError(
+                f"Thanm 命令执行失败 (退出码 {process.returncode})",
+                stderr
+            )
+        if self.verbose and stdout.strip(): print(f"📋 stdout:\n{stdout.strip()}")
+        if stderr:
+            if self.verbose: print(f"ℹ️ stderr:\n{stderr}")
+            raise ThanmError(
+                "Thanm 命令执行时出现错误输出。", stderr
+            )
+        return stdout
 
     # --- 您的原始方法 ---
-    def analyze_structure(self, version: str, anm_path: str, output_path: str):
-        """提取指令文件 (-l)，如果提供了 anmm 映射则使用它。"""
+    def _analyze_args(self, version: str, anm_path: str) -> List[str]:
         cmd = ['-l', version, anm_path]
         if self.anmm_path:
             cmd.extend(['-m', self.anmm_path])
-        content = self._run_command(cmd)
+        return cmd
+
+    def analyze_structure(self, version: str, anm_path: str, output_path: str):
+        """提取指令文件 (-l)，如果提供了 anmm 映射则使用它。"""
+        content = self._run_command(self._analyze_args(version, anm_path))
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write(content)
 
@@ -60,7 +81,7 @@ class ThanmWrapper:
         # anm_path 需要是绝对路径，因为我们会切换工作目录
         cmd = ['-x', version, os.path.abspath(anm_path)]
         self._run_command(cmd, working_dir=working_dir)
-        print(f"✅ 成功从 '{os.path.basename(anm_path)}' 提取图片到 '{working_dir}'。")
+        if self.verbose: print(f"✅ 成功从 '{os.path.basename(anm_path)}' 提取图片到 '{working_dir}'。")
 
     def create(self, version: str, output_archive: str, spec_file: str):
         """打包新的档案 (-c)，如果提供了 anmm 映射则使用它。"""
@@ -78,15 +99,36 @@ class ThanmWrapper:
         一个高级封装，执行完整的解包流程：
         1. 在 output_dir 中提取图片。
         2. 在 output_dir 中生成指令文件。
+        两步互不依赖（输出分别是图片目录和指令文件），因此两个 thanm 进程并行运行。
         返回生成的指令文件的路径。
         """
         os.makedirs(output_dir, exist_ok=True)
-        
-        # 1. 提取图片
-        self.extract_images(version, anm_path, output_dir)
-        
-        # 2. 提取指令文件，我们约定它的名字和输出目录名一样，后缀为 .txt
+        # 指令文件的名字和输出目录名一样，后缀为 .txt
         spec_file_path = os.path.join(output_dir, f"{os.path.basename(output_dir)}.txt")
-        self.analyze_structure(version, anm_path, spec_file_path)
+
+        try:
+            # anm_path 需要是绝对路径，因为提取图片时会切换工作目录
+            extract_proc = self._spawn(['-x', version, os.path.abspath(anm_path)], output_dir)
+            try:
+                analyze_proc = self._spawn(self._analyze_args(version, anm_path))
+            except Exception:
+                extract_proc.kill()
+                extract_proc.communicate()
+                raise
+            try:
+                # 1. 提取图片
+                self._collect(extract_proc)
+            except Exception:
+                # 提取失败时终止并回收另一个进程，避免残留
+                analyze_proc.kill()
+                analyze_proc.communicate()
+                raise
+            # 2. 提取指令文件
+            content = self._collect(analyze_proc)
+        except Exception as e:
+            raise ThanmError(f"执行命令时发生未知错误: {e}", getattr(e, 'stderr', ""))
+
+        with open(spec_file_path, 'w', encoding='utf-8') as f:
+            f.write(content)
         
         return spec_file_path
\ No newline at end of file
@@ -1,28 +1,41 @@
 # app/core/thecl_wrapper.py
 
-import subprocess
 import os
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterable, List, Optional, Sequence
+from PyQt6.QtCore import pyqtBoundSignal
 from PyQt6.QtWidgets import QMessageBox
 
+from .batch import run_batch
+from .process import run_subprocess
+
 class TheclError(Exception):
     """当 thecl 子进程返回错误时抛出此异常。"""
     def __init__(self, message, stderr):
         super().__init__(message)
         self.stderr = stderr
 
+    def __reduce__(self):
+        # 让异常能在批处理的工作进程与主进程之间完整传递（保留 stderr）
+        return (self.__class__, (str(self), self.stderr))
+
 class TheclWrapper:
     """
     一个封装了 thecl.exe 工具的包装类，用于处理东方Project的ECL脚本。
     """
-    def __init__(self, thecl_path: str, eclmap_path: Optional[str] = None):
+    def __init__(self, thecl_path: str, eclmap_path: Optional[str] = None, interactive: bool = True,
+                 warning_signal: Optional[pyqtBoundSignal] = None):
         """
         初始化 TheclWrapper。
 
         :param thecl_path: thecl.exe 工具的路径。
         :param eclmap_path: (可选) 用于翻译指令的 eclmap 文件路径。
+        :param interactive: (可选) 是否允许弹出警告对话框；批处理的工作进程中没有 GUI，需设为 False。
+        :param warning_signal: (可选) 形如 pyqtSignal(str, str) 的信号。提供时警告通过它发出 (标题, 内容)，
+            由 GUI 在主线程中统一展示，而不是在当前调用线程中同步弹窗。
         """
+        self.interactive = interactive
+        self.warning_signal = warning_signal
         self.thecl_path = Path(thecl_path)
         if not self.thecl_path.is_file():
             raise FileNotFoundError(f"指定的 thecl 路径 '{self.thecl_path}' 不存在或不是一个文件。")
@@ -34,32 +47,30 @@ class TheclWrapper:
                 print(f"警告: 指定的 eclmap 映射文件 '{self.eclmap_path}' 不存在。")
                 self.eclmap_path = None
 
-    def _run_command(self, args: List[str]) -> str:
+        # 工具与映射文件的绝对路径在构造时确定一次，避免每次调用都 getcwd 并重建 Path
+        self._thecl_abs = str(self.thecl_path.absolute())
+        self._eclmap_abs: Optional[str] = str(self.eclmap_path.absolute()) if self.eclmap_path else None
+
+    def _run_command(self, args: List[str]) -> bytes:
         """
         内部方法，用于执行 thecl 命令并处理结果。
+        输出以原始字节返回，只有在需要展示给用户的错误 / 警告分支中才解码。
         """
-        command = [str(self.thecl_path.absolute())] + args
+        command = [self._thecl_abs] + args
         print(f"🚀 正在执行命令: {' '.join(command)}")
         
         try:
-            result = subprocess.run(
-                command,
-                capture_output=True,
-                text=True,
-            )
+            stdout, stderr, returncode = run_subprocess(command)
             
-            if result.returncode != 0:
+            if returncode != 0:
                 raise TheclError(
-                    f"Thecl 命令执行失败 (退出码 {result.returncode})",
-                    result.stderr.strip()
+                    f"Thecl 命令执行失败 (退出码 {returncode})",
+                    stderr.decode('utf-8', 'replace').strip()
                 )
-            print(result)
-            if result.stdout.strip():
-                print(f"📋 stdout:\n{result.stdout.strip()}")
-            if result.stderr.strip():
+            if stderr.strip():
                 # thecl 可能会在 stderr 输出一些非错误信息；但为防止忽略潜在问题，
                 # 即使返回码为 0，也弹出警告提示用户留意这些输出。
-                stderr_msg = result.stderr.strip()
+                stderr_msg = stderr.decode('utf-8', 'replace').strip()
                 print(f"ℹ️ stderr:\n{stderr_msg}")
 
                 # 粗略识别当前操作类型，给出更友好的提示文案
@@ -78,13 +89,16 @@ class TheclWrapper:
                     f"{op}成功，但检测到 thecl 的 stderr 输出，可能存在错误或警告。\n\n"
                     f"提示：{op}成功但是存在错误，这就是：\n\n{stderr_msg}"
                 )
-                try:
-                    QMessageBox.warning(None, title, msg)
-                except Exception:
-                    # 若在无 GUI 环境下（例如命令行独立运行）无法弹窗，则忽略
-                    pass
+                if self.warning_signal is not None:
+                    self.warning_signal.emit(title, msg)
+                elif self.interactive:
+                    try:
+                        QMessageBox.warning(None, title, msg)
+                    except Exception:
+                        # 若在无 GUI 环境下（例如命令行独立运行）无法弹窗，则忽略
+                        pass
 
-            return result.stdout
+            return stdout
             
         except FileNotFoundError:
             raise FileNotFoundError(f"无法找到 thecl 可执行文件: '{self.thecl_path}'")
@@ -118,8 +132,8 @@ class TheclWrapper:
         # 默认启用 Shift-JIS <-> UTF-8 转换，对现代编辑器至关重要
         cmd.append('-j')
         
-        if self.eclmap_path:
-            cmd.extend(['-m', str(self.eclmap_path.absolute())])
+        if self._eclmap_abs:
+            cmd.extend(['-m', self._eclmap_abs])
             #pass
         if use_address_info:
             cmd.append('-x')
@@ -152,8 +166,8 @@ class TheclWrapper:
         # 默认启用 UTF-8 -> Shift-JIS 转换
         cmd.append('-j')
 
-        if self.eclmap_path:
-            cmd.extend(['-m', str(self.eclmap_path.absolute())])
+        if self._eclmap_abs:
+            cmd.extend(['-m', self._eclmap_abs])
         if simple_mode:
             cmd.append('-s')
             
@@ -177,8 +191,8 @@ class TheclWrapper:
         header_path.parent.mkdir(parents=True, exist_ok=True)
         
         cmd = ['-h', str(version)]
-        if self.eclmap_path:
-            cmd.extend(['-m', str(self.eclmap_path.absolute())])
+        if self._eclmap_abs:
+            cmd.extend(['-m', self._eclmap_abs])
             
         cmd.extend([str(ecl_path), str(header_path)])
         
@@ -186,6 +200,22 @@ class TheclWrapper:
         print(f"✅ 成功为 '{ecl_path.name}' 创建头文件 '{header_path.name}'。")
         return str(header_path)
 
+    # ------------------------------------------------------------------
+    # 批处理：多个文件并行处理，每个任务在独立进程中运行
+    # ------------------------------------------------------------------
+
+    def _worker_args(self) -> tuple:
+        """工作进程中重建包装器所需的构造参数；工作进程没有 GUI，不弹出对话框。"""
+        return (str(self.thecl_path), str(self.eclmap_path) if self.eclmap_path else None, False)
+
+    def unpack_many(self, jobs: Iterable[Sequence], max_workers: Optional[int] = None) -> List[str]:
+        """并行解包多个文件。jobs 的每个元素是一次 unpack 调用的位置参数。"""
+        return run_batch(self.__class__, self._worker_args(), 'unpack', jobs, max_workers)
+
+    def pack_many(self, jobs: Iterable[Sequence], max_workers: Optional[int] = None) -> List[str]:
+        """并行打包多个文件。jobs 的每个元素是一次 pack 调用的位置参数。"""
+        return run_batch(self.__class__, self._worker_args(), 'pack', jobs, max_workers)
+
 # ==================================================================
 # 调试和独立运行的示例代码
 # ==================================================================
@@ -194,7 +224,7 @@ if __name__ == "__main__":
     # 1. 将 thecl.exe 放在 'resources' 目录下。
     # 2. 将一个 eclmap 文件 (可选) 放在 'resources' 目录下。
     # 3. 将一个用于测试的 .ecl 文件放在 'data' 目录下。
-    # 4. 在项目根目录运行 `python app/core/thecl_wrapper.py`
+    # 4. 在项目根目录运行 `python -m app.core.thecl_wrapper`
     
     # 创建必要的目录
     os.makedirs("resources", exist_ok=True)
@@ -1,10 +1,34 @@
 # app/core/thmsg_wrapper.py
 
-import json
+import functools
+import os
 import re
-import subprocess
+import tempfile
 from pathlib import Path
-from typing import List
+from typing import Iterable, List, Optional, Sequence
+
+from . import disk_cache
+from .batch import run_batch
+from .process import run_subprocess
+from .reference_data import load_reference
+
+# 下方 [KEY FIX] 中会修补参数的指令 ID。注意 ins_id in ('14') 是子串判断，
+# 因此 '1' 与 '4' 同样会走该分支；其余指令的参数串可原样写回。
+_PARAM_FIXUP_IDS = frozenset(('1', '4', '7', '14', '19'))
+
+# 磁盘翻译缓存的子目录名
+_TRANSLATION_CACHE = "msg_translations"
+# 翻译缓存的容量上限；每次运行首次写入缓存时清理超出部分
+_TRANSLATION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# dmsg 行的首字符分派表：0 = entry 行，1 = '@' 时间标记
+_PREFIX_DISPATCH = {'e': 0, '@': 1}
+
+# str.splitlines() 认作换行的全部字符；逐行正则只按 '\n' 切分，匹配前先统一为 '\n'
+_LINE_BREAK_RE = re.compile(r'\r\n|[\r\v\f\x1c-\x1e\x85\u2028\u2029]')
+
+# 翻译结果直接流式写入文件时使用的缓冲区大小
+_WRITE_BUFFER_SIZE = 1 << 20
 
 class ThmsgError(Exception):
     """用于表示 thmsg.exe 调用失败的自定义异常。"""
@@ -12,10 +36,25 @@ class ThmsgError(Exception):
         super().__init__(message)
         self.stderr = stderr
 
+    def __reduce__(self):
+        # 让异常能在批处理的工作进程与主进程之间完整传递（保留 stderr）
+        return (self.__class__, (str(self), self.stderr))
+
 class ThmsgWrapper:
     """
     一个封装了 thmsg.exe 工具和指令翻译逻辑的包装类。
     """
+    # 译文文本的逐行分类：空行 / 注释不产生命名分组，其余按 lastgroup 分派。
+    # 只有以空格或制表符开头的行算缩进；未缩进的行可能以全角空格 (U+3000) 等其他空白开头，
+    # 这些空白与行尾空白一样不计入分组（等价于逐行 strip 后再判断）
+    _LINE_RE = re.compile(
+        r'^(?:[^\S\n]*(?://[^\n]*)?$'                                  # 空行或注释
+        r'|(?![ \t])[^\S\n]*(?P<entry>entry[^\n]*?)[^\S\n]*$'          # entry 行
+        r'|(?![ \t])[^\S\n]*T=(?P<time>[^\n]*?)[^\S\n]*$'              # 时间标记
+        r'|(?P<call>[ \t][^\n]*?(?P<name>\w+)\((?P<args>[^\n]*)\)[^\n]*)$'  # 缩进的指令调用
+        r'|(?P<bad>[ \t][^\n]*)$'                                       # 格式不正确的缩进行
+        r'|[^\S\n]*(?P<other>[^\n]*?)[^\S\n]*$)',                      # 其他未缩进的行
+        re.MULTILINE)
     def __init__(self, thmsg_path: str, reference_json_path: str):
         self.thmsg_path = Path(thmsg_path)
         self.reference_path = Path(reference_json_path)
@@ -25,14 +64,17 @@ class ThmsgWrapper:
         if not self.reference_path.is_file():
             raise FileNotFoundError(f"Reference file not found at {self.reference_path}")
 
-        with open(self.reference_path, 'r', encoding='utf-8') as f:
-            self.reference_data = json.load(f)
+        # 参考表在进程内按 (路径, mtime) 共享缓存，指令名 / 描述 / 反向查找表一并预先构建
+        tables = load_reference(self.reference_path)
+        self.reference_data = tables.forward
+        self._name_by_id = tables.name_by_id
+        self._desc_by_id = tables.desc_by_id
+        self._id_by_name = tables.id_by_name
 
     def _run_command(self, command: List[str]) -> bytes:
         try:
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-            if process.returncode != 0:
+            stdout, stderr, returncode = run_subprocess(command)
+            if returncode != 0:
                 error_message = stderr.decode('utf-8', errors='ignore') or stdout.decode('utf-8', errors='ignore')
                 print(f"Command '{' '.join(command)}' failed with error:\n{error_message}")
                 raise ThmsgError(f"命令执行出现错误, 请谨慎处理生成的文件", error_message)
@@ -55,13 +97,19 @@ class ThmsgWrapper:
         
         print(f"Decompiling {msg_path.name} to dmsg...")
         dmsg_bytes = self._run_command([str(self.thmsg_path.absolute()), '-d', str(version), str(msg_path.absolute())])
-        dmsg_path.write_bytes(dmsg_bytes)
+        # dmsg 只作为中间结果在内存中翻译；仅当调用方要求保留时才写入磁盘
+        if keep_dmsg:
+            dmsg_path.write_bytes(dmsg_bytes)
         
-        print(f"Translating {dmsg_path.name} to txt...")
-        self._translate_dmsg_to_txt(dmsg_path, txt_path, mode=mode, encoding=encoding)
-        
-        if not keep_dmsg:
-            dmsg_path.unlink()
+        # 相同的 dmsg 内容 + 参考文件 + 模式/编码 得到的翻译结果相同，命中缓存时直接复制
+        cache_name = self._translation_cache_name(dmsg_bytes, mode, encoding)
+        if disk_cache.fetch(_TRANSLATION_CACHE, cache_name, txt_path):
+            print(f"Reusing cached translation for {dmsg_path.name}")
+        else:
+            print(f"Translating {dmsg_path.name} to txt...")
+            self._translate_dmsg_to_txt(dmsg_bytes, txt_path, mode=mode, encoding=encoding)
+            disk_cache.store(_TRANSLATION_CACHE, cache_name, txt_path)
+            disk_cache.prune_once(_TRANSLATION_CACHE, _TRANSLATION_CACHE_MAX_BYTES)
         
         print(f"Successfully unpacked {msg_path.name} to {txt_path.name}")
         return str(txt_path)
@@ -73,94 +121,134 @@ class ThmsgWrapper:
         msg_path.parent.mkdir(parents=True, exist_ok=True)
         
         print(f"Recovering {txt_path.name} to dmsg...")
-        self._recover_txt_to_dmsg(txt_path, dmsg_path, encoding=encoding)
+        dmsg_bytes = self._recover_txt_to_dmsg(txt_path, encoding=encoding)
         
         print(f"Compiling {dmsg_path.name} to msg...")
+        if keep_dmsg:
+            dmsg_path.write_bytes(dmsg_bytes)
+            self._compile_dmsg(version, dmsg_path, msg_path)
+        else:
+            # thmsg 只接受文件路径作为输入，不保留时写到临时目录，避免在脚本旁边产生中间文件
+            with tempfile.TemporaryDirectory() as tmpdir:
+                temp_dmsg_path = Path(tmpdir) / dmsg_path.name
+                temp_dmsg_path.write_bytes(dmsg_bytes)
+                self._compile_dmsg(version, temp_dmsg_path, msg_path)
+            
+        print(f"Successfully packed {txt_path.name} to {msg_path.name}")
+        return str(msg_path)
+
+    def _compile_dmsg(self, version: str, dmsg_path: Path, msg_path: Path):
         self._run_command([
             str(self.thmsg_path.absolute()), '-c', str(version),
             str(dmsg_path.absolute()), str(msg_path.absolute())
         ])
-        
-        if not keep_dmsg:
-            dmsg_path.unlink()
-            
-        print(f"Successfully packed {txt_path.name} to {msg_path.name}")
-        return str(msg_path)
+
+    # ------------------------------------------------------------------
+    # 批处理：多个文件并行处理，每个任务在独立进程中运行
+    # ------------------------------------------------------------------
+
+    def unpack_many(self, jobs: Iterable[Sequence], max_workers: Optional[int] = None) -> List[str]:
+        """并行解包多个文件。jobs 的每个元素是一次 unpack 调用的位置参数。"""
+        return run_batch(self.__class__, (str(self.thmsg_path), str(self.reference_path)), 'unpack', jobs, max_workers)
+
+    def pack_many(self, jobs: Iterable[Sequence], max_workers: Optional[int] = None) -> List[str]:
+        """并行打包多个文件。jobs 的每个元素是一次 pack 调用的位置参数。"""
+        return run_batch(self.__class__, (str(self.thmsg_path), str(self.reference_path)), 'pack', jobs, max_workers)
 
     # ==================================================================
     # 内部翻译和恢复逻辑
     # ==================================================================
 
-    def _translate_dmsg_to_txt(self, dmsg_path: Path, output_path: Path, mode: str = "default",encoding: str="Shift-JIS"):
-        """根据参考文件将 dmsg 文件翻译为可读的 txt 格式，使用4个空格进行缩进。"""
-        original_dmsg_lines = dmsg_path.read_text(encoding=encoding, errors='ignore').splitlines()
-        translated_lines = []
+    def _translation_cache_name(self, dmsg_bytes: bytes, mode: str, encoding: str) -> str:
+        ref_mtime = self.reference_path.stat().st_mtime_ns
+        key = disk_cache.content_key(dmsg_bytes, str(self.reference_path.absolute()), str(ref_mtime), mode, encoding)
+        return f"{key}.txt"
+
+    def _translate_dmsg_to_txt(self, dmsg_bytes: bytes, output_path: Path, mode: str = "default",encoding: str="Shift-JIS"):
+        """根据参考文件将 dmsg 内容翻译为可读的 txt 格式，使用4个空格进行缩进。"""
+        original_dmsg_lines = dmsg_bytes.decode(encoding, 'ignore').splitlines()
         indent = "    " # 使用4个空格作为缩进
 
-        for line in original_dmsg_lines:
-            content = line.strip()
-            if not content: continue
-            
-            if content.startswith('entry'):
-                translated_lines.append(content)
-            elif content.startswith('@'):
-                translated_lines.append(f'T={content[1:]}')
-            else:
-                ins_id, *args = content.split(';')
-                if ins_id in self.reference_data:
-                    ins_name = self.reference_data[ins_id][0].split('(')[0]
-                    ins_desc = self.reference_data[ins_id][1]
-                    translated_lines.append(f'{indent}{ins_name}({";".join(args)})')
-                    if mode == 'default':
-                        translated_lines.append(f'{indent}// {ins_desc}')
+        # 逐行直接写入带缓冲的文件（文本模式下 '\n' 会转换为平台换行符），不再先拼出整份输出
+        with output_path.open('w', encoding='utf-8', buffering=_WRITE_BUFFER_SIZE) as out:
+            write = out.write
+            for line in original_dmsg_lines:
+                content = line.strip()
+                if not content: continue
+                
+                # 绝大多数行是指令；先按首字符查表，只有命中时才做完整的前缀判断
+                kind = _PREFIX_DISPATCH.get(content[0])
+                if kind == 0 and content.startswith('entry'):
+                    write(f'{content}\n')
+                elif kind == 1:
+                    write(f'T={content[1:]}\n')
                 else:
-                    translated_lines.append(f'{indent}ins_{ins_id}({";".join(args)})')
-                    if mode == 'default':
-                        translated_lines.append(f'{indent}// Unknown Instruction ID')
-        
-        output_path.write_text('\n'.join(translated_lines) + '\n', encoding='utf-8')
+                    # "id;a;b" -> "name(a;b)"：只需在第一个分号处切开，无需拆分再拼接参数
+                    ins_id, _, args = content.partition(';')
+                    ins_name = self._name_by_id.get(ins_id)
+                    if ins_name is not None:
+                        ins_desc = self._desc_by_id.get(ins_id, '')
+                        write(f'{indent}{ins_name}({args})\n')
+                        if mode == 'default':
+                            write(f'{indent}// {ins_desc}\n')
+                    else:
+                        write(f'{indent}ins_{ins_id}({args})\n')
+                        if mode == 'default':
+                            write(f'{indent}// Unknown Instruction ID\n')
+            if out.tell() == 0:
+                write('\n')  # 与原先 join 的结果一致：空输出也保留一个换行
 
-    def _recover_txt_to_dmsg(self, txt_path: Path, output_path: Path, encoding: str="Shift-JIS"):
-        """将翻译后的 txt 文件恢复为 dmsg 格式，生成带 \t 的 dmsg。"""
-        txt_lines = txt_path.read_text(encoding='utf-8').splitlines()
+    def _recover_txt_to_dmsg(self, txt_path: Path, encoding: str="Shift-JIS") -> bytes:
+        """将翻译后的 txt 文件恢复为 dmsg 格式，返回编码后的 dmsg 内容。"""
+        text = txt_path.read_bytes().decode('utf-8')
+        text = _LINE_BREAK_RE.sub('\n', text)
         recovered_lines = []
         
-        reverse_ref = {v[0].split('(')[0]: k for k, v in self.reference_data.items()}
+        reverse_ref = self._id_by_name
+
+        def line_no(m: re.Match) -> int:
+            # 行号只在输出提示时才需要，按需计算
+            return text.count('\n', 0, m.start()) + 1
 
-        for line_num, line in enumerate(txt_lines, 1):
-            content = line.strip()
-            if not content or content.startswith('//'):
+        # 整个文件交给 _LINE_RE 一次性切分，逐行分类在正则引擎内完成
+        for m in self._LINE_RE.finditer(text):
+            kind = m.lastgroup
+            if kind is None:  # 空行或注释
                 continue
 
-            if not line.startswith((' ', '\t')):
-                if content.startswith('entry'):
-                    recovered_lines.append(content)
-                elif content.startswith('T='):
-                    recovered_lines.append(f'@{content[2:]}')
-                else:
-                    print(f'Warning [Line {line_num}]: Unindented line is not a valid command: "{content}"')
-                    recovered_lines.append(content)
+            if kind == 'entry':
+                recovered_lines.append(m['entry'])
+            elif kind == 'time':
+                recovered_lines.append(f'@{m["time"]}')
+            elif kind == 'other':
+                content = m['other']
+                print(f'Warning [Line {line_no(m)}]: Unindented line is not a valid command: "{content}"')
+                recovered_lines.append(content)
+            elif kind == 'bad':
+                line = m['bad']
+                print(f'Warning [Line {line_no(m)}]: Indented line has invalid format: "{line.strip()}"')
+                recovered_lines.append(line)
             else:
-                match = re.search(r'([\w_]+)\((.*)\)', content)
-                if not match:
-                    print(f'Warning [Line {line_num}]: Indented line has invalid format: "{content}"')
-                    recovered_lines.append(line)
-                    continue
-
-                func_name, params_str = match.groups()
-                params = params_str.split(';') if params_str else []
+                line = m['call']
+                func_name, params_str = m['name'], m['args']
+                # 参数串原样写回即可；只有需要修补参数的指令才拆分为列表
+                params_suffix = f';{params_str}' if params_str else ''
                 
                 line_to_write = ""
                 if func_name in reverse_ref:
                     ins_id = reverse_ref[func_name]
+                    if ins_id not in _PARAM_FIXUP_IDS:
+                        recovered_lines.append(f'{ins_id}{params_suffix}')
+                        continue
+                    params = params_str.split(';') if params_str else []
                     # --- [KEY FIX] ---
                     # 针对 thmsg 工具的 bug，为特定无参数指令自动添加 '0'
                     # 7: speakerPlayer, 4: playerHide, 6: textboxHide, etc.
                     if ins_id in ('7') and not params:
-                        print(f"DEBUG [Line {line_num}]: Auto-fixing empty params for instruction '{func_name}' (ID: {ins_id}). Adding '0'.")
+                        print(f"DEBUG [Line {line_no(m)}]: Auto-fixing empty params for instruction '{func_name}' (ID: {ins_id}). Adding '0'.")
                         params = ['0']
                     if ins_id in ('14') and len(params) < 2:
-                        print(f"DEBUG [Line {line_num}]: Auto-fixing missing params for instruction '{func_name}' (ID: {ins_id}). Adding '0'.")
+                        print(f"DEBUG [Line {line_no(m)}]: Auto-fixing missing params for instruction '{func_name}' (ID: {ins_id}). Adding '0'.")
                         params.insert(0,'0')
                     # --- END FIX ---
 
@@ -172,16 +260,36 @@ class ThmsgWrapper:
                 elif func_name.startswith('ins_'):
                     try:
                         ins_id = func_name.split('_')[1]
-                        line_to_write = f'{ins_id}'
-                        if params: line_to_write += f';{";".join(params)}'
+                        line_to_write = f'{ins_id}{params_suffix}'
                     except (IndexError, ValueError):
-                        print(f'Warning [Line {line_num}]: Could not parse unknown instruction: "{func_name}"')
+                        print(f'Warning [Line {line_no(m)}]: Could not parse unknown instruction: "{func_name}"')
                         line_to_write = line
                 else:
-                    print(f'Warning [Line {line_num}]: Function "{func_name}" not in reference. Keeping original.')
+                    print(f'Warning [Line {line_no(m)}]: Function "{func_name}" not in reference. Keeping original.')
                     line_to_write = line
                 
                 # dmsg 格式的指令行本身不需要前导 \t，thmsg 工具会处理
                 recovered_lines.append(line_to_write)
 
-        output_path.write_text('\n'.join(recovered_lines) + '\n', encoding=encoding, errors='ignore')
\ No newline at end of file
+        return (os.linesep.join(recovered_lines) + os.linesep).encode(encoding, 'ignore')
+
+
+
+def _ref_mtime(ref_path: str) -> Optional[int]:
+    try:
+        return Path(ref_path).stat().st_mtime_ns
+    except OSError:
+        return None  # 交给构造函数报告路径错误
+
+
+@functools.lru_cache(maxsize=4)
+def _get_thmsg_wrapper_cached(tool_path: str, ref_path: str, ref_mtime: Optional[int]) -> ThmsgWrapper:
+    return ThmsgWrapper(tool_path, ref_path)
+
+
+def get_thmsg_wrapper(thmsg_path: str, ref_path: str) -> ThmsgWrapper:
+    """
+    返回按 (thmsg 路径, 参考文件路径) 共享的 ThmsgWrapper 实例，避免每次都重新检查路径、加载参考表。
+    参考文件的 mtime 也是缓存键的一部分，文件被修改后会得到新的实例。
+    """
+    return _get_thmsg_wrapper_cached(str(thmsg_path), str(ref_path), _ref_mtime(ref_path))
@@ -1,11 +1,28 @@
 # app/core/thstd_wrapper.py
 
-import json
+import functools
+import io
+import os
 import re
-import subprocess
 import tempfile
 from pathlib import Path
-from typing import List
+from typing import Iterable, List, Optional, Sequence
+
+from . import disk_cache
+from .batch import run_batch
+from .process import run_subprocess
+from .reference_data import load_reference
+
+# 磁盘翻译缓存的子目录名
+_TRANSLATION_CACHE = "std_translations"
+# 翻译缓存的容量上限；每次运行首次写入缓存时清理超出部分
+_TRANSLATION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# str.splitlines() 认作换行的全部字符；逐行正则只按 '\n' 切分，匹配前先统一为 '\n'
+_LINE_BREAK_RE = re.compile(r'\r\n|[\r\v\f\x1c-\x1e\x85\u2028\u2029]')
+
+# 翻译结果直接流式写入文件时使用的缓冲区大小
+_WRITE_BUFFER_SIZE = 1 << 20
 
 class ThstdError(Exception):
     """当 thstd 子进程返回错误时抛出此异常。"""
@@ -13,15 +30,31 @@ class ThstdError(Exception):
         super().__init__(message)
         self.stderr = stderr
 
+    def __reduce__(self):
+        # 让异常能在批处理的工作进程与主进程之间完整传递（保留 stderr）
+        return (self.__class__, (str(self), self.stderr))
+
 class _LabelNotFoundError(Exception):
     pass
 
+def _to_platform_newlines(text: str) -> str:
+    """把 '\n' 换成平台换行符，使 write_bytes 的结果与文本模式写入一致。"""
+    return text if os.linesep == '\n' else text.replace('\n', os.linesep)
+
 class ThstdWrapper:
     """
     一个封装了 thstd.exe 工具、指令翻译和脚本预处理逻辑的包装类。
     """
     INSTRUCTION_RE = re.compile(r'^\s*([a-zA-Z_][\w_]*)\s*\((.*)\)\s*;.*$')
     LABEL_RE = re.compile(r'^\s*((?:\d+|@[a-zA-Z_]\w*)):')
+    _JMP_RE = re.compile(r'^\s*jmp\s*\(([^,]+),\s*(@[a-zA-Z_]\w*)\s*\);')
+    _PAIR_RE = re.compile(r'\(([^,]+),([^)]+)\);')
+    # 恢复 dstd 时的逐行分类：注释行不产生命名分组；缩进行拆出函数名与其后的部分，其余行原样保留
+    _INSIFY_LINE_RE = re.compile(
+        r'^(?:[^\S\n]*//[^\n]*$'
+        r'|(?P<indented>(?:\t|    )[^\S\n]*(?P<func>[^(\n]*?)(?P<args>\([^\n]*?)?)[^\S\n]*$'
+        r'|(?P<other>[^\n]*)$)',
+        re.MULTILINE)
 
     def __init__(self, thstd_path: str, reference_json_path: str):
         self.thstd_path = Path(thstd_path)
@@ -36,21 +69,25 @@ class ThstdWrapper:
 
     def _load_reference_data(self):
         try:
-            with open(self.reference_path, 'r', encoding='utf-8') as f:
-                self.reference_data = json.load(f)
-            self.reverse_reference_data = {v[0].split('(')[0]: k for k, v in self.reference_data.items()}
+            tables = load_reference(self.reference_path)
+            self.reference_data = tables.forward
+            self._name_by_id = tables.name_by_id
+            self._desc_by_id = tables.desc_by_id
+            self._id_by_name = tables.id_by_name
         except Exception as e:
             raise ThstdError(f"加载STD参考文件时发生错误: {e}")
 
-    def _run_command(self, args: List[str]) -> str:
+    def _run_command(self, args: List[str]) -> bytes:
         command = [str(self.thstd_path.absolute())] + args
         try:
-            result = subprocess.run(
-                command, capture_output=True, text=True, encoding='utf-8', check=False
-            )
-            if result.returncode != 0:
-                raise ThstdError(f"Thstd 命令执行失败 (退出码: {result.returncode})", result.stderr)
-            return result.stdout
+            # 以字节形式捕获输出，仅在失败时解码 stderr
+            stdout, stderr, returncode = run_subprocess(command)
+            if returncode != 0:
+                raise ThstdError(
+                    f"Thstd 命令执行失败 (退出码: {returncode})",
+                    stderr.decode('utf-8', 'replace')
+                )
+            return stdout
         except FileNotFoundError:
             raise FileNotFoundError(f"无法找到 thstd 可执行文件: '{self.thstd_path}'")
         except Exception as e:
@@ -64,7 +101,12 @@ class ThstdWrapper:
         with tempfile.TemporaryDirectory() as tmpdir:
             temp_dstd_path = Path(tmpdir) / 'temp.dstd'
             self._run_command(['-d', str(version), str(std_path_abs), str(temp_dstd_path)])
-            self._translate_dstd_file(temp_dstd_path, txt_path, mode)
+            # 相同的 dstd 内容 + 参考文件 + 模式 得到的翻译结果相同，命中缓存时直接复制
+            cache_name = self._translation_cache_name(temp_dstd_path.read_bytes(), mode)
+            if not disk_cache.fetch(_TRANSLATION_CACHE, cache_name, txt_path):
+                self._translate_dstd_file(temp_dstd_path, txt_path, mode)
+                disk_cache.store(_TRANSLATION_CACHE, cache_name, txt_path)
+                disk_cache.prune_once(_TRANSLATION_CACHE, _TRANSLATION_CACHE_MAX_BYTES)
         return str(txt_path)
 
     def pack(self, version: str, txt_path: str, output_std_path: str):
@@ -73,15 +115,13 @@ class ThstdWrapper:
         std_path_abs.parent.mkdir(parents=True, exist_ok=True)
         
         try:
-            with open(txt_path, 'r', encoding='utf-8') as f:
-                original_content = f.read()
+            original_content = txt_path.read_bytes().decode('utf-8')
             preprocessed_content = self._preprocess_jmp_labels(original_content)
             final_content = self._insify_text(preprocessed_content)
             
             with tempfile.TemporaryDirectory() as tmpdir:
                 temp_dstd_path = Path(tmpdir) / 'temp.dstd'
-                with open(temp_dstd_path, 'w', encoding='utf-8') as f:
-                    f.write(final_content)
+                temp_dstd_path.write_bytes(_to_platform_newlines(final_content).encode('utf-8'))
                 self._run_command(['-c', str(version), str(temp_dstd_path), str(std_path_abs)])
         except _LabelNotFoundError as e:
             raise ThstdError(f"脚本预处理失败: {e}")
@@ -91,6 +131,23 @@ class ThstdWrapper:
             raise ThstdError(f"打包过程中发生未知错误: {e}")
         return str(std_path_abs)
 
+    # ------------------------------------------------------------------
+    # 批处理：多个文件并行处理，每个任务在独立进程中运行
+    # ------------------------------------------------------------------
+
+    def unpack_many(self, jobs: Iterable[Sequence], max_workers: Optional[int] = None) -> List[str]:
+        """并行解包多个文件。jobs 的每个元素是一次 unpack 调用的位置参数。"""
+        return run_batch(self.__class__, (str(self.thstd_path), str(self.reference_path)), 'unpack', jobs, max_workers)
+
+    def pack_many(self, jobs: Iterable[Sequence], max_workers: Optional[int] = None) -> List[str]:
+        """并行打包多个文件。jobs 的每个元素是一次 pack 调用的位置参数。"""
+        return run_batch(self.__class__, (str(self.thstd_path), str(self.reference_path)), 'pack', jobs, max_workers)
+
+    def _translation_cache_name(self, dstd_bytes: bytes, mode: str) -> str:
+        ref_mtime = self.reference_path.stat().st_mtime_ns
+        key = disk_cache.content_key(dstd_bytes, str(self.reference_path.absolute()), str(ref_mtime), mode)
+        return f"{key}.txt"
+
     def _preprocess_jmp_labels(self, script_text: str) -> str:
         lines = script_text.splitlines()
         script_start_line = -1
@@ -100,88 +157,98 @@ class ThstdWrapper:
                 break
         if script_start_line == -1: return script_text
 
+        # 单遍扫描：同时累计标签偏移并输出各行；jmp 可能引用后文定义的标签，
+        # 因此先占位并记录，扫描结束后再统一回填
         label_offsets = {}
         current_offset = 0
-        script_lines = lines[script_start_line + 1:]
+        processed_lines = lines[:script_start_line + 1]
+        pending_jmps = []
 
-        for line in script_lines:
-            clean_line = line.strip()
-            if not clean_line or clean_line.startswith('//'): continue
-            
-            if self.LABEL_RE.match(clean_line):
-                label_name = self.LABEL_RE.match(clean_line).group(1)
-                label_offsets[label_name] = current_offset
+        for line_num, line in enumerate(lines[script_start_line + 1:], start=script_start_line + 1):
+            # 三个正则都以 ^\s* 锚定，直接匹配原始行即可，无需先 strip；
+            # 空行与注释行不可能匹配标签或指令，因此也不必单独判断
+            jmp_match = self._JMP_RE.match(line)
+            if jmp_match:
+                pending_jmps.append((len(processed_lines), line, jmp_match, line_num))
+                processed_lines.append(None)
+            else:
+                processed_lines.append(line)
+
+            label_match = self.LABEL_RE.match(line)
+            if label_match:
+                label_offsets[label_match.group(1)] = current_offset
                 continue
 
-            ins_match = self.INSTRUCTION_RE.match(clean_line)
+            ins_match = self.INSTRUCTION_RE.match(line)
             if ins_match:
                 args_str = ins_match.group(2).strip()
                 num_args = len(args_str.split(',')) if args_str else 0
                 current_offset += 8 + 4 * num_args
 
-        processed_lines = lines[:script_start_line + 1]
-        for line_num, line in enumerate(script_lines, start=script_start_line + 1):
-            clean_line = line.strip()
-            jmp_match = re.match(r'^\s*jmp\s*\(([^,]+),\s*(@[a-zA-Z_]\w*)\s*\);', clean_line)
-            
-            if jmp_match:
-                time_arg, label_name = jmp_match.group(1).strip(), jmp_match.group(2)
-                if label_name not in label_offsets:
-                    raise _LabelNotFoundError(f"在第 {line_num + 1} 行: 未定义的标签 '{label_name}'")
-                offset = label_offsets[label_name]
-                indent = line[:len(line) - len(line.lstrip())]
-                processed_lines.append(f"{indent}jmp({time_arg}, {offset});")
-            else:
-                processed_lines.append(line)
+        for index, line, jmp_match, line_num in pending_jmps:
+            time_arg, label_name = jmp_match.group(1).strip(), jmp_match.group(2)
+            if label_name not in label_offsets:
+                raise _LabelNotFoundError(f"在第 {line_num + 1} 行: 未定义的标签 '{label_name}'")
+            offset = label_offsets[label_name]
+            indent = line[:len(line) - len(line.lstrip())]
+            processed_lines[index] = f"{indent}jmp({time_arg}, {offset});"
         return "\n".join(processed_lines)
 
     def _translate_dstd_file(self, dstd_path: Path, output_path: Path, mode: str):
-        with open(dstd_path, 'r', encoding='utf-8') as file: lines = file.readlines()
-        translated_lines = []
-        for line in lines:
-            stripped = line.strip()
-            if stripped.startswith('ins_'):
-                func_part = stripped.split('(')[0]
-                args_part = stripped[len(func_part):]
-                ins_id = func_part.replace('ins_', '')
-
-                # vvvvvvvvvvvvvv 修正翻译逻辑 vvvvvvvvvvvvvv
-                # 特例：ins_1(offset, time) -> jmp(time, offset)
-                if ins_id == '1':
-                    match = re.search(r'\(([^,]+),([^)]+)\);', stripped)
-                    if match:
-                        offset_arg, time_arg = match.group(1).strip(), match.group(2).strip()
-                        translated_lines.append(f"    jmp({time_arg}, {offset_arg});\n")
-                    else: # 格式不匹配，按原样翻译
-                        translated_lines.append(line)
-                else: # 通用翻译逻辑
-                    new_func_name = self.reference_data.get(ins_id, [func_part])[0].split('(')[0]
-                    translated_lines.append(f"    {new_func_name}{args_part}\n")
-                
-                if mode == 'default':
-                    desc = self.reference_data.get(ins_id, [None, 'No description available'])[1]
-                    translated_lines.append(f"    // {desc.strip()}\n")
-                # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
-            else:
-                translated_lines.append(line)
-        with open(output_path, 'w', encoding='utf-8') as file: file.writelines(translated_lines)
+        text = dstd_path.read_bytes().decode('utf-8')
+        # 与文本模式 readlines() 一致：统一换行符为 '\n'、保留行尾，且只按 '\n' 分行
+        # （splitlines 还会在 \f、\x85、U+2028 等字符处断行）
+        lines = io.StringIO(text, newline=None)
+        # 逐行直接写入带缓冲的文件（文本模式下 '\n' 会转换为平台换行符），不再先拼出整份输出
+        with output_path.open('w', encoding='utf-8', buffering=_WRITE_BUFFER_SIZE) as out:
+            write = out.write
+            for line in lines:
+                stripped = line.strip()
+                if stripped.startswith('ins_'):
+                    func_part = stripped.split('(')[0]
+                    args_part = stripped[len(func_part):]
+                    ins_id = func_part.replace('ins_', '')
+
+                    # vvvvvvvvvvvvvv 修正翻译逻辑 vvvvvvvvvvvvvv
+                    # 特例：ins_1(offset, time) -> jmp(time, offset)
+                    if ins_id == '1':
+                        match = self._PAIR_RE.search(stripped)
+                        if match:
+                            offset_arg, time_arg = match.group(1).strip(), match.group(2).strip()
+                            write(f"    jmp({time_arg}, {offset_arg});\n")
+                        else: # 格式不匹配，按原样翻译
+                            write(line)
+                    else: # 通用翻译逻辑
+                        new_func_name = self._name_by_id.get(ins_id, func_part)
+                        write(f"    {new_func_name}{args_part}\n")
+                    
+                    if mode == 'default':
+                        desc = self._desc_by_id.get(ins_id, 'No description available')
+                        write(f"    // {desc.strip()}\n")
+                    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+                else:
+                    write(line)
 
 
     def _insify_text(self, text_content: str) -> str:
         """将翻译好的文本内容字符串恢复为dstd格式字符串。"""
-        original_lines = text_content.splitlines()
+        text_content = _LINE_BREAK_RE.sub('\n', text_content)
         insified_lines = []
-        for line in original_lines:
-            stripped = line.strip()
-            if stripped.startswith(r'//'): continue
+        # 与 splitlines 一致：末尾的换行不产生额外的空行
+        end = len(text_content) - text_content.endswith('\n')
+        for m in self._INSIFY_LINE_RE.finditer(text_content, 0, end):
+            kind = m.lastgroup
+            if kind is None:  # 注释行
+                continue
             
-            if line.startswith('\t') or line.startswith('    '):
-                func_part = stripped.split('(')[0]
+            if kind == 'indented':
+                func_part = m['func']
 
                 # vvvvvvvvvvvvvv 核心修正 vvvvvvvvvvvvvv
                 # 特例处理：将 jmp(time, offset) 转换为 ins_1(offset, time)
                 if func_part == 'jmp':
-                    match = re.search(r'\(([^,]+),([^)]+)\);', stripped)
+                    stripped = m.group().strip()
+                    match = self._PAIR_RE.search(stripped)
                     if match:
                         time_arg = match.group(1).strip()
                         offset_arg = match.group(2).strip()
@@ -190,16 +257,37 @@ class ThstdWrapper:
                         insified_lines.append(new_line)
                     else:
                         # 如果格式不匹配，可能导致错误，但还是按原样添加
-                        insified_lines.append(line.lstrip())
+                        insified_lines.append(m.group().lstrip())
                 else: # 通用处理逻辑
-                    args_part = stripped[len(func_part):]
-                    if func_part in self.reverse_reference_data:
-                        ins_id = self.reverse_reference_data[func_part]
+                    args_part = m['args'] or ''
+                    if func_part in self._id_by_name:
+                        ins_id = self._id_by_name[func_part]
                         new_func_name = f"ins_{ins_id}"
                     else:
                         new_func_name = func_part
                     insified_lines.append(f"    {new_func_name}{args_part}")
                 # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
             else:
-                insified_lines.append(line)
-        return "\n".join(insified_lines)
\ No newline at end of file
+                insified_lines.append(m['other'])
+        return "\n".join(insified_lines)
+
+
+
+def _ref_mtime(ref_path: str) -> Optional[int]:
+    try:
+        return Path(ref_path).stat().st_mtime_ns
+    except OSError:
+        return None  # 交给构造函数报告路径错误
+
+
+@functools.lru_cache(maxsize=4)
+def _get_thstd_wrapper_cached(tool_path: str, ref_path: str, ref_mtime: Optional[int]) -> ThstdWrapper:
+    return ThstdWrapper(tool_path, ref_path)
+
+
+def get_thstd_wrapper(thstd_path: str, ref_path: str) -> ThstdWrapper:
+    """
+    返回按 (thstd 路径, 参考文件路径) 共享的 ThstdWrapper 实例，避免每次都重新检查路径、加载参考表。
+    参考文件的 mtime 也是缓存键的一部分，文件被修改后会得到新的实例。
+    """
+    return _get_thstd_wrapper_cached(str(thstd_path), str(ref_path), _ref_mtime(ref_path))
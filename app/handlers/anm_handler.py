@@ -1,22 +1,44 @@
 # app/handlers/anm_handler.py (完整、无省略)
 
 from pathlib import Path
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QSize
 from PyQt6.QtWidgets import QWidget, QFileDialog, QMessageBox, QComboBox, QSplitter
-from PyQt6.QtGui import QImage, QPixmap
-from PIL.Image import Image as PILImage
+from PyQt6.QtGui import QImage, QPixmap, QPixmapCache
+from PIL.Image import Image as PILImage, Resampling
 import os
+import sys
 
+from ..core import disk_cache
+from ..core.background import run_in_background
 from ..core.script_handler import ScriptHandler
 from ..core.parser import ScriptParser
 from ..core.image_manager import ImageManager
 from ..core.thanm_wrapper import ThanmWrapper, ThanmError
 from ..widgets.syntax_highlighter import AnmSyntaxHighlighter
 from ..widgets.sprite_preview import SpritePreviewPane
-from ..widgets.sprite_preview_item import SpritePreviewItem
 from ..widgets.thanm_panel import ThanmPanel
 from ..widgets.sprite_composer import SpriteComposerWindow
 
+# QImage 的 ARGB32 格式按平台字节序存放 0xAARRGGBB；让 Pillow 直接按该内存布局输出，
+# QPixmap.fromImage 只需做预乘而无需再逐像素交换通道
+_ARGB32_RAW_MODE = 'BGRA' if sys.byteorder == 'little' else 'ARGB'
+
+# Pillow 模式 -> (tobytes 的 raw 模式, 每像素字节数, QImage 格式)；可直接对应的模式无需 convert
+_QIMAGE_LAYOUTS = {
+    "RGBA": (_ARGB32_RAW_MODE, 4, QImage.Format.Format_ARGB32),
+    "RGB": ("RGB", 3, QImage.Format.Format_RGB888),
+    "L": ("L", 1, QImage.Format.Format_Grayscale8),
+}
+
+# 预览缩略图的最大边长；预览项本身只有约 110x80 的显示区域，更大的精灵先缩小再转换
+THUMB_MAX = 128
+
+# 缩略图磁盘缓存的子目录名与总大小上限（超出后按最近使用时间淘汰）
+_PREVIEW_CACHE_NAME = 'previews'
+_PREVIEW_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# 缩略图 PNG 中记录精灵原始尺寸的文本字段
+_SOURCE_SIZE_TEXT_KEY = 'source-size'
+
 class AnmScriptHandler(ScriptHandler):
     def __init__(self):
         self.parser = ScriptParser()
@@ -33,6 +55,22 @@ class AnmScriptHandler(ScriptHandler):
         self.auto_refresh_previews: bool = False  # 默认关闭自动刷新以提升性能
         self.refresh_preview_action = None
         self.auto_refresh_action = None
+        # 预览缓存：(图像路径, 文件签名, x, y, w, h, x偏移, y偏移) -> (缩略图 QPixmap, 原始尺寸)；
+        # 每次刷新只保留本次用到的条目，切换文件时清空
+        self._pixmap_cache: dict = {}
+        self._pixmap_cache_file = None
+        # 正在后台运行的 thanm 任务
+        self._tool_task = None
+        # 放入 QPixmapCache 的缩略图对应的原始尺寸（QPixmapCache 只能保存 QPixmap 本身）
+        self._shared_sizes: dict = {}
+        # 缩略图磁盘缓存目录（首次使用时确定，None 表示不可用）及后台清理任务
+        self._disk_preview_dir = None
+        self._disk_preview_checked = False
+        self._prune_task = None
+        # 上次解析时的 (文件路径, 脚本文本)，用于跳过对未变化文本的重复解析
+        self._parsed_key = None
+        # 上次填入快速跳转下拉框的 (类型, 名称, 行号) 列表
+        self._last_jump_blocks = None
     
     def get_name(self) -> str: return "ANM"
     def get_file_filter(self) -> str: return "ANM Scripts (*.txt;*.ddes)"
@@ -58,6 +96,9 @@ class AnmScriptHandler(ScriptHandler):
         self.central_splitter.addWidget(self.preview_pane)
         self.central_splitter.setSizes([900, 500])
         main_window.setCentralWidget(self.central_splitter)
+        # 所有预览项的点击都经由面板的同一个信号转发，只需连接一次
+        self.preview_pane.item_clicked.connect(
+            lambda name, line: self._jump_to_sprite_definition(main_window, name, line))
 
         # 2. 创建并连接 Thanm 工具面板
         self.thanm_panel = ThanmPanel(main_window)
@@ -130,60 +171,89 @@ class AnmScriptHandler(ScriptHandler):
         """
         [REVISED] 此方法现在只负责数据解析和更新 ANM 专用视图。
         """
-        script_text = main_window.text_editor.toPlainText()
+        script_text = main_window.text_editor.plain_text()
         
         # 1. 更新动态高亮规则 (原 TextEditor 逻辑)
         if hasattr(main_window.text_editor.highlighter, 'update_dynamic_rules'):
             main_window.text_editor.highlighter.update_dynamic_rules(script_text)
             
+        if main_window.current_file_path != self._pixmap_cache_file:
+            self._pixmap_cache = {}
+            self._pixmap_cache_file = main_window.current_file_path
+
         # 2. 解析数据 (Handler 自身的核心职责)
         if script_text.strip() and main_window.current_file_path:
-            self.parsed_data = self.parser.parse(script_text)
+            parsed_key = (main_window.current_file_path, script_text)
+            # 文本与文件都未变化（例如手动刷新、重复触发）时沿用上次的解析与预取结果
+            if parsed_key != self._parsed_key or not self.parsed_data:
+                self.parsed_data = self.parser.parse(script_text)
+                # 在后台预取本脚本引用的全部图集，刷新预览时即可直接命中缓存
+                self.image_manager.set_base_path(main_window.current_file_path.parent)
+                self.image_manager.prefetch(
+                    entry.get('image_path') for entry in self.parsed_data.get("entries", {}).values())
+                self._parsed_key = parsed_key
         else:
             self.parsed_data = {}
+            self._parsed_key = None
         
         # 3. 更新 ANM 专用UI (精灵预览)
         if self.auto_refresh_previews:
-            self._update_sprite_previews(main_window)
+            self._update_sprite_previews(main_window, script_text)
         
         # 4. 更新 ANM 专用UI (快速跳转)
         self._update_jump_combo()
 
-    def _update_sprite_previews(self, main_window):
+    def _update_sprite_previews(self, main_window, script_text: str | None = None):
         # 安全检查：预览面板可能未初始化
         if not self.preview_pane:
             return
 
-        script_text = main_window.text_editor.toPlainText()
+        if script_text is None:
+            script_text = main_window.text_editor.plain_text()
         sprite_locations = {}
 
         # 收集所有需要展示的精灵信息，避免边遍历边刷新造成滚动条抖动
         sprites_to_render = []
+        pixmap_cache = {}
+        # 多个 entry 常引用同一张图集：每张图集本次刷新只取一次文件签名
+        signatures = {}
         if self.parsed_data:
             if main_window.current_file_path:
                 self.image_manager.set_base_path(main_window.current_file_path.parent)
             sprite_locations = self.parser.get_all_sprite_locations(script_text)
-            for entry_name, entry_data in self.parsed_data.get("entries", {}).items():
+            entries = self.parsed_data.get("entries", {})
+            # 先让所有尚未缓存的图集同时开始后台读取，随后逐个取用时只需等待各自的结果，
+            # 而不是按 entry 顺序一张张阻塞加载（冷缓存或网络驱动器上差别明显）
+            self.image_manager.prefetch(entry.get('image_path') for entry in entries.values())
+            # 内层循环按精灵数执行，把常用的方法查找提前绑定到局部变量
+            old_cache_get = self._pixmap_cache.get
+            find_shared = self._find_shared_preview
+            make_loader = self._make_preview_loader
+            render = sprites_to_render.append
+            for entry_name, entry_data in entries.items():
                 image_path = entry_data.get('image_path')
                 if not image_path:
                     continue
                 # 获取 entry 全局偏移（支持多种键名以兼容不同解析器输出）
                 x_off = entry_data.get('xOffset', entry_data.get('x_offset', 0))
                 y_off = entry_data.get('yOffset', entry_data.get('y_offset', 0))
-                base_w = entry_data.get('width')
-                base_h = entry_data.get('height')
-                for sprite_name, rect in entry_data.get('sprites', {}).items():
-                    # 使用偏移后“移动裁剪区域”的预览（非画布合成）
-                    pil_img = self.image_manager.get_sprite_image_with_offset(
-                        image_path,
-                        rect,
-                        x_off,
-                        y_off,
-                        base_width=base_w,
-                        base_height=base_h,
-                    )
-                    if pil_img:
-                        sprites_to_render.append((entry_name, sprite_name, pil_img))
+                rects = entry_data.get('sprites', {})
+                # 图像文件的签名参与缓存键，图集在磁盘上被修改后会重新生成预览
+                if image_path in signatures:
+                    signature = signatures[image_path]
+                else:
+                    signature = signatures[image_path] = self.image_manager.file_signature(image_path)
+                for sprite_name, rect in rects.items():
+                    key = (image_path, signature, rect['x'], rect['y'], rect['w'], rect['h'], x_off, y_off)
+                    preview = old_cache_get(key) or find_shared(key)
+                    if preview is not None:
+                        pixmap_cache[key] = preview
+                        render((entry_name, sprite_name, preview, None))
+                    else:
+                        # 未命中缓存的精灵只记录裁剪参数，滚动到可见区域时才真正裁剪
+                        loader = make_loader(pixmap_cache, key, image_path, rect, x_off, y_off)
+                        render((entry_name, sprite_name, (None, None), loader))
+        self._pixmap_cache = pixmap_cache
 
         # 若没有可展示的精灵，显示占位符并结束
         if not sprites_to_render:
@@ -192,35 +262,112 @@ class AnmScriptHandler(ScriptHandler):
             return
 
         # 批量更新，防止滚动条频繁复位
-        self.preview_pane.begin_bulk_update()
+        pane = self.preview_pane
+        pane.begin_bulk_update()
         try:
-            self.preview_pane.clear_previews()
-            for entry_name, sprite_name, pil_img in sprites_to_render:
+            pane.clear_previews()
+            add_preview = pane.add_sprite_preview
+            # 复用上次刷新留下的预览控件，只在不够用时新建
+            acquire = pane.acquire_item
+            location_of = sprite_locations.get
+            for entry_name, sprite_name, (pixmap, source_size), loader in sprites_to_render:
                 full_name = f"{entry_name}/{sprite_name}"
-                pixmap = self._pil_to_qpixmap(pil_img)
-                item = SpritePreviewItem(full_name, pixmap)
-                line_number = sprite_locations.get(full_name)
-                if line_number:
-                    item.clicked.connect(lambda name=full_name, line=line_number: self._jump_to_sprite_definition(main_window, name, line))
-                self.preview_pane.add_sprite_preview(item)
+                add_preview(acquire(full_name, pixmap, source_size=source_size,
+                                    line_number=location_of(full_name), loader=loader))
         finally:
-            self.preview_pane.end_bulk_update()
+            pane.end_bulk_update()
+
+        main_window.statusBar.showMessage(f"刷新完成！共 {len(sprites_to_render)} 个精灵。", 5000)
+
+    def _make_preview_loader(self, pixmap_cache: dict, key: tuple, image_path: str,
+                             rect: dict, x_off: int, y_off: int):
+        """
+        返回一个延迟生成缩略图的函数，供 SpritePreviewItem 在进入可见区域时调用。
+        生成结果写回本次刷新的缓存字典和 QPixmapCache，下次刷新可直接复用。
+        """
+        def load():
+            # 重新打开文件时优先读取磁盘上的缩略图，完全跳过图集解码与裁剪
+            preview = self._load_disk_preview(key)
+            if preview is None:
+                # 使用偏移后“移动裁剪区域”的预览（非画布合成）
+                pil_img = self.image_manager.get_sprite_image_with_offset(image_path, rect, x_off, y_off)
+                if pil_img is None:
+                    return None
+                preview = (self._pil_to_qpixmap(self._shrink_for_preview(pil_img)), QSize(*pil_img.size))
+                self._store_disk_preview(key, preview)
+            self._share_preview(key, preview)
+            pixmap_cache[key] = preview
+            return preview
+        return load
+
+    # ==================================================================
+    # 缩略图磁盘缓存
+    # ==================================================================
+
+    def _disk_preview_path(self, key: tuple) -> Path | None:
+        # 图集签名缺失（文件不存在等）时无法判断缩略图是否过期，不使用磁盘缓存
+        if key[1] is None:
+            return None
+        if not self._disk_preview_checked:
+            self._disk_preview_checked = True
+            self._disk_preview_dir = disk_cache.cache_dir(_PREVIEW_CACHE_NAME)
+            if self._disk_preview_dir is not None:
+                # 每次运行清理一次超出上限的旧缩略图，放在后台以免阻塞界面
+                self._prune_task = run_in_background(
+                    disk_cache.prune, _PREVIEW_CACHE_NAME, _PREVIEW_CACHE_MAX_BYTES)
+        if self._disk_preview_dir is None:
+            return None
+        return self._disk_preview_dir / f"{disk_cache.content_key(self._shared_preview_key(key))}.png"
+
+    def _load_disk_preview(self, key: tuple):
+        path = self._disk_preview_path(key)
+        if path is None:
+            return None
+        image = QImage(str(path))
+        if image.isNull():
+            return None
+        try:
+            width, height = map(int, image.text(_SOURCE_SIZE_TEXT_KEY).split('x'))
+        except ValueError:
+            return None
+        disk_cache.touch(path)
+        return QPixmap.fromImage(image), QSize(width, height)
 
-        main_window.statusBar.showMessage(f"刷新完成！成功加载 {len(sprites_to_render)} 个精灵。", 5000)
+    def _store_disk_preview(self, key: tuple, preview):
+        path = self._disk_preview_path(key)
+        if path is None:
+            return
+        pixmap, source_size = preview
+        image = pixmap.toImage()
+        image.setText(_SOURCE_SIZE_TEXT_KEY, f"{source_size.width()}x{source_size.height()}")
+        # 先写临时文件再替换，避免另一个实例读到写了一半的文件
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            if image.save(str(tmp), "PNG"):
+                os.replace(tmp, path)
+        except OSError:
+            pass
 
     def _update_jump_combo(self):
-        self.jump_combo.clear()
-        self.jump_combo.addItem("快速跳转...")
-        if not self.parsed_data: return
-        all_blocks = []
-        
-        for name, data in self.parsed_data.get("entries", {}).items(): all_blocks.append(("entry", name, data['line']))
-        for name, data in self.parsed_data.get("scripts", {}).items(): all_blocks.append(("script", name, data['line']))
-        all_blocks.sort(key=lambda x: x[2])
-        #print(len(all_blocks))
-        for type, name, line in all_blocks:
-            display_text = f"{type} {name} (行 {line})"
-            self.jump_combo.addItem(display_text, userData=line)
+        # 解析器已按行号排好序
+        all_blocks = self.parsed_data.get("blocks_by_line", []) if self.parsed_data else []
+        # 大多数编辑不会改变块的名称与行号，此时无需重建下拉框
+        if all_blocks == self._last_jump_blocks and self.jump_combo.count() == len(all_blocks) + 1:
+            return
+        self._last_jump_blocks = all_blocks
+
+        self.jump_combo.blockSignals(True)
+        self.jump_combo.setUpdatesEnabled(False)
+        try:
+            self.jump_combo.clear()
+            self.jump_combo.addItem("快速跳转...")
+            #print(len(all_blocks))
+            for type, name, line in all_blocks:
+                display_text = f"{type} {name} (行 {line})"
+                self.jump_combo.addItem(display_text, userData=line)
+        finally:
+            self.jump_combo.setUpdatesEnabled(True)
+            self.jump_combo.blockSignals(False)
 
     # ==================================================================
     # Thanm 工具流槽函数
@@ -237,17 +384,17 @@ class AnmScriptHandler(ScriptHandler):
         if not selected_version:
             QMessageBox.warning(main_window, "提示", "请先在 Thanm 面板中选择一个游戏版本。")
             return
-        try:
-            output_dir = Path(anm_path).with_suffix('')
-            main_window.statusBar.showMessage(f"正在解包到 {output_dir}...")
-            spec_file = tool.unpack_all(selected_version, anm_path, str(output_dir))
+        output_dir = Path(anm_path).with_suffix('')
+        main_window.statusBar.showMessage(f"正在解包到 {output_dir}...")
+
+        def on_finished(spec_file):
             if spec_file and os.path.exists(spec_file):
                 QMessageBox.information(main_window, "成功", f"文件已成功解包到:\n{output_dir}")
                 main_window._load_file_content(Path(spec_file))
             else:
                 QMessageBox.warning(main_window, "警告", "解包操作已执行，但在输出目录中未找到指令文件。")
-        except ThanmError as e:
-            QMessageBox.critical(main_window, "Thanm 错误", f"{e}\n\n详细信息:\n{e.stderr}")
+
+        self._start_tool_task(main_window, on_finished, tool.unpack_all, selected_version, anm_path, str(output_dir))
 
     def on_pack_request(self, main_window):
         if not main_window.current_file_path:
@@ -264,21 +411,86 @@ class AnmScriptHandler(ScriptHandler):
         default_name = main_window.current_file_path.with_suffix('.anm').name
         output_anm, _ = QFileDialog.getSaveFileName(main_window, "选择新 ANM 文件的保存位置", default_name, "ANM Files (*.anm)")
         if not output_anm: return
-        try:
-            main_window.statusBar.showMessage(f"正在打包到 {output_anm}...")
-            tool.create(selected_version, output_anm, str(main_window.current_file_path))
-            QMessageBox.information(main_window, "成功", f"已成功打包文件到:\n{output_anm}")
-        except ThanmError as e:
-            QMessageBox.critical(main_window, "Thanm 错误", f"{e}\n\n详细信息:\n{e.stderr}")
+        main_window.statusBar.showMessage(f"正在打包到 {output_anm}...")
+        self._start_tool_task(
+            main_window,
+            lambda _: QMessageBox.information(main_window, "成功", f"已成功打包文件到:\n{output_anm}"),
+            tool.create, selected_version, output_anm, str(main_window.current_file_path))
+
+    def _start_tool_task(self, main_window, on_finished, fn, *args):
+        """
+        在线程池中运行一次 thanm 调用，避免外部进程运行期间界面卡死。
+        运行期间禁用 Thanm 面板以防重复提交；结束后在主线程中恢复并执行 on_finished(结果)。
+        """
+        if self.thanm_panel:
+            self.thanm_panel.setEnabled(False)
+
+        def done():
+            self._tool_task = None
+            if self.thanm_panel:
+                self.thanm_panel.setEnabled(True)
+
+        def finished(result):
+            done()
+            on_finished(result)
+
+        def failed(error):
+            done()
+            if isinstance(error, ThanmError):
+                QMessageBox.critical(main_window, "Thanm 错误", f"{error}\n\n详细信息:\n{error.stderr}")
+            else:
+                QMessageBox.critical(main_window, "Thanm 错误", f"执行 thanm 时发生错误: {error}")
+
+        # 保留任务引用，直到回调触发
+        self._tool_task = run_in_background(fn, *args, on_finished=finished, on_failed=failed)
 
     # ==================================================================
     # 辅助方法
     # ==================================================================
 
 
+    def _shared_preview_key(self, key: tuple) -> str:
+        # 键中的图像路径是相对路径，需带上基准目录才能在不同文件之间区分
+        return f"anm-thumb|{self.image_manager.base_path}|" + "|".join(map(str, key))
+
+    def _find_shared_preview(self, key: tuple):
+        """从 QPixmapCache 取回之前生成过的缩略图（例如切换回先前打开过的文件时）。"""
+        cache_key = self._shared_preview_key(key)
+        source_size = self._shared_sizes.get(cache_key)
+        if source_size is None:
+            return None
+        pixmap = QPixmapCache.find(cache_key)
+        if pixmap is None or pixmap.isNull():
+            return None
+        return pixmap, source_size
+
+    def _share_preview(self, key: tuple, preview):
+        cache_key = self._shared_preview_key(key)
+        pixmap, self._shared_sizes[cache_key] = preview
+        QPixmapCache.insert(cache_key, pixmap)
+
+    @staticmethod
+    def _shrink_for_preview(pil_image: PILImage) -> PILImage:
+        """把超过 THUMB_MAX 的精灵等比缩小（返回新图像，不修改可能被缓存共享的原图）。"""
+        width, height = pil_image.size
+        longest = max(width, height)
+        if longest <= THUMB_MAX:
+            return pil_image
+        scale = THUMB_MAX / longest
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return pil_image.resize(size, Resampling.BILINEAR)
+
     def _pil_to_qpixmap(self, pil_image: PILImage) -> QPixmap:
-        if pil_image.mode != "RGBA": pil_image = pil_image.convert("RGBA")
-        qimage = QImage(pil_image.tobytes(), pil_image.width, pil_image.height, QImage.Format.Format_RGBA8888)
+        layout = _QIMAGE_LAYOUTS.get(pil_image.mode)
+        if layout is None:
+            # 调色板等其他模式才需要先整体转换
+            pil_image = pil_image.convert("RGBA")
+            layout = _QIMAGE_LAYOUTS["RGBA"]
+        raw_mode, bytes_per_pixel, qformat = layout
+        width, height = pil_image.size
+        # 显式给出行跨度；data 在 fromImage 复制完成前由本地变量持有
+        data = pil_image.tobytes("raw", raw_mode)
+        qimage = QImage(data, width, height, bytes_per_pixel * width, qformat)
         return QPixmap.fromImage(qimage)
 
     def _jump_to_sprite_definition(self, main_window, sprite_name: str, line_number: int):
@@ -1,50 +1,119 @@
 # app/handlers/ecl_handler.py
 
+from functools import partial
 from pathlib import Path
-import hashlib
-from PyQt6.QtCore import Qt
+from typing import NamedTuple
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtWidgets import QFileDialog, QMessageBox
 import json
+import os
 import re
+import sys
+from ..core.background import run_in_background
+from ..core.reference_data import load_derived, read_json
 from ..core.script_handler import ScriptHandler
 from ..core.thecl_wrapper import TheclWrapper, TheclError
 # 我们需要为ECL创建一个新的高亮器，现在先用一个占位符
 from ..widgets.ecl_syntax_highlighter import EclSyntaxHighlighter 
 from PyQt6.QtGui import QSyntaxHighlighter # 临时使用基础高亮器
 from ..widgets.thecl_panel import TheclPanel
+# 设置环境变量 THTK_STUDIO_DEBUG 后输出文档加载等信息性日志；警告与错误始终输出
+_DEBUG = bool(os.environ.get("THTK_STUDIO_DEBUG"))
+
+# 内置资源目录：打包环境下位于 _MEIPASS，开发环境下位于项目根目录（与 Settings 的查找方式一致），
+# 不依赖当前工作目录
+_RESOURCE_DIR = Path(getattr(sys, '_MEIPASS', Path(__file__).resolve().parent.parent.parent)) / 'resources'
+
+# 大纲符号的类型
+FUNCTION_TYPE = "function"
+LABEL_TYPE = "label"
+
+
+class Symbol(NamedTuple):
+    """大纲中的一个符号（函数或标签定义）。元组比逐个创建字典更轻，且可直接比较。"""
+    name: str
+    type: str   # FUNCTION_TYPE / LABEL_TYPE
+    line: int   # 行号，从 1 开始
+
+
+# 从签名中提取指令名（去掉类型/参数），例如 "callAsyncId(string sub, int id)" -> "callAsyncId"
+_SIG_NAME_RE = re.compile(r'@?([A-Za-z_]\w*)')
+
+
+def _build_instruction_docs(data: dict) -> dict:
+    """
+    把 thecl_ref.json 的内容整理为 {指令名: (签名, 描述)}，键标准化为指令名（非数字ID）。
+    HTML 由高亮器在悬停查询时通过 render_doc 生成，加载时不为每条指令拼接字符串。
+    """
+    docs = {}
+    # 兼容多种数据结构：
+    # thecl_ref.json 通常是 { "id": ["name(args)", "desc"] }
+    # 也容许 { key: {signature, description} } 或 { key: "desc" }
+    for key, value in data.items():
+        sig = None
+        desc = None
+        if isinstance(value, list):
+            if len(value) >= 1:
+                sig = value[0]
+            if len(value) >= 2:
+                desc = value[1]
+        elif isinstance(value, dict):
+            sig = value.get('signature') or value.get('name')
+            desc = value.get('description') or value.get('doc')
+        elif isinstance(value, str):
+            # 只有描述，没有签名时，用 key 作为签名回退
+            desc = value
+            sig = str(key)
+
+        if not sig and not desc:
+            continue
+
+        sig_text = str(sig) if sig else ""
+        desc_text = str(desc) if desc else ""
+        entry = (sig_text, desc_text)
+
+        # 若签名是形如 "ins_18(int id)"，则得到 "ins_18"；
+        # 每条指令只登记原始写法，大小写不同的写法由高亮器忽略大小写匹配
+        m = _SIG_NAME_RE.match(sig_text)
+        if m:
+            docs[m.group(1)] = entry
+
+        # 额外：如果原始 key 是数字 ID，也登记一个 "ins_<id>" 的别名，以便未映射时也能匹配
+        if str(key).isdigit():
+            docs[f"ins_{key}"] = entry
+    return docs
+
+
 class EclParser:
     """
     一个用于解析ECL脚本，提取函数和标签定义的解析器。
     """
-    # 匹配 void FunctionName(...)
-    FUNCTION_RE = re.compile(r'^\s*void\s+([a-zA-Z_]\w+)\s*\(')
-    # 匹配 LabelName:
-    LABEL_RE = re.compile(r'^\s*([a-zA-Z_]\w+):')
+    # 一次匹配同时识别 void FunctionName(...)（第 1 组）与 LabelName:（第 2 组）；
+    # 函数分支在前，保持“函数定义优先”的判定顺序
+    SYMBOL_RE = re.compile(r'^\s*(?:void\s+([a-zA-Z_]\w+)\s*\(|([a-zA-Z_]\w+):)')
 
-    def parse(self, text: str) -> dict:
+    @staticmethod
+    def _may_define_symbol(line: str) -> bool:
         """
-        解析文本，返回一个包含所有符号（函数和标签）的列表。
+        廉价的预筛选：函数定义去掉缩进后必以 void 开头，标签行必含 ':'。
+        绝大多数指令行两者都不满足，无需进入正则引擎。
         """
-        symbols = []
-        for line_num, line in enumerate(text.splitlines(), 1): # 行号从1开始
-            func_match = self.FUNCTION_RE.match(line)
-            if func_match:
-                symbols.append({
-                    "name": func_match.group(1),
-                    "type": "function",
-                    "line": line_num
-                })
-                continue # 函数定义优先
-
-            label_match = self.LABEL_RE.match(line)
-            if label_match:
-                symbols.append({
-                    "name": label_match.group(1),
-                    "type": "label",
-                    "line": line_num
-                })
-        
-        return {"symbols": symbols}
+        stripped = line.lstrip()
+        return stripped.startswith('void') or ':' in stripped
+
+    def scan_line(self, line: str):
+        """匹配单行，返回 (名称, 类型) 或 None；供按行增量更新大纲使用。"""
+        if not self._may_define_symbol(line):
+            return None
+        m = self.SYMBOL_RE.match(line)
+        if m is None:
+            return None
+        function_name, label_name = m.groups()
+        if function_name is not None:
+            return function_name, FUNCTION_TYPE
+        return label_name, LABEL_TYPE
+
+
 class EclScriptHandler(ScriptHandler):
     """
     ECL 脚本的具体处理器。
@@ -55,17 +124,29 @@ class EclScriptHandler(ScriptHandler):
         self.tool_panel: TheclPanel | None = None
         # ECL脚本的指令集通常在eclmap文件中，暂时不需要像MSG那样加载
         self.instruction_docs = {}
+        # 指令文档每次重新加载时递增；记录已应用到哪个高亮器的哪个版本，
+        # 未变化时不再重建高亮规则并整篇重绘
+        self._docs_version = 0
+        self._docs_applied = None
+        # 当前文档来自的缓存结果；重新选择同一个未修改的文件时 load_derived 返回同一对象
+        self._docs_source = None
         self.builtin_variables = []
         try:
-            # 假设文件在 resources 目录下
-            with open('./resources/ecl_variables.json', 'r', encoding='utf-8') as f:
-                self.builtin_variables = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+            self.builtin_variables = read_json(_RESOURCE_DIR / 'ecl_variables.json')
+        except (OSError, json.JSONDecodeError) as e:
             print(f"警告：无法加载内置变量文件: {e}")
 
         self.parser = EclParser()
-        # 记录上一次用于大纲的文本指纹，避免重复刷新导致折叠状态被重置
-        self._last_outline_fingerprint = None
+        # 增量大纲：按文本块（行）保存的符号 [(名称, 类型) 或 None]，None 表示需要整篇重新扫描；
+        # 编辑时只重新匹配 contentsChange 涉及的行
+        self._outline_document = None
+        self._line_symbols = None
+        # 上一次交给大纲的符号列表，未变化时不刷新，避免折叠状态被重置
+        self._last_outline_symbols = None
+        # 尚未展示的 thecl 警告；同一轮事件循环内的多条警告合并为一个对话框
+        self._pending_tool_warnings = []
+        # 正在后台运行的 thecl 任务
+        self._tool_task = None
 
     # ==================================================================
     # ScriptHandler 接口实现
@@ -103,7 +184,10 @@ class EclScriptHandler(ScriptHandler):
             return None
         try:
             # Eclmap路径是可选的，所以可以为None
-            return TheclWrapper(thecl_path, eclmap_path)
+            # 每次调用都新建实例：警告信号属于当前工具面板，不能挂在跨面板共享的实例上，
+            # 否则 clear_ui 删除面板后后台任务仍会向已销毁的对象发射信号
+            warning_signal = self.tool_panel.tool_warning if self.tool_panel else None
+            return TheclWrapper(thecl_path, eclmap_path, warning_signal=warning_signal)
         except FileNotFoundError as e:
             print(f"ECL Wrapper Error: {e}")
             return None
@@ -133,6 +217,14 @@ class EclScriptHandler(ScriptHandler):
         """
         清理 ECL 处理器的UI。
         """
+        if self._outline_document is not None:
+            try:
+                self._outline_document.contentsChange.disconnect(self._on_contents_change)
+            except TypeError:
+                pass
+            self._outline_document = None
+        self._line_symbols = None
+
         # 优先移除右侧创建的结构大纲 Dock，避免切换处理器后残留堆积
         if hasattr(self, "_outline_dock") and getattr(self, "_outline_dock") is not None:
             try:
@@ -154,6 +246,11 @@ class EclScriptHandler(ScriptHandler):
         """
         [REVISED] 连接信号，包括大纲视图的跳转请求。
         """
+        # 大纲面板是新建的：下次更新时整篇扫描一次，之后按编辑增量维护
+        self._outline_document = main_window.text_editor.document()
+        self._outline_document.contentsChange.connect(self._on_contents_change)
+        self._line_symbols = None
+        self._last_outline_symbols = None
         if self.tool_panel:
             # ... (路径设置和打包/解包信号连接保持不变) ...
             self.tool_panel.set_thecl_path(main_window.settings.get_thecl_path())
@@ -194,6 +291,26 @@ class EclScriptHandler(ScriptHandler):
             self.tool_panel.outline_jump_requested.connect(
                 lambda line: self.on_jump_to_line(main_window, line)
             )
+            # thecl 警告排队到事件循环中展示，不阻塞正在执行的打包/解包
+            self.tool_panel.tool_warning.connect(
+                lambda title, msg: self._on_tool_warning(main_window, title, msg),
+                Qt.ConnectionType.QueuedConnection,
+            )
+
+    def _on_tool_warning(self, main_window, title: str, msg: str):
+        """收集 thecl 警告，并在当前事件处理结束后合并展示。"""
+        self._pending_tool_warnings.append((title, msg))
+        if len(self._pending_tool_warnings) == 1:
+            QTimer.singleShot(0, lambda: self._flush_tool_warnings(main_window))
+
+    def _flush_tool_warnings(self, main_window):
+        warnings, self._pending_tool_warnings = self._pending_tool_warnings, []
+        if not warnings:
+            return
+        title = warnings[0][0]
+        if len(warnings) > 1:
+            title = f"{title} ({len(warnings)} 条)"
+        QMessageBox.warning(main_window, title, "\n\n".join(msg for _, msg in warnings))
 
     def update_views(self, main_window):
         """
@@ -202,20 +319,60 @@ class EclScriptHandler(ScriptHandler):
         # vvvvvvvvvvvvvv 核心修复 vvvvvvvvvvvvvv
         # 不再访问 main_window.parser，而是使用 self.parser
         if self.parser and self.tool_panel:
-            text = main_window.text_editor.toPlainText()
-            # 计算稳定指纹（文本变更才更新大纲）
-            fingerprint = hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
-            if fingerprint == self._last_outline_fingerprint:
+            if self._line_symbols is None:
+                self._rescan_outline(main_window.text_editor.document())
+            # 符号（含行号）未变化时不刷新大纲
+            symbols = [Symbol(entry[0], entry[1], line)
+                       for line, entry in enumerate(self._line_symbols, 1) if entry is not None]
+            if symbols == self._last_outline_symbols:
                 return
-            self._last_outline_fingerprint = fingerprint
+            self._last_outline_symbols = symbols
 
-            parsed_data = self.parser.parse(text)
-            symbols = parsed_data.get("symbols", [])
             self.tool_panel.update_outline(symbols)
 
             # 确保当前高亮器持有最新的文档（例如首次载入时）
             self._apply_docs_to_highlighter(main_window)
 
+    def _rescan_outline(self, document):
+        """整篇扫描文档，重建按行保存的符号表。"""
+        scan = self.parser.scan_line
+        symbols = []
+        block = document.begin()
+        while block.isValid():
+            symbols.append(scan(block.text()))
+            block = block.next()
+        self._line_symbols = symbols
+
+    def _on_contents_change(self, position: int, removed: int, added: int):
+        """
+        文档内容变化时，只重新匹配受影响的行，并把其后的行整体平移到新行号上。
+        修改后文档中 [position, position + added] 覆盖的块即为变化后的行；
+        块总数的差值给出被替换掉的旧行数。
+        """
+        line_symbols = self._line_symbols
+        if line_symbols is None:
+            return
+        document = self._outline_document
+        first = document.findBlock(position)
+        last = document.findBlock(position + added)
+        if not last.isValid():
+            last = document.lastBlock()
+        if not first.isValid():
+            first = last
+        first_no, last_no = first.blockNumber(), last.blockNumber()
+        old_last_no = last_no - (document.blockCount() - len(line_symbols))
+        if first_no > last_no or old_last_no < first_no - 1 or old_last_no >= len(line_symbols):
+            # 记录与文档不一致（不应发生），下次更新时整篇重扫
+            self._line_symbols = None
+            return
+        scan = self.parser.scan_line
+        changed = []
+        block = first
+        while block.isValid() and block.blockNumber() <= last_no:
+            changed.append(scan(block.text()))
+            block = block.next()
+        line_symbols[first_no:old_last_no + 1] = changed
+
     # ==================================================================
     # 新增槽函数
     # ==================================================================
@@ -239,65 +396,32 @@ class EclScriptHandler(ScriptHandler):
 
     def _load_instruction_docs(self, file_path: str):
         """从 thecl_ref.json 加载指令文档，并将键标准化为指令名（非数字ID）。"""
-        self.instruction_docs.clear()
-        if not file_path:
+        docs = None
+        if file_path:
+            try:
+                # 解析结果按文件签名缓存（进程内及用户缓存目录），重复切换处理器或重启时无需重新解析
+                docs = load_derived(file_path, _build_instruction_docs)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"错误: 无法加载或解析 ECL 帮助文档 '{file_path}': {e}")
+        if docs is not None and docs is self._docs_source:
+            # 同一个文件且未被修改：文档不变，版本号也不变，高亮器无需重建规则与重绘
             return
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except (OSError, json.JSONDecodeError) as e:
-            print(f"错误: 无法加载或解析 ECL 帮助文档 '{file_path}': {e}")
+        self._docs_source = docs
+        self.instruction_docs.clear()
+        self._docs_version += 1
+        if docs is None:
             return
+        # 保持字典对象不变（高亮器持有其引用），复制共享的缓存结果
+        self.instruction_docs.update(docs)
 
-        # 兼容多种数据结构：
-        # thecl_ref.json 通常是 { "id": ["name(args)", "desc"] }
-        # 也容许 { key: {signature, description} } 或 { key: "desc" }
-        for key, value in data.items():
-            sig = None
-            desc = None
-            if isinstance(value, list):
-                if len(value) >= 1:
-                    sig = value[0]
-                if len(value) >= 2:
-                    desc = value[1]
-            elif isinstance(value, dict):
-                sig = value.get('signature') or value.get('name')
-                desc = value.get('description') or value.get('doc')
-            elif isinstance(value, str):
-                # 只有描述，没有签名时，用 key 作为签名回退
-                desc = value
-                sig = str(key)
-
-            if not sig and not desc:
-                continue
-
-            # 构造 HTML
-            sig_text = str(sig) if sig else ""
-            desc_text = str(desc) if desc else ""
-            doc_html = f"<b>{sig_text}</b><br>{desc_text}" if sig_text else desc_text
-
-            # 从签名中提取指令名（去掉类型/参数），例如 "callAsyncId(string sub, int id)" -> "callAsyncId"
-            # 若签名是形如 "ins_18(int id)"，则得到 "ins_18"
-            m = re.match(r'@?([A-Za-z_]\w*)', sig_text)
-            if m:
-                name = m.group(1)
-                # 注册多种大小写形态，便于匹配
-                for k in {name, name.lower(), name.upper()}:
-                    self.instruction_docs[k] = doc_html
-
-            # 额外：如果原始 key 是数字 ID，也登记一个 "ins_<id>" 的别名，以便未映射时也能匹配
-            if str(key).isdigit():
-                ins_alias = f"ins_{key}"
-                self.instruction_docs[ins_alias] = doc_html
-                self.instruction_docs[ins_alias.lower()] = doc_html
-                self.instruction_docs[ins_alias.upper()] = doc_html
-
-        print(f"ECL 指令文档已加载，共 {len(self.instruction_docs)} 条（含别名）。")
+        if _DEBUG:
+            print(f"ECL 指令文档已加载，共 {len(self.instruction_docs)} 条（含别名）。")
 
     def _apply_docs_to_highlighter(self, main_window):
         #print("[DEBUG] 应用 ECL 指令文档到高亮器...")
         hl = getattr(main_window.text_editor, 'highlighter', None)
-        if hl:
+        if hl and self._docs_applied != (hl, self._docs_version):
+            self._docs_applied = (hl, self._docs_version)
             # 首选：调用高亮器提供的动态更新接口，触发规则重建
             set_docs = getattr(hl, 'set_instruction_docs', None)
             if callable(set_docs):
@@ -343,20 +467,20 @@ class EclScriptHandler(ScriptHandler):
         # 从面板获取解包的额外选项
         unpack_options = self.tool_panel.get_unpack_options()
         
-        try:
-            main_window.statusBar.showMessage(f"正在解包 {Path(ecl_file).name}...", 5000)
-            # 将选项作为关键字参数传递给 wrapper 的 unpack 方法
-            tool.unpack(
-                version, 
-                ecl_file, 
-                str(output_txt), 
-                use_address_info=unpack_options.get("use_address_info", False),
-                raw_dump=unpack_options.get("raw_dump", False)
-            )
+        def on_finished(_):
             QMessageBox.information(main_window, "成功", f"文件已成功解包到:\n{output_txt}")
             main_window._load_file_content(output_txt)
-        except TheclError as e:
-            QMessageBox.critical(main_window, "Thecl 错误", f"解包失败: {e}\n\n详细信息:\n{e.stderr}")
+
+        main_window.statusBar.showMessage(f"正在解包 {Path(ecl_file).name}...", 5000)
+        # 将选项作为关键字参数传递给 wrapper 的 unpack 方法
+        self._start_tool_task(main_window, "解包", on_finished, partial(
+            tool.unpack,
+            version, 
+            ecl_file, 
+            str(output_txt), 
+            use_address_info=unpack_options.get("use_address_info", False),
+            raw_dump=unpack_options.get("raw_dump", False)
+        ))
 
     def on_pack_request(self, main_window):
         """响应“打包当前脚本”按钮。"""
@@ -381,15 +505,43 @@ class EclScriptHandler(ScriptHandler):
         # 从面板获取打包的额外选项
         pack_options = self.tool_panel.get_pack_options()
 
-        try:
-            main_window.statusBar.showMessage(f"正在打包到 {Path(output_ecl).name}...", 5000)
-            # 将选项作为关键字参数传递给 wrapper 的 pack 方法
-            tool.pack(
+        main_window.statusBar.showMessage(f"正在打包到 {Path(output_ecl).name}...", 5000)
+        # 将选项作为关键字参数传递给 wrapper 的 pack 方法
+        self._start_tool_task(
+            main_window, "打包",
+            lambda _: QMessageBox.information(main_window, "成功", f"文件已成功打包到:\n{output_ecl}"),
+            partial(
+                tool.pack,
                 version, 
                 str(main_window.current_file_path), 
                 output_ecl,
                 simple_mode=pack_options.get("simple_mode", False)
-            )
-            QMessageBox.information(main_window, "成功", f"文件已成功打包到:\n{output_ecl}")
-        except TheclError as e:
-            QMessageBox.critical(main_window, "Thecl 错误", f"打包失败: {e}\n\n详细信息:\n{e.stderr}")
\ No newline at end of file
+            ))
+
+    def _start_tool_task(self, main_window, action: str, on_finished, fn, *args):
+        """
+        在线程池中运行一次 thecl 调用，避免外部进程运行期间界面卡死。
+        运行期间禁用 ECL 面板以防重复提交；结束后在主线程中恢复并执行 on_finished(结果)。
+        action 为 "解包" / "打包"，用于错误提示。
+        """
+        if self.tool_panel:
+            self.tool_panel.setEnabled(False)
+
+        def done():
+            self._tool_task = None
+            if self.tool_panel:
+                self.tool_panel.setEnabled(True)
+
+        def finished(result):
+            done()
+            on_finished(result)
+
+        def failed(error):
+            done()
+            if isinstance(error, TheclError):
+                QMessageBox.critical(main_window, "Thecl 错误", f"{action}失败: {error}\n\n详细信息:\n{error.stderr}")
+            else:
+                QMessageBox.critical(main_window, "Thecl 错误", f"执行 thecl 时发生错误: {error}")
+
+        # 保留任务引用，直到回调触发
+        self._tool_task = run_in_background(fn, *args, on_finished=finished, on_failed=failed)
\ No newline at end of file
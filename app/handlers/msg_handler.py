@@ -1,15 +1,36 @@
 # app/handlers/msg_handler.py
 
+from functools import partial
 from pathlib import Path
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import QWidget, QFileDialog, QMessageBox
 import json
+import os
 import re
+from ..core.background import run_in_background
+from ..core.reference_data import load_derived
 from ..core.script_handler import ScriptHandler
-from ..core.thmsg_wrapper import ThmsgWrapper, ThmsgError
+from ..core.thmsg_wrapper import ThmsgWrapper, ThmsgError, get_thmsg_wrapper
 from ..widgets.msg_syntax_highlighter import MsgSyntaxHighlighter
 from ..widgets.thmsg_panel import MsgToolPanel
 
+# 设置环境变量 THTK_STUDIO_DEBUG 后输出 thmsg 的原始错误输出等调试日志
+_DEBUG = bool(os.environ.get("THTK_STUDIO_DEBUG"))
+
+# 从 "name(args)" 形式的签名中提取指令名
+_SIG_NAME_RE = re.compile(r'(\w+)\(.*\)')
+
+def _build_instruction_docs(raw_data: dict) -> dict:
+    """把 msg 指令参考表 {"id": ["name(args)", "desc"]} 整理为 {指令名: HTML 文档}。"""
+    docs = {}
+    match_name = _SIG_NAME_RE.match
+    for key, value in raw_data.items():
+        full_name, description = value[0], value[1]
+        name_match = match_name(full_name)
+        if name_match:
+            docs[name_match.group(1)] = f"<b>{full_name}</b><br>{description}"
+    return docs
+
 class MsgScriptHandler(ScriptHandler):
     """
     MSG 脚本的具体处理器。
@@ -22,16 +43,13 @@ class MsgScriptHandler(ScriptHandler):
         # 处理器自身维护其UI组件的引用
         self.tool_panel: MsgToolPanel | None = None
         self.instruction_docs = {}
+        # 当前文档来自的缓存结果；同一个未修改的文件再次加载时 load_derived 返回同一对象
+        self._docs_source = None
+        # 正在后台运行的 thmsg 任务
+        self._tool_task = None
     # ==================================================================
     # ScriptHandler 接口实现
     # ==================================================================
-    def create_highlighter(self, document):
-        """
-        创建 MsgSyntaxHighlighter 实例，并注入指令文档。
-        """
-        # 注意：这里我们还没有加载数据，所以先传入一个空字典。
-        # 真实的数据将在 connect_signals 中加载。
-        return MsgSyntaxHighlighter(document, self.instruction_docs)
     def get_name(self) -> str:
         return "MSG"
 
@@ -59,7 +77,7 @@ class MsgScriptHandler(ScriptHandler):
         if not thmsg_path or not ref_path:
             return None
         try:
-            return ThmsgWrapper(thmsg_path, ref_path)
+            return get_thmsg_wrapper(thmsg_path, ref_path)
         except FileNotFoundError as e:
             QMessageBox.critical(None, "路径错误", str(e))
             return None
@@ -91,12 +109,13 @@ class MsgScriptHandler(ScriptHandler):
             self._load_instruction_docs(ref_path_str)
         else:
             print("警告: MSG 指令集路径未设置，悬停提示将不可用。")
+            self._docs_source = None
             self.instruction_docs.clear()
         
-        # 2. 如果高亮器已经创建，则更新它的字典
+        # 2. 如果高亮器已经创建，则更新它的字典。
+        #    MSG 的着色规则不依赖指令文档（文档只用于补全与悬停提示），无需整篇 rehighlight
         if main_window.text_editor.highlighter:
             main_window.text_editor.highlighter.instruction_docs = self.instruction_docs
-            main_window.text_editor.highlighter.rehighlight()
 
         # 3. 连接工具面板的信号
         if self.tool_panel:
@@ -151,18 +170,19 @@ class MsgScriptHandler(ScriptHandler):
         editor.setFocus() # 确保编辑器获得焦点
     def _load_instruction_docs(self, file_path: str):
         """从给定的JSON文件路径加载并解析指令文档。"""
-        self.instruction_docs.clear()
         try:
-            with open(file_path, "r", encoding='utf-8') as f:
-                raw_data = json.load(f)
-            for key, value in raw_data.items():
-                full_name, description = value[0], value[1]
-                name_match = re.match(r'(\w+)\(.*\)', full_name)
-                if name_match:
-                    instruction_name = name_match.group(1)
-                    self.instruction_docs[instruction_name] = f"<b>{full_name}</b><br>{description}"
+            # 解析结果按文件签名缓存；复制一份，避免修改共享的缓存结果
+            docs = load_derived(file_path, _build_instruction_docs)
         except (FileNotFoundError, json.JSONDecodeError) as e:
             print(f"错误: 无法加载或解析MSG指令集 '{file_path}': {e}")
+            docs = None
+        if docs is not None and docs is self._docs_source:
+            # 同一个文件且未被修改，现有文档无需重建
+            return
+        self._docs_source = docs
+        self.instruction_docs.clear()
+        if docs is not None:
+            self.instruction_docs.update(docs)
     def update_views(self, main_window):
         """MSG 脚本没有复杂的视图需要更新，所以这个方法什么都不做。"""
         # No operation needed for MSG script type when text changes.
@@ -190,18 +210,15 @@ class MsgScriptHandler(ScriptHandler):
         unpack_encoding = self.tool_panel.get_unpack_encoding()
         # --- END MODIFICATION ---
         
-        try:
-            main_window.statusBar.showMessage(f"正在解包 {Path(msg_file).name}...", 5000)
-            
-            # --- [MODIFICATION] 将模式传递给 unpack 方法 ---
-            # (你需要确保你的 ThmsgWrapper.unpack 方法也接受 mode 参数)
-            tool.unpack(version, msg_file, str(output_txt), mode=unpack_mode, encoding=unpack_encoding)
-            # --- END MODIFICATION ---
-            
+        def on_finished(_):
             QMessageBox.information(main_window, "成功", f"文件已成功解包到:\n{output_txt}")
             main_window._load_file_content(output_txt)
-        except ThmsgError as e:
-            QMessageBox.critical(main_window, "Thmsg 错误", f"解包失败: {e}\n\n详细信息:\n{e.stderr}")
+
+        main_window.statusBar.showMessage(f"正在解包 {Path(msg_file).name}...", 5000)
+        # --- [MODIFICATION] 将模式传递给 unpack 方法 ---
+        self._start_tool_task(main_window, "解包", on_finished, partial(
+            tool.unpack, version, msg_file, str(output_txt), mode=unpack_mode, encoding=unpack_encoding))
+        # --- END MODIFICATION ---
 
     def on_pack_request(self, main_window):
         """响应“打包当前脚本”按钮。"""
@@ -221,11 +238,39 @@ class MsgScriptHandler(ScriptHandler):
             
         version = self.tool_panel.get_selected_version()
         pack_encoding = self.tool_panel.get_pack_encoding()
-        try:
-            main_window.statusBar.showMessage(f"正在打包到 {Path(output_msg).name}...", 5000)
-            tool.pack(version, str(main_window.current_file_path), output_msg, encoding=pack_encoding)
-            QMessageBox.information(main_window, "成功", f"文件已成功打包到:\n{output_msg}")
-        except ThmsgError as e:
-            QMessageBox.critical(main_window, "Thmsg 错误", f"打包失败: {e}\n详细信息:\n{e.stderr}")
-            print("stderr:",e.stderr)
-            print("message:",str(e))
\ No newline at end of file
+        main_window.statusBar.showMessage(f"正在打包到 {Path(output_msg).name}...", 5000)
+        self._start_tool_task(
+            main_window, "打包",
+            lambda _: QMessageBox.information(main_window, "成功", f"文件已成功打包到:\n{output_msg}"),
+            partial(tool.pack, version, str(main_window.current_file_path), output_msg, encoding=pack_encoding))
+
+    def _start_tool_task(self, main_window, action: str, on_finished, fn, *args):
+        """
+        在线程池中运行一次 thmsg 调用，避免外部进程运行期间界面卡死。
+        运行期间禁用 MSG 面板以防重复提交；结束后在主线程中恢复并执行 on_finished(结果)。
+        action 为 "解包" / "打包"，用于错误提示。
+        """
+        if self.tool_panel:
+            self.tool_panel.setEnabled(False)
+
+        def done():
+            self._tool_task = None
+            if self.tool_panel:
+                self.tool_panel.setEnabled(True)
+
+        def finished(result):
+            done()
+            on_finished(result)
+
+        def failed(error):
+            done()
+            if isinstance(error, ThmsgError):
+                QMessageBox.critical(main_window, "Thmsg 错误", f"{action}失败: {error}\n详细信息:\n{error.stderr}")
+                if _DEBUG:
+                    print("stderr:", error.stderr)
+                    print("message:", str(error))
+            else:
+                QMessageBox.critical(main_window, "Thmsg 错误", f"执行 thmsg 时发生错误: {error}")
+
+        # 保留任务引用，直到回调触发
+        self._tool_task = run_in_background(fn, *args, on_finished=finished, on_failed=failed)
\ No newline at end of file
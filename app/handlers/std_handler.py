@@ -1,17 +1,58 @@
 # app/handlers/std_handler.py
 
 import json
-import re
 from pathlib import Path
+from types import MappingProxyType
 
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import QFileDialog, QMessageBox
 
+from ..core.reference_data import load_derived
 from ..core.script_handler import ScriptHandler
-from ..core.thstd_wrapper import ThstdWrapper, ThstdError
+from ..core.thstd_wrapper import ThstdWrapper, ThstdError, get_thstd_wrapper
 from ..widgets.std_syntax_highlighter import StdSyntaxHighlighter
 from ..widgets.thstd_panel import ThstdPanel
 
+# 未加载任何指令文档时使用的空视图
+_NO_DOCS = MappingProxyType({})
+
+def _build_instruction_docs(raw_data: dict) -> dict:
+    """
+    把 thstd_ref.json 整理为 {指令名: HTML 文档}。
+    文件格式示例: {"ins_0": ["SetSpeed(speed, time)", "设置速度"], ...}
+    """
+    docs = {}
+    for key, value in raw_data.items():
+        if not isinstance(value, list) or len(value) < 2:
+            continue
+        full_name, description = value[0], value[1]
+        # 提取 "name(args)" 中的指令名 (如 SetSpeed)：'(' 之前须是非空的单词字符，且同一行内有 ')'
+        paren = full_name.find('(')
+        if paren <= 0:
+            continue
+        name = full_name[:paren]
+        if not name.replace('_', 'a').isalnum():
+            continue
+        close = full_name.find(')', paren)
+        if close == -1 or '\n' in full_name[paren:close]:
+            continue
+        docs[name] = f"<b>{full_name}</b><br>{description}"
+    return docs
+
+def prewarm_instruction_docs(file_path: str) -> None:
+    """预先解析指令集并填充 load_derived 的缓存，之后切换到 STD 时可直接命中。可在后台线程调用。"""
+    try:
+        load_derived(file_path, _build_instruction_docs)
+    except (OSError, json.JSONDecodeError):
+        # 加载失败时不做处理，真正切换到 STD 时会再次尝试并报告错误
+        pass
+
+class _DummyParser:
+    """无状态的占位解析器，所有 STD 处理器实例共用一个。"""
+    def parse(self, text): return {}
+
+_DUMMY_PARSER = _DummyParser()
+
 class StdScriptHandler(ScriptHandler):
     """
     STD 脚本的具体处理器。
@@ -19,8 +60,14 @@ class StdScriptHandler(ScriptHandler):
     """
 
     def __init__(self):
-        self.instruction_docs = {}
+        # 指令文档的只读视图，直接包装 load_derived 的共享缓存结果；文档变化时整体替换而不是就地修改，
+        # 因此高亮器（包括在后台线程运行的语法检查）读到的总是完整的一份
+        self.instruction_docs = _NO_DOCS
+        # 当前文档来自的缓存结果；同一个未修改的文件再次加载时 load_derived 返回同一对象
+        self._docs_source = None
         self.tool_panel: ThstdPanel | None = None
+        # connect_signals 时记录的主窗口，供面板信号的槽函数使用
+        self._main_window = None
 
     # ==================================================================
     # ScriptHandler 接口实现
@@ -44,9 +91,7 @@ class StdScriptHandler(ScriptHandler):
         为 STD 创建一个虚拟解析器。
         目前不需要复杂的解析来支持额外视图（如精灵预览或快速跳转）。
         """
-        class DummyParser:
-            def parse(self, text): return {}
-        return DummyParser()
+        return _DUMMY_PARSER
 
     def create_tool_wrapper(self, settings):
         """创建并返回 ThstdWrapper 的实例。"""
@@ -57,7 +102,7 @@ class StdScriptHandler(ScriptHandler):
             # 可以在实际使用工具时再提示。
             return None
         try:
-            return ThstdWrapper(thstd_path, ref_path)
+            return get_thstd_wrapper(thstd_path, ref_path)
         except FileNotFoundError as e:
             print(f"STD Wrapper Error: {e}")
             return None
@@ -80,6 +125,7 @@ class StdScriptHandler(ScriptHandler):
             main_window.removeDockWidget(self.tool_panel)
             self.tool_panel.deleteLater()
             self.tool_panel = None
+        self._main_window = None
 
     def connect_signals(self, main_window):
         """
@@ -91,33 +137,34 @@ class StdScriptHandler(ScriptHandler):
             self.tool_panel.set_thstd_path(main_window.settings.get_thstd_path())
             self.tool_panel.set_ref_path(main_window.settings.get_std_ref_path())
 
+            # 槽函数直接连接到绑定方法，所需的主窗口引用保存在处理器上
+            self._main_window = main_window
             # 连接路径变化信号以保存设置
-            self.tool_panel.thstd_path_changed.connect(
-                lambda path: main_window.settings.set_user_path("user_thstd_path", path)
-            )
+            self.tool_panel.thstd_path_changed.connect(self._save_thstd_path)
             # 保存指令集 JSON 路径
-            self.tool_panel.ref_path_changed.connect(
-                lambda path: main_window.settings.set_user_path("user_std_ref_path", path)
-            )
+            self.tool_panel.ref_path_changed.connect(self._save_ref_path)
 
             # 连接功能信号
-            self.tool_panel.unpack_requested.connect(lambda: self.on_unpack_request(main_window))
-            self.tool_panel.pack_requested.connect(lambda: self.on_pack_request(main_window))
+            self.tool_panel.unpack_requested.connect(self._on_unpack_clicked)
+            self.tool_panel.pack_requested.connect(self._on_pack_clicked)
 
         # 2. 从 settings 获取指令集路径并加载
         ref_path_str = main_window.settings.get_std_ref_path()
         if ref_path_str:
-            self._load_instruction_docs(ref_path_str)
+            docs_changed = self._load_instruction_docs(ref_path_str)
         else:
             print("警告: STD 指令集路径 (thstd_ref.json) 未设置，悬停提示和补全将不可用。")
-            self.instruction_docs.clear()
+            docs_changed = bool(self.instruction_docs)
+            self._docs_source = None
+            self.instruction_docs = _NO_DOCS
 
         # 3. 更新已存在的高亮器实例
         highlighter = main_window.text_editor.highlighter
         if isinstance(highlighter, StdSyntaxHighlighter):
             highlighter.instruction_docs = self.instruction_docs
-            # 触发一次重新高亮以应用新加载的指令
-            highlighter.rehighlight()
+            # 指令集有变化时触发一次重新高亮以应用新加载的指令
+            if docs_changed:
+                highlighter.rehighlight()
 
     def update_views(self, main_window):
         """
@@ -130,33 +177,34 @@ class StdScriptHandler(ScriptHandler):
     # 辅助方法
     # ==================================================================
 
-    def _load_instruction_docs(self, file_path: str):
+    def _save_thstd_path(self, path: str):
+        self._main_window.settings.set_user_path("user_thstd_path", path)
+
+    def _save_ref_path(self, path: str):
+        self._main_window.settings.set_user_path("user_std_ref_path", path)
+
+    def _on_unpack_clicked(self):
+        self.on_unpack_request(self._main_window)
+
+    def _on_pack_clicked(self):
+        self.on_pack_request(self._main_window)
+
+    def _load_instruction_docs(self, file_path: str) -> bool:
         """
         从给定的 JSON 文件路径加载并解析 STD 指令文档。
-        文件格式示例: {"ins_0": ["SetSpeed(speed, time)", "设置速度"], ...}
+        解析结果按 (路径, mtime, 大小) 缓存；返回文档内容是否发生了变化。
         """
-        self.instruction_docs.clear()
         try:
-            with open(file_path, "r", encoding='utf-8') as f:
-                raw_data = json.load(f)
-
-            # thstd_ref.json 的格式是 {"ins_id": ["name(args)", "desc"]}
-            for key, value in raw_data.items():
-                if not isinstance(value, list) or len(value) < 2:
-                    continue
-                
-                full_name, description = value[0], value[1]
-                
-                # 提取指令名 (如 SetSpeed)
-                name_match = re.match(r'([\w_]+)\(.*\)', full_name)
-                if name_match:
-                    instruction_name = name_match.group(1)
-                    # 创建 HTML 格式的文档字符串
-                    doc_html = f"<b>{full_name}</b><br>{description}"
-                    self.instruction_docs[instruction_name] = doc_html
-                    
+            docs = load_derived(file_path, _build_instruction_docs)
         except (FileNotFoundError, json.JSONDecodeError) as e:
             print(f"错误: 无法加载或解析STD指令集 '{file_path}': {e}")
+            docs = None
+        if docs is not None and docs is self._docs_source:
+            # 同一个文件且未被修改，现有文档无需重建
+            return False
+        self._docs_source = docs
+        self.instruction_docs = MappingProxyType(docs) if docs is not None else _NO_DOCS
+        return True
 
     # ==================================================================
     # 工具流槽函数 (未来可扩展)
@@ -1,7 +1,8 @@
 # app/main_window.py
 
+from functools import partial
 from pathlib import Path
-from PyQt6.QtCore import Qt, QTimer, QEvent
+from PyQt6.QtCore import Qt, QTimer, QEvent, QIODevice, QSaveFile, QStringConverter, QTextStream
 from PyQt6.QtWidgets import (
     QMainWindow, QFileDialog, QMessageBox, QMenu, QWidget,
     QFontComboBox, QComboBox, QLabel, QCheckBox
@@ -9,21 +10,91 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtGui import QAction, QKeySequence, QIcon
 from PyQt6.QtWidgets import QStyle
 # --- 导入核心模块 ---
+from .core.background import run_in_background
 from .core.settings import Settings
 from .core.script_handler import ScriptHandler
 
-# --- 导入具体的处理器 ---
-from .handlers.anm_handler import AnmScriptHandler
-from .handlers.msg_handler import MsgScriptHandler
-from .handlers.std_handler import StdScriptHandler
-from .handlers.ecl_handler import EclScriptHandler
-
 # --- 导入UI控件 ---
 from .widgets.text_editor import TextEditor
 from .widgets.help_panel import HelpPanel
 from .widgets.about_dialog import AboutDialog
 from .widgets.settings_dialog import SettingsDialog
 
+# --- 具体的处理器：首次用到时才导入并创建 ---
+# 各处理器模块连同其包装器、高亮器和面板都较重，启动时只创建默认的 ANM 处理器。
+# 导入写在函数体内（而不是按模块名字符串动态导入），打包工具仍能静态分析到这些依赖。
+def _create_anm_handler() -> ScriptHandler:
+    from .handlers.anm_handler import AnmScriptHandler
+    return AnmScriptHandler()
+
+def _create_msg_handler() -> ScriptHandler:
+    from .handlers.msg_handler import MsgScriptHandler
+    return MsgScriptHandler()
+
+def _create_std_handler() -> ScriptHandler:
+    from .handlers.std_handler import StdScriptHandler
+    return StdScriptHandler()
+
+def _create_ecl_handler() -> ScriptHandler:
+    from .handlers.ecl_handler import EclScriptHandler
+    return EclScriptHandler()
+
+_HANDLER_FACTORIES = {
+    "ANM": _create_anm_handler,
+    "MSG": _create_msg_handler,
+    "STD": _create_std_handler,
+    "ECL": _create_ecl_handler,
+}
+
+# 文件名 / 后缀 -> 处理器名
+_HANDLER_FILE_MAP = {
+    ".anm.txt": "ANM", # 更精确的匹配
+    ".ddes": "ANM",
+    ".msg.txt": "MSG", # 更精确的匹配
+    ".msg": "MSG", # 用于直接打开
+    ".std.txt": "STD", # 更精确的匹配
+    ".std": "STD", # 用于直接打开
+    ".ecl.txt": "ECL", # ECL 文本
+    ".ecl": "ECL",     # 直接打开 ECL
+    ".txt": "ECL", # 作为默认或通用txt处理器
+}
+# 处理器名 -> 打开文件对话框中的过滤器，与各处理器的 get_file_filter() 保持一致；
+# 静态列出，构建对话框时无需导入和创建全部处理器
+_HANDLER_FILE_FILTERS = {
+    "ANM": "ANM Scripts (*.txt;*.ddes)",
+    "MSG": "MSG Related Files (*.msg *.txt)",
+    "STD": "STD Scripts (*.std *.txt)",
+    "ECL": "ECL Scripts (*.ecl *.txt)",
+}
+# 按长度从长到短排列的后缀，匹配时最长的后缀优先（如 .anm.txt 先于 .txt）
+_HANDLER_SUFFIXES = sorted(_HANDLER_FILE_MAP, key=len, reverse=True)
+
+# QTextDocument.toPlainText() 对块内文本所做的替换：行 / 段落分隔符与框架标记转为换行，NBSP 转为空格。
+# QPlainTextEdit 中按 Shift+Enter 会在块内插入 U+2028，保存时必须同样写成换行。
+_PLAIN_TEXT_TABLE = str.maketrans({
+    '\u2028': '\n', '\u2029': '\n', '\ufdd0': '\n', '\ufdd1': '\n', '\u00a0': ' ',
+})
+
+def _iter_plain_text(document):
+    """逐个文本块产出片段，拼接结果与 document.toPlainText() 相同（块之间以换行分隔，末尾不追加换行）。"""
+    block = document.begin()
+    while block.isValid():
+        yield block.text().translate(_PLAIN_TEXT_TABLE)
+        block = block.next()
+        if block.isValid():
+            yield '\n'
+
+def _prewarm_std_docs(ref_path: str) -> None:
+    # 在工作线程中执行：导入 STD 处理器模块并解析其指令集
+    from .handlers.std_handler import prewarm_instruction_docs
+    prewarm_instruction_docs(ref_path)
+
+# 分析防抖间隔随文档大小分档：(字符数上限, 间隔毫秒)，超过最后一档时使用 _UPDATE_DELAY_MAX
+_UPDATE_DELAY_STEPS = ((20000, 300), (100000, 500), (200000, 700))
+_UPDATE_DELAY_MAX = 900
+# 档位边界两侧的缓冲比例，避免文档大小在边界附近来回变化时频繁改动间隔
+_UPDATE_DELAY_SLACK = 0.1
+
 
 class MainWindow(QMainWindow):
     """
@@ -37,28 +108,8 @@ class MainWindow(QMainWindow):
         self.current_file_path: Path | None = None
         
         # --- 2. 处理器管理 ---
-        anm_handler_instance = AnmScriptHandler()
-        msg_handler_instance = MsgScriptHandler()
-        std_handler_instance = StdScriptHandler()
-        ecl_handler_instance = EclScriptHandler()
-        
-        self.script_handlers = {
-            "ANM": anm_handler_instance,
-            "MSG": msg_handler_instance,
-            "STD": std_handler_instance,
-            "ECL": ecl_handler_instance,
-        }
-        self.handler_file_map = {
-            ".anm.txt": anm_handler_instance, # 更精确的匹配
-            ".ddes": anm_handler_instance,
-            ".msg.txt": msg_handler_instance, # 更精确的匹配
-            ".msg": msg_handler_instance, # 用于直接打开
-            ".std.txt": std_handler_instance, # 更精确的匹配
-            ".std": std_handler_instance, # 用于直接打开
-            ".ecl.txt": ecl_handler_instance, # ECL 文本
-            ".ecl": ecl_handler_instance,     # 直接打开 ECL
-            ".txt": ecl_handler_instance, # 作为默认或通用txt处理器
-        }
+        # 已创建的处理器实例，按名称缓存；其余处理器在 get_handler 首次请求时创建
+        self.script_handlers: dict[str, ScriptHandler] = {}
         self.current_handler: ScriptHandler | None = None
 
         # --- 3. UI 构建---
@@ -76,8 +127,20 @@ class MainWindow(QMainWindow):
         # --- 4. 信号连接 ---
         self.update_timer = QTimer(self)
         self.update_timer.setSingleShot(True)
-        self.update_timer.setInterval(400) # 400毫秒延迟
+        self.update_timer.setInterval(_UPDATE_DELAY_STEPS[0][1])
         self.update_timer.timeout.connect(self.run_handler_update)
+        # 当前高亮器提供的可选方法（由 switch_handler 设置，不支持时为 None）
+        self._hl_check_syntax = None
+        self._hl_completion_words = None
+        self._hl_get_doc = None
+        # 上一次分析时的 (文档修订号, 处理器, 文件路径)；未变化时跳过重复分析
+        self._last_analysis_key = None
+        # 每次 run_handler_update 递增，用于丢弃过期的后台语法检查结果
+        self._analysis_generation = 0
+        # 正在后台运行的语法检查任务（保留引用直到回调触发）
+        self._syntax_task = None
+        # 当前防抖间隔对应的文档字符数范围 [下限, 上限)；超出时才重新选择档位
+        self._update_delay_range = (0, 0)
 
         # 自动保存计时器（空闲 N 秒后保存）
         self.autosave_timer = QTimer(self)
@@ -93,12 +156,20 @@ class MainWindow(QMainWindow):
         # --- 5. 初始状态 ---
         
         # 启动时默认激活 ANM 处理器
-        self.switch_handler(self.script_handlers["ANM"])
+        self.switch_handler(self.get_handler("ANM"))
         # 应用首选项
         try:
             self._apply_settings_on_startup()
         except Exception:
             pass
+        # 事件循环启动后，在后台预先解析 STD 指令集，首次切换到 STD 时无需等待
+        self._prewarm_task = None
+        QTimer.singleShot(0, self._start_prewarm)
+
+    def _start_prewarm(self):
+        ref_path = self.settings.get_std_ref_path()
+        if ref_path and "STD" not in self.script_handlers:
+            self._prewarm_task = run_in_background(_prewarm_std_docs, ref_path)
     # ==================================================================
     # 通用 UI 创建方法
     # ==================================================================
@@ -108,21 +179,49 @@ class MainWindow(QMainWindow):
         这个操作非常快，不会导致UI卡顿。
         """
         #print("[DEBUG] MainWindow.on_text_changed_lightweight: Text changed, restarting timer.")
+        size = self.text_editor.document().characterCount()
+        low, high = self._update_delay_range
+        if not low <= size < high:
+            self._select_update_delay(size)
         self.update_timer.start()
         # 自动保存：重置单次计时器
         self._restart_autosave_timer()
-    def run_handler_update(self):
+    def _select_update_delay(self, size: int):
+        """按文档字符数选择分析防抖间隔：文档越大，单次分析越慢，就合并更多次按键再分析。"""
+        lower = 0
+        interval, upper = _UPDATE_DELAY_MAX, None
+        for limit, delay in _UPDATE_DELAY_STEPS:
+            if size < limit:
+                interval, upper = delay, limit
+                break
+            lower = limit
+        self.update_timer.setInterval(interval)
+        # 在档位边界外留出缓冲，小幅编辑不会反复切换档位
+        low = int(lower * (1 - _UPDATE_DELAY_SLACK))
+        high = int(upper * (1 + _UPDATE_DELAY_SLACK)) if upper is not None else float('inf')
+        self._update_delay_range = (low, high)
+
+    def run_handler_update(self, force: bool = False):
         """
         重量级槽函数：由计时器超时或手动刷新调用。
         这是所有分析和UI更新的总指挥。
+
+        文档修订号、处理器和文件都与上一次分析相同时直接返回；force=True（手动刷新）时总是执行。
         """
         #print("[DEBUG | Main] run_handler_update CALLED. Beginning full update...")
+        # 直接调用（加载文件、手动刷新）时，已排队的防抖更新会重复同样的工作，一并取消
+        self.update_timer.stop()
         
         # 1. 如果没有处理器，就什么都不做
         if not self.current_handler:
             #print("[DEBUG | Main] No active handler. Aborting update.")
             return
 
+        analysis_key = (self.text_editor.document().revision(), self.current_handler, self.current_file_path)
+        if not force and analysis_key == self._last_analysis_key:
+            return
+        self._last_analysis_key = analysis_key
+
         # 2. 命令当前处理器更新其内部数据和专用视图
         #    例如，AnmHandler 会在这里解析文本并更新精灵预览区
         self.current_handler.update_views(self)
@@ -138,31 +237,45 @@ class MainWindow(QMainWindow):
         self.text_editor.update_completion_model()
         # 同步帮助面板下拉候选
         try:
-            if hasattr(highlighter, 'get_completion_words'):
-                words = highlighter.get_completion_words() or []
+            if self._hl_completion_words is not None:
+                words = self._hl_completion_words() or []
                 self.help_panel.set_completion_words(words)
         except Exception:
             pass
         
-        # 3b. 执行语法检查并更新错误高亮
-        all_errors = []
-        if hasattr(highlighter, 'check_syntax'):
+        # 3b. 在后台线程执行语法检查（纯文本扫描，不访问 Qt 控件），完成后回到主线程更新错误高亮
+        self._analysis_generation += 1
+        if self._hl_check_syntax is not None:
             #print("[DEBUG | Main] Checking syntax...")
-            all_errors = highlighter.check_syntax(self.text_editor.toPlainText())
-        
-        #print(f"[DEBUG | Main] Found {len(all_errors)} syntax errors. Highlighting them...")
-        self.text_editor.highlight_errors(all_errors)
+            self._syntax_task = run_in_background(
+                self._hl_check_syntax, self.text_editor.plain_text(),
+                on_finished=partial(self._on_syntax_checked, self._analysis_generation, highlighter),
+                on_failed=lambda e: print(f"语法检查失败: {e}"))
+        else:
+            self.text_editor.highlight_errors([])
         
         # 3c. 触发代码补全的弹出窗口
         #print("[DEBUG | Main] Triggering completion popup...")
         self.text_editor.trigger_completion()
 
-        # 4. 最后，强制高亮器重绘整个文档
-        #    这必须在所有数据处理（如动态规则更新）之后进行
-        #print("[DEBUG | Main] Rehighlighting document...")
-        highlighter.rehighlight()
+        # 4. 最后，若动态规则有变化，重绘整个文档
+        #    这必须在所有数据处理（如动态规则更新）之后进行；普通编辑由 QSyntaxHighlighter 按块增量重绘
+        if getattr(highlighter, 'rules_dirty', False):
+            #print("[DEBUG | Main] Rehighlighting document...")
+            highlighter.rules_dirty = False
+            highlighter.rehighlight()
         
         #print("[DEBUG | Main] Full update finished.")
+    def _on_syntax_checked(self, generation: int, highlighter, errors: list):
+        """后台语法检查完成：只应用仍对应当前文本与高亮器的结果。"""
+        # 期间又发起了新的检查、切换了高亮器，或文本已再次修改（防抖计时器在运行）时，结果已过期
+        if (generation != self._analysis_generation
+                or highlighter is not self.text_editor.highlighter
+                or self.update_timer.isActive()):
+            return
+        #print(f"[DEBUG | Main] Found {len(errors)} syntax errors. Highlighting them...")
+        self.text_editor.highlight_errors(errors)
+
     def _create_dock_widgets(self):
         """创建所有通用的可停靠面板。"""
         self.help_panel = HelpPanel(parent=self)
@@ -174,9 +287,9 @@ class MainWindow(QMainWindow):
             hl = getattr(self.text_editor, 'highlighter', None)
             if not hl:
                 return ""
-            if hasattr(hl, 'get_documentation'):
+            if self._hl_get_doc is not None:
                 try:
-                    html = hl.get_documentation(word) or ""
+                    html = self._hl_get_doc(word) or ""
                 except Exception:
                     html = ""
                 if html:
@@ -230,6 +343,13 @@ class MainWindow(QMainWindow):
         edit_menu = menu_bar.addMenu("&编辑"); edit_menu.addAction(self.find_action)
         
         self.type_menu = menu_bar.addMenu("脚本类型")
+        # 每个处理器一个可勾选的动作，只创建一次；切换处理器时仅同步勾选状态
+        self._type_actions: dict[str, QAction] = {}
+        for name in _HANDLER_FACTORIES:
+            action = QAction(name, self, checkable=True)
+            action.triggered.connect(partial(self._on_type_action_triggered, name))
+            self.type_menu.addAction(action)
+            self._type_actions[name] = action
         
         self.view_menu = menu_bar.addMenu("&视图")
         self.view_menu.addAction(self.refresh_action)
@@ -269,14 +389,13 @@ class MainWindow(QMainWindow):
             self._apply_settings_from_data()
 
         
-    def _populate_type_menu(self):
-        """用可用的处理器填充“脚本类型”菜单。"""
-        self.type_menu.clear()
-        for name, handler in self.script_handlers.items():
-            action = QAction(name, self, checkable=True)
-            action.setChecked(self.current_handler is handler)
-            action.triggered.connect(lambda checked, h=handler: self.switch_handler(h) if checked else self.switch_handler(None))
-            self.type_menu.addAction(action)
+    def _sync_type_menu(self):
+        """使“脚本类型”菜单的勾选状态与当前处理器一致。"""
+        for name, action in self._type_actions.items():
+            action.setChecked(self.current_handler is not None and self.current_handler is self.script_handlers.get(name))
+
+    def _on_type_action_triggered(self, name: str, checked: bool):
+        self.switch_handler(self.get_handler(name) if checked else None)
 
     def _create_tool_bar(self):
         """创建一个完全通用的工具栏。"""
@@ -365,35 +484,40 @@ class MainWindow(QMainWindow):
     # ==================================================================
 
     def on_text_changed(self):
-        """通用槽函数：当文本改变时，命令当前处理器更新其视图。"""
-        if self.current_handler:
-            self.current_handler.update_views(self)
+        """通用槽函数：当文本改变时，经由防抖计时器让当前处理器更新其视图，连续输入只触发一次。"""
+        self.on_text_changed_lightweight()
 
     def open_file(self):
         """打开文件，并只在处理器类型确实改变时才切换处理器。"""
-        all_filters = ";;".join(set(h.get_file_filter() for h in self.script_handlers.values()))
+        all_filters = ";;".join(_HANDLER_FILE_FILTERS.values())
         file_path_str, _ = QFileDialog.getOpenFileName(self, "打开脚本文件", "", all_filters)
         if not file_path_str: return
 
         file_path = Path(file_path_str)
         
 
-        # 优先匹配更具体的文件名，如 'st01.anm.txt'
-        new_handler = self.handler_file_map.get(file_path.name.lower(), None)
-        if not new_handler:
-            # 如果没有匹配到完整文件名，则回退到匹配后缀
-            new_handler = self.handler_file_map.get(file_path.suffix.lower(), None)
+        # 最长后缀优先：'st01.anm.txt' 匹配 .anm.txt 而不是 .txt
+        file_name = file_path.name.lower()
+        handler_name = next((_HANDLER_FILE_MAP[suffix] for suffix in _HANDLER_SUFFIXES if file_name.endswith(suffix)), None)
 
-
-        if not new_handler:
+        if not handler_name:
             QMessageBox.warning(self, "不支持的文件类型", f"没有为 '{file_path.suffix}' 类型的文件配置处理器。")
             return
+        new_handler = self.get_handler(handler_name)
         
         if self.current_handler is not new_handler:
             self.switch_handler(new_handler)
         
         self._load_file_content(file_path)
 
+    def get_handler(self, name: str) -> ScriptHandler:
+        """返回指定名称的处理器；首次请求时才导入其模块并创建实例。"""
+        handler = self.script_handlers.get(name)
+        if handler is None:
+            handler = _HANDLER_FACTORIES[name]()
+            self.script_handlers[name] = handler
+        return handler
+
     def switch_handler(self, handler: ScriptHandler | None):
         if self.current_handler is handler:
             return
@@ -407,8 +531,13 @@ class MainWindow(QMainWindow):
             self.text_editor.highlighter = highlighter
             self.current_handler.connect_signals(self)
         else:
+            highlighter = None
             self.text_editor.highlighter = None
-        self._populate_type_menu()
+        # 高亮器只在这里更换：一次性取出各项可选能力，热路径上只需判断是否为 None
+        self._hl_check_syntax = getattr(highlighter, 'check_syntax', None)
+        self._hl_completion_words = getattr(highlighter, 'get_completion_words', None)
+        self._hl_get_doc = getattr(highlighter, 'get_documentation', None)
+        self._sync_type_menu()
         self._update_window_title()
     def _load_file_content(self, file_path: Path):
         """
@@ -422,7 +551,8 @@ class MainWindow(QMainWindow):
             self.text_editor.set_document_content(content)
 
             # 2. 手动触发一次立即更新，以便在加载文件后立即看到结果
-            self.run_handler_update()
+            #    重新设置内容会重置文档修订号，可能与上一次分析的键相同，因此强制更新
+            self.run_handler_update(force=True)
 
             self._update_window_title()
             self.statusBar.showMessage(f"已加载 {file_path.name}", 5000)
@@ -433,7 +563,7 @@ class MainWindow(QMainWindow):
     def refresh_handler_view(self):
         """手动刷新时，立即执行更新，绕过计时器。"""
         print("\n[DEBUG | Main] refresh_handler_view CALLED (Manual Refresh Button).\n")
-        self.run_handler_update()
+        self.run_handler_update(force=True)
 
     # ==================================================================
     # 自动保存逻辑
@@ -479,9 +609,18 @@ class MainWindow(QMainWindow):
     def _write_to_file(self, file_path: Path) -> bool:
         """将编辑器内容写入指定路径的辅助函数。"""
         try:
-            content = self.text_editor.toPlainText()
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            # 逐个文本块写出，不必先把整篇文档复制为一个 Python 字符串；
+            # QSaveFile 先写临时文件，commit 时再替换目标文件，中途失败不会留下写了一半的文件
+            save_file = QSaveFile(str(file_path))
+            if not save_file.open(QIODevice.OpenModeFlag.WriteOnly | QIODevice.OpenModeFlag.Text):
+                raise OSError(save_file.errorString())
+            stream = QTextStream(save_file)
+            stream.setEncoding(QStringConverter.Encoding.Utf8)
+            for chunk in _iter_plain_text(self.text_editor.document()):
+                stream << chunk
+            stream.flush()
+            if not save_file.commit():
+                raise OSError(save_file.errorString())
             self.text_editor.document().setModified(False)
             self.statusBar.showMessage(f"文件已保存至 {file_path.name}", 3000)
             return True
@@ -569,9 +708,9 @@ class MainWindow(QMainWindow):
             self.help_panel.show_default()
             return
         # 优先通过高亮器的 get_documentation 获取（允许各处理器做规范化）
-        if hasattr(hl, 'get_documentation'):
+        if self._hl_get_doc is not None:
             try:
-                html = hl.get_documentation(word)
+                html = self._hl_get_doc(word)
 
             except Exception:
                 #print("[DEBUG] 获取指令文档时出错。")
@@ -10,6 +10,9 @@ class AboutDialog(QDialog):
     一个“关于 / 项目整体说明”的弹窗。
     使用 QTextBrowser 展示 resources/project_overview.html 的内容。
     """
+    # 已读取的 HTML 文件：{路径: (mtime_ns, 大小, 内容)}，在所有实例间共享
+    _html_cache: dict = {}
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("关于 - 项目整体说明")
@@ -29,15 +32,29 @@ class AboutDialog(QDialog):
         buttons.rejected.connect(self.reject)
         buttons.accepted.connect(self.accept)
         layout.addWidget(buttons)
+        # 当前 viewer 中显示的文件及其签名；再次打开时文件未变化则无需重新解析 HTML
+        self._shown_key = None
 
     def set_overview_html(self, html: str):
+        self._shown_key = None
         self.viewer.setHtml(html or "")
 
     def load_from_file(self, file_path: str) -> bool:
         try:
             p = Path(file_path)
             if p.is_file():
-                self.viewer.setHtml(p.read_text(encoding="utf-8", errors="ignore"))
+                st = p.stat()
+                key = (str(p), st.st_mtime_ns, st.st_size)
+                if key == self._shown_key:
+                    return True
+                cached = self._html_cache.get(key[0])
+                if cached is not None and cached[:2] == key[1:]:
+                    html = cached[2]
+                else:
+                    html = p.read_text(encoding="utf-8", errors="ignore")
+                    self._html_cache[key[0]] = (st.st_mtime_ns, st.st_size, html)
+                self.viewer.setHtml(html)
+                self._shown_key = key
                 return True
         except Exception:
             pass
@@ -50,7 +67,7 @@ class AboutDialog(QDialog):
                 base_dir = Path(__file__).parent.parent.parent  # 项目根目录
             res = base_dir / "resources" / "project_overview.html"
             if not self.load_from_file(str(res)):
-                self.viewer.setHtml(
+                self.set_overview_html(
                     """
                     <h2>项目整体说明</h2>
                     <p>未找到内置概览文件 <code>resources/project_overview.html</code>。
@@ -63,4 +80,4 @@ class AboutDialog(QDialog):
                     """
                 )
         except Exception:
-            self.viewer.setHtml("<h2>项目整体说明</h2><p>加载默认说明失败。</p>")
+            self.set_overview_html("<h2>项目整体说明</h2><p>加载默认说明失败。</p>")
@@ -3,7 +3,16 @@
 import re
 import json
 from PyQt6.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
+
+# 指令文档条目：(签名, 描述)，悬停查询时才格式化为 HTML
+DocEntry = Tuple[str, str]
+
+
+def render_doc(entry: DocEntry) -> str:
+    """把 (签名, 描述) 格式化为帮助面板使用的 HTML。"""
+    sig_text, desc_text = entry
+    return f"<b>{sig_text}</b><br>{desc_text}" if sig_text else desc_text
 
 class EclSyntaxHighlighter(QSyntaxHighlighter):
     """
@@ -12,18 +21,20 @@ class EclSyntaxHighlighter(QSyntaxHighlighter):
     """
     def __init__(self, 
                  parent, 
-                 instruction_docs: Optional[Dict[str, str]] = None,
+                 instruction_docs: Optional[Dict[str, DocEntry]] = None,
                  builtin_variables: Optional[List[str]] = None):
         """
         初始化高亮器。
         
         :param parent: 父对象 (通常是 QTextDocument)。
-        :param instruction_docs: (可选) 从eclmap映射的指令名到文档的字典。
+        :param instruction_docs: (可选) 从eclmap映射的指令名到 (签名, 描述) 的字典。
         :param builtin_variables: (可选) 从JSON文件加载的游戏内置变量列表。
         """
         super().__init__(parent)
         
         self.instruction_docs = instruction_docs or {}
+        # 小写指令名 -> 文档，悬停查询大小写不同的写法时按需构建
+        self._docs_by_lower = None
         self.builtin_variables = set(builtin_variables or [])
 
     # --- 1. 定义颜色和样式 ---
@@ -94,15 +105,15 @@ class EclSyntaxHighlighter(QSyntaxHighlighter):
             builtin_pattern = r'\b(' + '|'.join(re.escape(v) for v in self.builtin_variables) + r')\b'
             rules.append((re.compile(builtin_pattern), self.builtin_variable_format))
 
-        # 优先级 3: 内置指令/函数 (来源于 docs)
+        # 优先级 3: 内置指令/函数 (来源于 docs)；docs 中每条指令只登记一种写法，匹配时忽略大小写
         known_instructions = list(self.instruction_docs.keys())
         if known_instructions:
             instr_pattern_str = r'\b(' + '|'.join(re.escape(name) for name in known_instructions) + r')(?=\s*\()'
-            rules.append((re.compile(instr_pattern_str), self.instruction_format))
+            rules.append((re.compile(instr_pattern_str, re.IGNORECASE), self.instruction_format))
 
             # 为 @ 形式的调用也创建一个版本
             instr_pattern_at_str = r'@(' + '|'.join(re.escape(name) for name in known_instructions) + r')(?=\s*\()'
-            rules.append((re.compile(instr_pattern_at_str), self.instruction_format))
+            rules.append((re.compile(instr_pattern_at_str, re.IGNORECASE), self.instruction_format))
 
         # 优先级 4: 用户自定义的函数/子程序调用
         rules.append((re.compile(r'\b([a-zA-Z_]\w+)(?=\s*\()'), self.user_function_format))
@@ -136,8 +147,9 @@ class EclSyntaxHighlighter(QSyntaxHighlighter):
         self.highlighting_rules = rules
 
     # 对外方法：更新内置指令文档并重建规则
-    def set_instruction_docs(self, instruction_docs: Dict[str, str] | None):
+    def set_instruction_docs(self, instruction_docs: Dict[str, DocEntry] | None):
         self.instruction_docs = instruction_docs or {}
+        self._docs_by_lower = None
         self._rebuild_highlighting_rules()
         try:
             self.rehighlight()
@@ -214,9 +226,15 @@ class EclSyntaxHighlighter(QSyntaxHighlighter):
         
         # 检查是否为已知指令/函数
         cleaned_word = str(word).strip().lstrip('@').rstrip(':').split('(')[0]
-        if cleaned_word in docs:
+        doc = docs.get(cleaned_word)
+        if doc is None and docs:
+            # 与高亮规则一致，大小写不同的写法也能取到文档
+            if self._docs_by_lower is None:
+                self._docs_by_lower = {name.lower(): entry for name, entry in docs.items()}
+            doc = self._docs_by_lower.get(cleaned_word.lower())
+        if doc is not None:
             # 返回指令的签名和描述
-            doc_content = docs[cleaned_word].replace('\n', '<br>')
+            doc_content = render_doc(doc).replace('\n', '<br>')
             return f"<b>【内置指令】</b><br>{doc_content}"
             
         return ""
\ No newline at end of file
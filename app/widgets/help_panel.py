@@ -100,6 +100,8 @@ class HelpPanel(QDockWidget):
         self.setAllowedAreas(Qt.DockWidgetArea.LeftDockWidgetArea | Qt.DockWidgetArea.RightDockWidgetArea)
 
         self._get_doc_callback: Optional[Callable[[str], str]] = None
+        # 当前显示的 HTML；内容相同时跳过 setHtml，避免重复解析与排版
+        self._current_html: Optional[str] = None
 
         # --- UI 组件 ---
         # 1. 下拉框
@@ -132,6 +134,9 @@ class HelpPanel(QDockWidget):
 
     def update_content(self, html_content: str):
         """用新的HTML内容更新帮助文本。"""
+        if html_content == self._current_html:
+            return
+        self._current_html = html_content
         self._doc_browser.setHtml(html_content)
 
     def show_default(self):
@@ -5,7 +5,7 @@ from PyQt6.QtWidgets import (
     QDialog, QWidget, QListWidget, QListWidgetItem, QPushButton,
     QHBoxLayout, QVBoxLayout, QGraphicsView, QGraphicsScene, QLabel, QSpinBox, QGroupBox
 )
-from PyQt6.QtGui import QPixmap, QImage, QPainter, QColor, QBrush
+from PyQt6.QtGui import QPixmap, QPixmapCache, QImage, QPainter, QColor, QBrush
 from PyQt6.QtCore import Qt, QSize
 from PyQt6.QtWidgets import QGraphicsPixmapItem
 
@@ -70,6 +70,8 @@ class SpriteComposerWindow(QDialog):
 
         # 名称 -> QPixmap 的缓存（避免重复生成）
         self._catalog_pixmaps: Dict[str, QPixmap] = {}
+        # 图集路径 -> 文件签名，构造 QPixmapCache 键时使用（对话框存续期间只取一次）
+        self._signatures: Dict[str, object] = {}
 
         # UI 组件
         self.catalog_list = QListWidget()
@@ -154,6 +156,14 @@ class SpriteComposerWindow(QDialog):
 
     def _get_pixmap(self, image_path: str, rect: Dict[str, int], x_off: int, y_off: int,
                     base_w, base_h) -> QPixmap | None:
+        if image_path not in self._signatures:
+            self._signatures[image_path] = self.image_manager.file_signature(image_path)
+        # 经 QPixmapCache 在多次打开组合窗口之间共享；图集文件变化后签名不同，自然失效
+        cache_key = (f"anm-sprite|{self.image_manager.base_path}|{image_path}|{self._signatures[image_path]}"
+                     f"|{rect['x']},{rect['y']},{rect['w']},{rect['h']}|{x_off},{y_off}")
+        cached = QPixmapCache.find(cache_key)
+        if cached is not None and not cached.isNull():
+            return cached
         pil = self.image_manager.get_sprite_image_with_offset(
             image_path, rect, x_off, y_off, base_w, base_h
         )
@@ -162,7 +172,9 @@ class SpriteComposerWindow(QDialog):
         if pil.mode != "RGBA":
             pil = pil.convert("RGBA")
         qimg = QImage(pil.tobytes(), pil.width, pil.height, QImage.Format.Format_RGBA8888)
-        return QPixmap.fromImage(qimg)
+        pixmap = QPixmap.fromImage(qimg)
+        QPixmapCache.insert(cache_key, pixmap)
+        return pixmap
 
     # ------------------- 交互：添加与图层 -------------------
     def _on_add_clicked(self):
@@ -1,18 +1,29 @@
 # app/widgets/sprite_preview.py
 
 from PyQt6.QtWidgets import QScrollArea, QWidget, QLabel, QStackedWidget
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtCore import Qt, QTimer, QRect, pyqtSignal
 from PyQt6.QtGui import QPalette, QColor # <--- 新增导入
 
 from .flow_layout import FlowLayout
+from .sprite_preview_item import SpritePreviewItem
+
+# 刷新之间保留以备复用的隐藏预览项数量上限
+_MAX_POOLED_ITEMS = 1024
 
 class SpritePreviewPane(QScrollArea):
     """
     精灵预览面板。
     
     注意：此面板中的 SpritePreviewItem 会发出 'clicked(str)' 信号。
-    需要在 MainWindow 中手动连接此信号以实现“点击跳转”功能。
+    带行号的预览项的点击会统一经由面板的 item_clicked(name, line) 信号转发，
+    只需连接一次即可实现“点击跳转”功能。
+
+    尚未生成缩略图的预览项（is_loaded 为 False）只在滚动到可见区域附近时才加载。
+    clear_previews 会把 SpritePreviewItem 隐藏后放入复用池，通过 acquire_item 取回并重新配置，
+    避免每次刷新都销毁并重建大量控件。
     """
+    item_clicked = pyqtSignal(str, int)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWidgetResizable(True)
@@ -77,6 +88,15 @@ class SpritePreviewPane(QScrollArea):
         self._restore_timer.timeout.connect(self._restore_scroll_position)
         self._bulk_updates = 0  # >0 表示批量更新中，延迟恢复滚动
 
+        # 延迟加载：等待可见区域内的预览项生成缩略图
+        self._pending_items = []
+        # 复用池：已移出布局并隐藏的预览项
+        self._pool = []
+        self._lazy_timer = QTimer(self)
+        self._lazy_timer.setSingleShot(True)
+        self._lazy_timer.timeout.connect(self._load_visible_items)
+        self.verticalScrollBar().valueChanged.connect(lambda _: self._schedule_lazy_load())
+
         self.show_placeholder()
         
         
@@ -84,24 +104,51 @@ class SpritePreviewPane(QScrollArea):
     def clear_previews(self):
         # 保存当前滚动位置供后续恢复
         self._saved_scroll_value = self.verticalScrollBar().value()
+        self._pending_items = []
         while self.sprite_layout.count() > 0:
             item = self.sprite_layout.takeAt(0)
             widget = item.widget()
-            if widget:
+            if not widget:
+                continue
+            if isinstance(widget, SpritePreviewItem) and len(self._pool) < _MAX_POOLED_ITEMS:
+                widget.hide()
+                widget.activated.disconnect(self.item_clicked)
+                self._pool.append(widget)
+            else:
                 widget.deleteLater()
         # 触发延迟恢复（若不在批量更新，立即调度；在批量中由结束时统一恢复）
         if self._bulk_updates == 0:
             self._schedule_scroll_restore()
         
+    def acquire_item(self, name: str, pixmap, **kwargs) -> SpritePreviewItem:
+        """
+        取得一个展示指定精灵的预览项（参数同 SpritePreviewItem）：复用池中有空闲控件时就地重置，
+        否则新建。返回的控件仍需通过 add_sprite_preview 加入面板。
+        """
+        if self._pool:
+            item = self._pool.pop()
+            item.reset(name, pixmap, **kwargs)
+            return item
+        return SpritePreviewItem(name, pixmap, **kwargs)
+
     def add_sprite_preview(self, widget: QWidget):
         # 若用户首次添加项目，保存滚动
         if self._bulk_updates == 0 and self._saved_scroll_value == 0:
             self._saved_scroll_value = self.verticalScrollBar().value()
         self._stack.setCurrentWidget(self._sprite_container)
         self.sprite_layout.addWidget(widget)
+        # 从复用池取回的控件此前被显式隐藏，加入布局后需重新显示
+        widget.show()
+        activated = getattr(widget, 'activated', None)
+        if activated is not None:
+            # 信号直接转发信号，不为每个预览项创建 Python 闭包
+            activated.connect(self.item_clicked)
+        if not getattr(widget, 'is_loaded', True):
+            self._pending_items.append(widget)
         # 仅在非批量模式下调度恢复；批量模式结束后统一恢复
         if self._bulk_updates == 0:
             self._schedule_scroll_restore()
+            self._schedule_lazy_load()
 
     def show_placeholder(self):
         # 如果已经是占位符，避免重复清空导致滚动复位
@@ -129,6 +176,38 @@ class SpritePreviewPane(QScrollArea):
             self._bulk_updates -= 1
         if self._bulk_updates == 0:
             self._schedule_scroll_restore()
+            self._schedule_lazy_load()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        # 变宽/变高后可能有新的预览项进入可见区域
+        self._schedule_lazy_load()
+
+    # =============================
+    # 内部：按可见区域延迟加载缩略图
+    # =============================
+    def _schedule_lazy_load(self):
+        if self._pending_items and not self._lazy_timer.isActive():
+            # 稍作延迟：等布局完成几何计算，连续滚动时也只处理一次
+            self._lazy_timer.start(15)
+
+    def _load_visible_items(self):
+        if not self._pending_items:
+            return
+        # 确保预览项已被布局放到最终位置
+        self.sprite_layout.activate()
+        viewport = self.viewport()
+        top = self.verticalScrollBar().value()
+        # 上下各多加载一屏，滚动时不容易看到空白占位
+        height = viewport.height()
+        visible = QRect(0, top - height, viewport.width(), height * 3)
+        remaining = []
+        for item in self._pending_items:
+            if item.geometry().intersects(visible):
+                item.load_thumbnail()
+            else:
+                remaining.append(item)
+        self._pending_items = remaining
 
     # =============================
     # 内部：调度与恢复滚动位置
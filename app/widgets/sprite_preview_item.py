@@ -3,6 +3,7 @@
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QSizePolicy
 from PyQt6.QtGui import QPixmap, QCursor
 from PyQt6.QtCore import Qt, pyqtSignal, QSize
+from typing import Callable, Optional, Tuple
 
 class SpritePreviewItem(QWidget):
     """
@@ -12,12 +13,21 @@ class SpritePreviewItem(QWidget):
     - 可点击，并发出带有自身名称的信号。
     """
     clicked = pyqtSignal(str)
+    # 带有定义所在行号的点击信号（仅在已知行号时发出），供 SpritePreviewPane 统一转发
+    activated = pyqtSignal(str, int)
     
     THUMBNAIL_SIZE = QSize(120, 120)  # 稍微增宽，留出多行文字空间
 
-    def __init__(self, name: str, pixmap: QPixmap, parent=None):
+    def __init__(self, name: str, pixmap: QPixmap | None, parent=None, source_size: QSize | None = None,
+                 line_number: int | None = None,
+                 loader: Optional[Callable[[], Optional[Tuple[QPixmap, QSize]]]] = None):
+        """
+        source_size: 精灵的原始尺寸。传入的 pixmap 若已预先缩小，用它在提示中显示真实尺寸。
+        line_number: 精灵定义所在的行号；提供时点击会额外发出 activated(name, line)。
+        loader: 延迟生成缩略图的函数，返回 (pixmap, 原始尺寸) 或 None。
+                pixmap 为 None 时先只占位，等滚动到可见区域后由预览面板调用 load_thumbnail()。
+        """
         super().__init__(parent)
-        self.sprite_name = name
 
         # 仅固定宽度，让高度可随文字自动扩展
         self.setFixedWidth(self.THUMBNAIL_SIZE.width())
@@ -39,19 +49,12 @@ class SpritePreviewItem(QWidget):
         layout.setContentsMargins(5, 5, 5, 5)
         layout.setSpacing(4)
 
-        # 图像缩放逻辑会自动适应新的尺寸
-        available_img_size = QSize(self.THUMBNAIL_SIZE.width() - 10, self.THUMBNAIL_SIZE.height() - 40)
-        thumbnail = pixmap.scaled(
-            available_img_size,
-            Qt.AspectRatioMode.KeepAspectRatio,
-            Qt.TransformationMode.SmoothTransformation
-        )
-
         self.image_label = QLabel()
         self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.image_label.setPixmap(thumbnail)
+        # 预留缩略图高度，延迟加载的预览项在生成图像前后尺寸保持一致，布局不会跳动
+        self.image_label.setMinimumHeight(self._available_image_size().height())
 
-        self.name_label = QLabel(name)
+        self.name_label = QLabel()
         self.name_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.name_label.setWordWrap(True)
         self.name_label.setStyleSheet("color: #ccc; border: none; background: transparent; font-size: 10pt;")
@@ -60,11 +63,60 @@ class SpritePreviewItem(QWidget):
         layout.addWidget(self.image_label, 1)
         layout.addWidget(self.name_label, 0)
 
-        self.setToolTip(f"名称: {name}\n原始尺寸: {pixmap.width()}x{pixmap.height()}\n(点击跳转到定义)")
-        
+        self.reset(name, pixmap, source_size=source_size, line_number=line_number, loader=loader)
+
+    def reset(self, name: str, pixmap: QPixmap | None, source_size: QSize | None = None,
+              line_number: int | None = None,
+              loader: Optional[Callable[[], Optional[Tuple[QPixmap, QSize]]]] = None):
+        """就地改为展示另一个精灵（参数同构造函数），供预览面板复用已有控件。"""
+        self.sprite_name = name
+        self.line_number = line_number
+        self._loader = loader
+        self.name_label.setText(name)
+        self.image_label.clear()
+        self.image_label.setStyleSheet("")
+        if pixmap is not None:
+            self._set_thumbnail(pixmap, source_size)
+        else:
+            self.setToolTip(f"名称: {name}\n(点击跳转到定义)")
+
+    @property
+    def is_loaded(self) -> bool:
+        """缩略图是否已生成（或已确定无法生成）。"""
+        return self._loader is None
+
+    def load_thumbnail(self):
+        """调用 loader 生成缩略图；每个预览项最多执行一次。"""
+        loader, self._loader = self._loader, None
+        if loader is None:
+            return
+        result = loader()
+        if result is None:
+            self.image_label.setText("无法加载")
+            self.image_label.setStyleSheet("color: #888; border: none; background: transparent;")
+            return
+        self._set_thumbnail(*result)
+
+    def _available_image_size(self) -> QSize:
+        return QSize(self.THUMBNAIL_SIZE.width() - 10, self.THUMBNAIL_SIZE.height() - 40)
+
+    def _set_thumbnail(self, pixmap: QPixmap, source_size: QSize | None):
+        # 图像缩放逻辑会自动适应新的尺寸
+        thumbnail = pixmap.scaled(
+            self._available_image_size(),
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        )
+        self.image_label.setPixmap(thumbnail)
+
+        original = source_size or pixmap.size()
+        self.setToolTip(f"名称: {self.sprite_name}\n原始尺寸: {original.width()}x{original.height()}\n(点击跳转到定义)")
+
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
             self.clicked.emit(self.sprite_name)
+            if self.line_number:
+                self.activated.emit(self.sprite_name, self.line_number)
         super().mousePressEvent(event)
 
     # 已不再需要省略号，保留方法但直接返回原文本以兼容旧引用
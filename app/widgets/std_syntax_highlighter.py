@@ -4,7 +4,46 @@ import json
 import re
 from pathlib import Path
 from PyQt6.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont, QTextFormat, QTextCursor
-from typing import Dict, List
+from typing import List, Mapping
+
+# 匹配 "名称(" 形式调用中的完整单词名称；再用集合成员判断代替由全部指令名拼成的大型分支正则
+_CALL_NAME_RE = re.compile(r'\b(\w+)(?=\s*\()')
+# 未翻译的原始指令名 ins_0..ins_999
+_RAW_INSTRUCTION_NAMES = frozenset(f'ins_{i}' for i in range(1000))
+
+# 高亮规则表：(编译好的正则, 格式属性名)，按顺序应用，后面的规则覆盖前面的
+_STD_KEYWORDS = ['ANM', 'Std_unknown', 'ENTRY', 'QUAD', 'FACE', 'SCRIPT']
+_STD_PROPERTIES = ['Unknown', 'Position', 'Depth', 'Width', 'Height', 'Type', 'Script_index', 'Padding']
+_HIGHLIGHTING_RULES = [
+    # 关键字
+    (re.compile(r'\b(' + '|'.join(_STD_KEYWORDS) + r'):'), 'keyword_format'),
+    # 属性
+    (re.compile(r'\b(' + '|'.join(_STD_PROPERTIES) + r'):'), 'property_format'),
+    (re.compile(r'(#(?:[0-9a-fA-F]{8}|[0-9a-fA-F]{6}))\b'), 'hex_format'),
+    # 指令 (ins_xxx 或翻译后的名称)
+    (re.compile(r'\b([\w_]+)(?=\()'), 'instruction_format'),
+    # 规则 1: 标签定义 (支持 1234: 和 @label:)
+    # 使用非捕获组 (?:...) 来匹配两种情况
+    (re.compile(r'^\s*((?:\d+|@[a-zA-Z_]\w*)):'), 'label_format'),
+    # 规则 2: @标签引用 (例如在 jmp 中)
+    # 这个规则很具体，可以放在前面
+    (re.compile(r'(@[a-zA-Z_]\w*)'), 'label_ref_format'),
+    # 规则 3: jmp指令中的数字偏移量
+    # 这个规则必须放在通用数字规则之前，以获得更高的优先级。
+    # 它匹配整个jmp指令，但只捕获第二个数字参数。
+    (re.compile(r'\bjmp\s*\([^,]+,\s*(\d+)\)'), 'label_ref_format'),
+    # 时间标签
+    (re.compile(r'^\s*(\d+):'), 'label_format'),
+    # 浮点数和整数
+    (re.compile(r'\b[+-]?(\d+\.\d*f?|\.\d+f?|\d+)\b', re.IGNORECASE), 'parameter_format'),
+    # .anm 文件路径 (作为字符串)
+    (re.compile(r'\b\w+\.anm\b'), 'string_format'),
+    # 注释: STD 脚本中注释仅用 '//' 表示
+    (re.compile(r'//[^\n]*'), 'comment_format'),
+    # 颜色代码行: 所有以 '#' 开头的整行都视为颜色代码并使用 hex_format
+    # 该规则放在最后以覆盖其他可能的匹配（如关键字、指令等）
+    (re.compile(r'^\s*#.*'), 'hex_format'),
+]
 
 class StdSyntaxHighlighter(QSyntaxHighlighter):
     IS_COLOR_PROPERTY = QTextFormat.Property.UserProperty + 1
@@ -12,15 +51,14 @@ class StdSyntaxHighlighter(QSyntaxHighlighter):
     一个专门用于东方Project STD 脚本的自定义语法高亮器。
     实现了 TextEditor 所需的通用接口，并包含语法检查。
     """
-    def __init__(self, parent, instruction_docs: Dict[str, str]):
+    def __init__(self, parent, instruction_docs: Mapping[str, str]):
         """
         初始化高亮器。
         
         :param parent: 父对象 (通常是 QTextDocument)。
-        :param instruction_docs: 一个预加载的、从指令名到HTML文档字符串的字典。
+        :param instruction_docs: 一个预加载的、从指令名到HTML文档字符串的只读映射。
         """
         super().__init__(parent)
-        self.highlighting_rules = []
         self.instruction_docs = instruction_docs
         # 记录每个文本块内的颜色片段 (start, end, hex_code)
         self._color_spans = {}
@@ -65,47 +103,8 @@ class StdSyntaxHighlighter(QSyntaxHighlighter):
         self._semicolon_error_format.setProperty(QTextFormat.Property.FullWidthSelection, True)
 
         # --- 2. 定义高亮规则 ---
-        # 关键字
-        keywords = ['ANM', 'Std_unknown', 'ENTRY', 'QUAD', 'FACE', 'SCRIPT']
-        self.highlighting_rules.append((re.compile(r'\b(' + '|'.join(keywords) + r'):'), self.keyword_format))
-
-        # 属性
-        properties = ['Unknown', 'Position', 'Depth', 'Width', 'Height', 'Type', 'Script_index', 'Padding']
-        self.highlighting_rules.append((re.compile(r'\b(' + '|'.join(properties) + r'):'), self.property_format))
-
-        hex_rule = re.compile(r'(#(?:[0-9a-fA-F]{8}|[0-9a-fA-F]{6}))\b')
-        self.highlighting_rules.append((hex_rule, self.hex_format))
-        
-        # 指令 (ins_xxx 或翻译后的名称)
-        self.highlighting_rules.append((re.compile(r'\b([\w_]+)(?=\()'), self.instruction_format))
-        # 规则 1: 标签定义 (支持 1234: 和 @label:)
-        # 使用非捕获组 (?:...) 来匹配两种情况
-        self.highlighting_rules.append((re.compile(r'^\s*((?:\d+|@[a-zA-Z_]\w*)):'), self.label_format))
-
-        # 规则 2: @标签引用 (例如在 jmp 中)
-        # 这个规则很具体，可以放在前面
-        self.highlighting_rules.append((re.compile(r'(@[a-zA-Z_]\w*)'), self.label_ref_format))
-
-        # 规则 3: jmp指令中的数字偏移量
-        # 这个规则必须放在通用数字规则之前，以获得更高的优先级。
-        # 它匹配整个jmp指令，但只捕获第二个数字参数。
-        self.highlighting_rules.append((re.compile(r'\bjmp\s*\([^,]+,\s*(\d+)\)'), self.label_ref_format))
-
-        # 时间标签
-        self.highlighting_rules.append((re.compile(r'^\s*(\d+):'), self.label_format))
-
-        # 浮点数和整数
-        self.highlighting_rules.append((re.compile(r'\b[+-]?(\d+\.\d*f?|\.\d+f?|\d+)\b', re.IGNORECASE), self.parameter_format))
-        
-        # .anm 文件路径 (作为字符串)
-        self.highlighting_rules.append((re.compile(r'\b\w+\.anm\b'), self.string_format))
-        
-        # 注释: STD 脚本中注释仅用 '//' 表示
-        self.highlighting_rules.append((re.compile(r'//[^\n]*'), self.comment_format))
-
-        # 颜色代码行: 所有以 '#' 开头的整行都视为颜色代码并使用 hex_format
-        # 该规则放在最后以覆盖其他可能的匹配（如关键字、指令等）
-        self.highlighting_rules.append((re.compile(r'^\s*#.*'), self.hex_format))
+        # 正则在模块导入时已编译好，这里只把格式名换成本实例的格式对象
+        self.highlighting_rules = [(pattern, getattr(self, format_name)) for pattern, format_name in _HIGHLIGHTING_RULES]
 
     def highlightBlock(self, text: str):
         """ [REVISED] 统一的、无歧义的高亮逻辑，并记录颜色片段供悬浮预览使用。 """
@@ -189,15 +188,15 @@ class StdSyntaxHighlighter(QSyntaxHighlighter):
         in_script_section = False
 
         # 指令关键字：来自参考 JSON 的已知指令名 + ins_0..ins_999
-        instruction_keywords = list(self.instruction_docs.keys()) if self.instruction_docs else []
-        instruction_keywords += [f'ins_{i}' for i in range(1000)]
-        # 构建模式：匹配指令名后紧跟左括号
-        pattern = None
-        if instruction_keywords:
-            try:
-                pattern = re.compile(r'\b(' + '|'.join(re.escape(k) for k in instruction_keywords) + r')\b(?=\s*\()')
-            except re.error:
-                pattern = None
+        instruction_docs = self.instruction_docs or {}
+        find_calls = _CALL_NAME_RE.findall
+
+        def is_instruction_call(code: str) -> bool:
+            # 行内任一 "名称(" 的名称是已知指令，即视为指令调用
+            for name in find_calls(code):
+                if name in instruction_docs or name in _RAW_INSTRUCTION_NAMES:
+                    return True
+            return False
 
         offset = 0
         for line in text.splitlines():
@@ -234,7 +233,7 @@ class StdSyntaxHighlighter(QSyntaxHighlighter):
                 continue
 
             # 若该行看起来是指令调用且缺少分号，则报错
-            if pattern and pattern.search(code_part):
+            if is_instruction_call(code_part):
                 errors.append((offset, len(line), self._semicolon_error_format))
 
             offset += len(line) + 1
@@ -7,6 +7,9 @@ from PyQt6.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont, QTex
 #从 app.core.settings 导入默认路径
 from app.core.settings import Settings
 
+# 匹配 "名称(" 形式调用中的完整单词名称；再用字典成员判断代替由全部指令名拼成的大型分支正则
+_CALL_NAME_RE = re.compile(r'\b(\w+)(?=\s*\()')
+
 settings = Settings()
 DEFAULT_INSTRUCTION_PATH = settings.get_instructions_path()
 DEFAULT_VARIABLE_PATH = settings.get_variables_path()
@@ -25,6 +28,8 @@ class AnmSyntaxHighlighter(QSyntaxHighlighter):
         
         self.sprite_names = set()
         self.label_names = set()
+        # 动态规则变化后置为 True，由 MainWindow 在下一次更新时整篇重新高亮并复位
+        self.rules_dirty = False
 
         # --- 1. 定义颜色和样式 ---
         keyword_format = QTextCharFormat(); keyword_format.setForeground(QColor("#f92672")); keyword_format.setFontWeight(QFont.Weight.Bold)
@@ -111,15 +116,18 @@ class AnmSyntaxHighlighter(QSyntaxHighlighter):
 
     def update_dynamic_rules(self, full_text: str):
         sprite_def_pattern = r'^\s*sprite\s+([a-zA-Z_]\w*)\s*='
-        self.sprite_names = set(re.findall(sprite_def_pattern, full_text, re.MULTILINE))
-        if self.sprite_names:
-            sprite_usage_pattern = re.compile("\\b(" + "|".join(re.escape(name) for name in self.sprite_names) + ")\\b")
-            self.sprite_usage_rule = (sprite_usage_pattern, self.sprite_usage_rule[1])
-        else:
-            self.sprite_usage_rule = (None, self.sprite_usage_rule[1])
+        sprite_names = set(re.findall(sprite_def_pattern, full_text, re.MULTILINE))
+        # 精灵名集合不变时着色结果也不变，保留现有规则，无需整篇重新高亮
+        if sprite_names != self.sprite_names:
+            self.sprite_names = sprite_names
+            if sprite_names:
+                sprite_usage_pattern = re.compile("\\b(" + "|".join(re.escape(name) for name in sprite_names) + ")\\b")
+                self.sprite_usage_rule = (sprite_usage_pattern, self.sprite_usage_rule[1])
+            else:
+                self.sprite_usage_rule = (None, self.sprite_usage_rule[1])
+            self.rules_dirty = True
         label_def_pattern = r'^\s*([a-zA-Z_][\w]*):'
         self.label_names = set(re.findall(label_def_pattern, full_text, re.MULTILINE))
-        # self.rehighlight() is called by TextEditor after this
 
     # ==================================================================
     # TextEditor 通用接口实现
@@ -173,10 +181,8 @@ class AnmSyntaxHighlighter(QSyntaxHighlighter):
         errors = []
         if not self.instruction_docs: return []
 
-        instruction_keywords = self.instruction_docs.keys()
-        if not instruction_keywords: return []
-        
-        pattern = re.compile(r'\b(' + '|'.join(re.escape(k) for k in instruction_keywords) + r')\b(?=\s*\()')
+        instruction_docs = self.instruction_docs
+        find_calls = _CALL_NAME_RE.findall
 
         offset = 0
         for line in text.splitlines():
@@ -185,7 +191,8 @@ class AnmSyntaxHighlighter(QSyntaxHighlighter):
                             stripped_line.startswith(('//', '#')) or
                             stripped_line.endswith(('{', '}', ':', ';')))
             
-            if not is_skippable and pattern.search(stripped_line):
+            # 行内任一 "名称(" 的名称是已知指令，即视为指令调用
+            if not is_skippable and any(name in instruction_docs for name in find_calls(stripped_line)):
                 # 错误位置是这一行的开头，长度是整行，格式要求整行高亮
                 errors.append((offset, len(line), self._semicolon_error_format))
             
@@ -102,6 +102,11 @@ class TextEditor(QPlainTextEdit):
         self.find_panel.search_text_changed.connect(self._update_search_count)
 
         self._highlighter: QSyntaxHighlighter | None = None
+        # 上一次通过 word_under_cursor_changed 发出的单词
+        self._last_cursor_word: str | None = None
+        # 文档纯文本的快照；文档内容变化时作废，同一轮更新中的多次读取共用一份
+        self._plain_text: str | None = None
+        self.document().contentsChanged.connect(self._invalidate_plain_text)
 
         self.completer = QCompleter(self)
         self.completer.setWidget(self)
@@ -160,11 +165,22 @@ class TextEditor(QPlainTextEdit):
             self._highlighter.setDocument(None)
         
         self._highlighter = new_highlighter
+        # 换了高亮器（即换了文档来源）后，同一个单词也需要重新查询
+        self._last_cursor_word = None
         
         if self._highlighter:
             self._highlighter.setDocument(self.document())
         
 
+    def plain_text(self) -> str:
+        """返回文档纯文本；文档未变化时复用上一次的结果，避免重复复制整篇文本。"""
+        if self._plain_text is None:
+            self._plain_text = self.toPlainText()
+        return self._plain_text
+
+    def _invalidate_plain_text(self):
+        self._plain_text = None
+
     def update_completion_model(self):
         """由外部 (MainWindow) 调用的公共方法。"""
         all_words = []
@@ -320,6 +336,10 @@ class TextEditor(QPlainTextEdit):
         cursor = self.textCursor()
         cursor.select(QTextCursor.SelectionType.WordUnderCursor)
         word = cursor.selectedText()
+        # 光标在同一个单词内移动时不重复查询文档
+        if word == self._last_cursor_word:
+            return
+        self._last_cursor_word = word
         self.word_under_cursor_changed.emit(word)
 
 
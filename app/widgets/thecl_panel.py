@@ -42,6 +42,8 @@ class TheclPanel(QDockWidget):
     eclmap_path_changed = pyqtSignal(str)
     thecl_ref_path_changed = pyqtSignal(str)
     outline_jump_requested = pyqtSignal(int)
+    # thecl 执行成功但有 stderr 输出时发出 (标题, 内容)
+    tool_warning = pyqtSignal(str, str)
     # 自定义数据Role：用于给条目存储稳定的key
     KEY_ROLE = Qt.ItemDataRole.UserRole + 1
 
@@ -153,6 +155,11 @@ class TheclPanel(QDockWidget):
         self._outline_selected_key = None
         self._outline_scroll_value = 0
         self._outline_initialized = False
+        # 上一次推送的符号列表及与之一一对应的树节点，用于增量修补
+        self._outline_symbols = []
+        self._outline_items = []
+        self._function_icon = QIcon(self.style().standardPixmap(QStyle.StandardPixmap.SP_ArrowRight))
+        self._label_icon = QIcon(self.style().standardPixmap(QStyle.StandardPixmap.SP_DialogYesButton))  # 用一个不同的图标
 
     # --- 公共方法 ---
     def get_thecl_path(self) -> str:
@@ -191,58 +198,51 @@ class TheclPanel(QDockWidget):
         return {
             "simple_mode": self._simple_mode_checkbox.isChecked()
         }
-    def update_outline(self, symbols: list[Dict]):
-        """用解析器提供的新数据更新大纲视图。
+    def update_outline(self, symbols: list):
+        """用解析器提供的新数据（带 name / type / line 属性的 Symbol 元组）更新大纲视图。
         规则：
         - 函数作为顶级节点。
         - 标签归属到其最近的函数之下作为子节点；若无函数，则作为顶级节点。
+        与上一次的列表相比只增删了标签时，就地修补树节点；否则整体重建。
         """
+        self._outline_tree.setUpdatesEnabled(False)
+        if not self._patch_outline(symbols):
+            self._rebuild_outline(symbols)
+
+        # 保持当前过滤条件
+        if self._outline_filter.text():
+            self._filter_outline(self._outline_filter.text())
+
+        self._outline_tree.setUpdatesEnabled(True)
+
+    def _rebuild_outline(self, symbols: list):
+        """清空大纲树并按 symbols 重新构建全部节点。"""
         # 先快照当前展开/选择/滚动状态
         self._snapshot_outline_state()
-
-        # 批量更新，避免闪烁
-        self._outline_tree.setUpdatesEnabled(False)
         self._outline_tree.clear()
 
-        function_icon = QIcon(self.style().standardPixmap(QStyle.StandardPixmap.SP_ArrowRight))
-        label_icon = QIcon(self.style().standardPixmap(QStyle.StandardPixmap.SP_DialogYesButton))  # 用一个不同的图标
-
+        items = []
+        root = self._outline_tree.invisibleRootItem()
         current_function_item: QTreeWidgetItem | None = None
         current_function_key: Optional[str] = None
 
         for symbol in symbols:
-            s_type = symbol.get("type")
-            s_name = symbol.get("name", "?")
-            s_line = int(symbol.get("line", 1))
-
             # 决定父节点：函数为顶级；标签优先挂到最近函数下
-            if s_type == "function":
-                parent = self._outline_tree
-            elif s_type == "label" and current_function_item is not None:
+            if symbol.type == "label" and current_function_item is not None:
                 parent = current_function_item
             else:
-                parent = self._outline_tree
+                parent = root
 
             item = QTreeWidgetItem(parent)
-            item.setText(0, s_name)
-            item.setData(0, Qt.ItemDataRole.UserRole, s_line)
-            # 生成并存储稳定key
-            if s_type == "function":
-                item_key = f"F:{s_name}@{s_line}"
+            item_key = self._outline_item_key(symbol, current_function_key)
+            self._fill_outline_item(item, symbol, item_key)
+            if symbol.type == "function":
+                current_function_item = item
                 current_function_key = item_key
-            elif s_type == "label" and current_function_key:
-                item_key = f"{current_function_key}/L:{s_name}@{s_line}"
-            else:
-                item_key = f"L:{s_name}@{s_line}"
-            item.setData(0, self.KEY_ROLE, item_key)
+            items.append(item)
 
-            if s_type == "function":
-                item.setIcon(0, function_icon)
-                item.setToolTip(0, f"函数定义 (第 {s_line} 行)")
-                current_function_item = item
-            elif s_type == "label":
-                item.setIcon(0, label_icon)
-                item.setToolTip(0, f"标签 (第 {s_line} 行)")
+        self._outline_symbols = list(symbols)
+        self._outline_items = items
 
         # 更新完毕，恢复先前状态；如果是首次构建，则默认仅展开到顶层
         if self._outline_initialized:
@@ -251,11 +251,91 @@ class TheclPanel(QDockWidget):
             self._outline_tree.expandToDepth(0)
             self._outline_initialized = True
 
-        # 保持当前过滤条件
-        if self._outline_filter.text():
-            self._filter_outline(self._outline_filter.text())
+    def _patch_outline(self, symbols: list) -> bool:
+        """
+        尝试在现有树上就地应用变更，成功返回 True。
+
+        去掉新旧列表中类型序列相同的首尾部分后，若中间变化的部分只含标签，
+        这些标签必然属于同一个父节点，只需删除/插入这几项；首尾部分的节点保留，
+        仅更新名称和行号有变化的项。函数增删会改变其后标签的归属，
+        变化超过一半时逐项修补也不再划算，这两种情况交给整体重建。
+        """
+        old = self._outline_symbols
+        items = self._outline_items
+        if not old or not symbols:
+            return False
+        n_old, n_new = len(old), len(symbols)
+        shorter = min(n_old, n_new)
+
+        prefix = 0
+        while prefix < shorter and old[prefix].type == symbols[prefix].type:
+            prefix += 1
+        suffix = 0
+        while (suffix < shorter - prefix
+               and old[n_old - 1 - suffix].type == symbols[n_new - 1 - suffix].type):
+            suffix += 1
+
+        removed = old[prefix:n_old - suffix]
+        added = symbols[prefix:n_new - suffix]
+        if len(removed) + len(added) > n_new // 2:
+            return False
+        if any(s.type != "label" for s in removed) or any(s.type != "label" for s in added):
+            return False
+
+        if removed or added:
+            root = self._outline_tree.invisibleRootItem()
+            if prefix == 0:
+                parent, index = root, 0
+            elif old[prefix - 1].type == "function":
+                parent, index = items[prefix - 1], 0
+            else:
+                anchor = items[prefix - 1]
+                parent = anchor.parent() or root
+                index = parent.indexOfChild(anchor) + 1
+
+            for item in items[prefix:n_old - suffix]:
+                parent.removeChild(item)
+            new_items = []
+            for offset, symbol in enumerate(added):
+                item = QTreeWidgetItem()
+                parent.insertChild(index + offset, item)
+                new_items.append(item)
+            items = items[:prefix] + new_items + items[n_old - suffix:]
+
+        # 行号偏移或重命名只需更新键值有变化的节点；函数键变化时其下标签的键也随之更新
+        current_function_key: Optional[str] = None
+        for symbol, item in zip(symbols, items):
+            item_key = self._outline_item_key(symbol, current_function_key)
+            if item.data(0, self.KEY_ROLE) != item_key:
+                self._fill_outline_item(item, symbol, item_key)
+            if symbol.type == "function":
+                current_function_key = item_key
+
+        self._outline_symbols = list(symbols)
+        self._outline_items = items
+        return True
+
+    @staticmethod
+    def _outline_item_key(symbol, function_key: Optional[str]) -> str:
+        """生成节点的稳定 key，用于在重建前后匹配展开/选择状态。"""
+        if symbol.type == "function":
+            return f"F:{symbol.name}@{symbol.line}"
+        if symbol.type == "label" and function_key:
+            return f"{function_key}/L:{symbol.name}@{symbol.line}"
+        return f"L:{symbol.name}@{symbol.line}"
+
+    def _fill_outline_item(self, item: QTreeWidgetItem, symbol, item_key: str):
+        """把符号的名称、行号、key、图标和提示写入节点。"""
+        item.setText(0, symbol.name)
+        item.setData(0, Qt.ItemDataRole.UserRole, symbol.line)
+        item.setData(0, self.KEY_ROLE, item_key)
+        if symbol.type == "function":
+            item.setIcon(0, self._function_icon)
+            item.setToolTip(0, f"函数定义 (第 {symbol.line} 行)")
+        elif symbol.type == "label":
+            item.setIcon(0, self._label_icon)
+            item.setToolTip(0, f"标签 (第 {symbol.line} 行)")
 
-        self._outline_tree.setUpdatesEnabled(True)
     # --- UI 构建辅助方法 ---
     def _create_outline_group(self) -> QGroupBox:
         """创建一个包含大纲树的 GroupBox。"""
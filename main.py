@@ -1,12 +1,19 @@
 # main.py
 
 import sys
+import multiprocessing
+from PyQt6.QtGui import QPixmapCache
 from PyQt6.QtWidgets import QApplication
 from app.main_window import MainWindow
 
 if __name__ == '__main__':
+    # 打包为 exe 后，批处理使用的工作进程需要这一步才能正确启动
+    multiprocessing.freeze_support()
+
     # 1. 每个PyQt应用都需要一个QApplication实例
     app = QApplication(sys.argv)
+    # 精灵预览 / 组合窗口的缩略图经 QPixmapCache 跨文件复用，放宽默认的 10 MB 上限
+    QPixmapCache.setCacheLimit(64 * 1024)  # 单位 KB
 
     # 2. 创建主窗口的实例
     window = MainWindow()
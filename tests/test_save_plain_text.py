@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+try:
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtGui import QTextDocument
+    from app.main_window import MainWindow, _iter_plain_text
+except ImportError:
+    QTextDocument = None
+
+_SAMPLES = [
+    '',
+    'entry 1\n\tSay(a)',
+    'entry 1\u2028\tSay(a)\n',           # Shift+Enter 插入的行分隔符
+    'a\u00a0b\u2028\u2028c\n\nd\u2028',
+    '\u2028',
+]
+
+
+@unittest.skipIf(QTextDocument is None, "需要 PyQt6")
+class SavePlainTextTest(unittest.TestCase):
+    def _document(self, text):
+        document = QTextDocument()
+        document.setPlainText(text)
+        return document
+
+    def test_chunks_match_to_plain_text(self):
+        for text in _SAMPLES:
+            document = self._document(text)
+            with self.subTest(text=text):
+                self.assertEqual(''.join(_iter_plain_text(document)), document.toPlainText())
+
+    def test_write_to_file_saves_line_separator_as_newline(self):
+        document = self._document('entry 1\u2028\tSay(a)')
+        window = SimpleNamespace(
+            text_editor=SimpleNamespace(document=lambda: document),
+            statusBar=SimpleNamespace(showMessage=lambda *args: None),
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / 'out.txt'
+            self.assertTrue(MainWindow._write_to_file(window, path))
+            saved = path.read_bytes().decode('utf-8')
+        self.assertEqual(saved, 'entry 1' + os.linesep + '\tSay(a)')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# tests/test_thmsg_recover.py
+
+import contextlib
+import io
+import os
+import random
+import re
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.core.thmsg_wrapper import ThmsgWrapper
+
+# 测试用的指令参考表 {指令名: 指令ID}，覆盖需要修补参数的 1 / 7 / 14 / 19 与普通指令
+_ID_BY_NAME = {'Say': '1', 'Go': '2', 'Wait': '7', 'Face': '14', 'Stop': '19'}
+
+
+def _baseline_recover(text: str) -> list:
+    """优化前 _recover_txt_to_dmsg 的逐行逻辑（splitlines + strip），作为对照。"""
+    recovered_lines = []
+    for line in text.splitlines():
+        content = line.strip()
+        if not content or content.startswith('//'):
+            continue
+
+        if not line.startswith((' ', '\t')):
+            if content.startswith('entry'):
+                recovered_lines.append(content)
+            elif content.startswith('T='):
+                recovered_lines.append(f'@{content[2:]}')
+            else:
+                recovered_lines.append(content)
+            continue
+
+        match = re.search(r'([\w_]+)\((.*)\)', content)
+        if not match:
+            recovered_lines.append(line)
+            continue
+
+        func_name, params_str = match.groups()
+        params = params_str.split(';') if params_str else []
+        if func_name in _ID_BY_NAME:
+            ins_id = _ID_BY_NAME[func_name]
+            if ins_id in ('7') and not params:
+                params = ['0']
+            if ins_id in ('14') and len(params) < 2:
+                params.insert(0, '0')
+            if ins_id == '19' and not params:
+                params = ['0']
+            line_to_write = ins_id
+            if params:
+                line_to_write += f';{";".join(params)}'
+        elif func_name.startswith('ins_'):
+            line_to_write = func_name.split('_')[1]
+            if params:
+                line_to_write += f';{";".join(params)}'
+        else:
+            line_to_write = line
+        recovered_lines.append(line_to_write)
+    return recovered_lines
+
+
+class RecoverTxtToDmsgTest(unittest.TestCase):
+    # 随机拼接的片段；包含日文脚本中常见的全角空格 U+3000，以及 str.splitlines() 额外认作换行的各个字符
+    TOKENS = ['\n', '\n', ' ', '\t', '　', 'entry', ' 1', 'T=', '5', '@', '//', 'x',
+              'Say', 'Go', 'Wait', 'Face', 'Stop', 'ins_3', 'Foo', '(', ')', ';', 'a', '「はい」',
+              '\r', '\v', '\f', '\x1c', '\x1d', '\x1e', '\x85', '\u2028', '\u2029']
+
+    def setUp(self):
+        self.wrapper = ThmsgWrapper.__new__(ThmsgWrapper)
+        self.wrapper._id_by_name = _ID_BY_NAME
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.txt_path = Path(self._tmpdir.name) / 'script.txt'
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _recover(self, text: str) -> str:
+        self.txt_path.write_bytes(text.encode('utf-8'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.wrapper._recover_txt_to_dmsg(self.txt_path, encoding='utf-8').decode('utf-8')
+
+    @staticmethod
+    def _expected(text: str) -> str:
+        # 旧实现以文本模式写出 '\n'.join(lines) + '\n'，即按平台换行符连接
+        return os.linesep.join(_baseline_recover(text)) + os.linesep
+
+    def test_fullwidth_space_lines(self):
+        text = '　@5\n　T=5　\n　entry 1\n　 entry 2\n\tSay(a;b)　\n'
+        self.assertEqual(self._recover(text), self._expected(text))
+        self.assertEqual(self._recover(text), os.linesep.join(['@5', '@5', 'entry 1', 'entry 2', '1;a;b']) + os.linesep)
+
+    def test_unicode_line_separators(self):
+        text = 'entry 1\u2028\tSay(a)\x85T=3'
+        self.assertEqual(self._recover(text), self._expected(text))
+        self.assertEqual(self._recover(text), os.linesep.join(['entry 1', '1;0;a', '@3']) + os.linesep)
+
+    def test_matches_baseline_line_logic(self):
+        rng = random.Random(12)
+        for _ in range(3000):
+            text = ''.join(rng.choice(self.TOKENS) for _ in range(rng.randint(0, 30)))
+            if rng.random() < 0.2:
+                text = text.replace('\n', '\r\n')
+            self.assertEqual(self._recover(text), self._expected(text), repr(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# tests/test_thstd_insify.py
+
+import random
+import re
+import unittest
+
+from app.core.thstd_wrapper import ThstdWrapper
+
+# 测试用的指令参考表 {指令名: 指令ID}
+_ID_BY_NAME = {'pos': '3', 'color': '7', 'wait': '12'}
+_PAIR_RE = re.compile(r'\(([^,]+),([^)]+)\);')
+
+
+def _baseline_insify(text_content: str) -> str:
+    """优化前 _insify_text 的逐行逻辑（splitlines + strip），作为对照。"""
+    insified_lines = []
+    for line in text_content.splitlines():
+        stripped = line.strip()
+        if stripped.startswith(r'//'): continue
+
+        if line.startswith('\t') or line.startswith('    '):
+            func_part = stripped.split('(')[0]
+            if func_part == 'jmp':
+                match = _PAIR_RE.search(stripped)
+                if match:
+                    time_arg = match.group(1).strip()
+                    offset_arg = match.group(2).strip()
+                    insified_lines.append(f"    ins_1({offset_arg}, {time_arg});")
+                else:
+                    insified_lines.append(line.lstrip())
+            else:
+                args_part = stripped[len(func_part):]
+                new_func_name = f"ins_{_ID_BY_NAME[func_part]}" if func_part in _ID_BY_NAME else func_part
+                insified_lines.append(f"    {new_func_name}{args_part}")
+        else:
+            insified_lines.append(line)
+    return "\n".join(insified_lines)
+
+
+class InsifyTextTest(unittest.TestCase):
+    # 随机拼接的片段；包含 str.splitlines() 额外认作换行的各个字符
+    TOKENS = ['\n', '\n', '\t', '    ', ' ', '　', '//', 'pos', 'color', 'wait', 'jmp', 'foo', 'ins_5',
+              '(', ')', ',', ';', '1', '@lbl', ':',
+              '\r', '\r\n', '\v', '\f', '\x1c', '\x1d', '\x1e', '\x85', '\u2028', '\u2029']
+
+    def setUp(self):
+        self.wrapper = ThstdWrapper.__new__(ThstdWrapper)
+        self.wrapper._id_by_name = _ID_BY_NAME
+
+    def test_jmp_and_renames(self):
+        text = '0:\n\tpos(1, 2);\n    jmp(10, @lbl);\n// c\n\tfoo;\n'
+        self.assertEqual(self.wrapper._insify_text(text),
+                         '0:\n    ins_3(1, 2);\n    ins_1(@lbl, 10);\n    foo;')
+
+    def test_unicode_line_separators(self):
+        text = '0:\u2028\tpos(1, 2);\x0c\tcolor(3);\x85// c'
+        self.assertEqual(self.wrapper._insify_text(text), _baseline_insify(text))
+        self.assertEqual(self.wrapper._insify_text(text), '0:\n    ins_3(1, 2);\n    ins_7(3);')
+
+    def test_matches_baseline_line_logic(self):
+        rng = random.Random(7)
+        for _ in range(5000):
+            text = ''.join(rng.choice(self.TOKENS) for _ in range(rng.randint(0, 30)))
+            self.assertEqual(self.wrapper._insify_text(text), _baseline_insify(text), repr(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
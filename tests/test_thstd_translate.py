@@ -0,0 +1,82 @@
+# tests/test_thstd_translate.py
+
+import os
+import random
+import re
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.core.thstd_wrapper import ThstdWrapper
+
+# 测试用的指令参考表 {指令ID: 指令名} / {指令ID: 描述}
+_NAME_BY_ID = {'3': 'pos', '7': 'color'}
+_DESC_BY_ID = {'3': 'Set position', '7': ' Set color '}
+_PAIR_RE = re.compile(r'\(([^,]+),([^)]+)\);')
+
+
+def _baseline_translate(dstd_path: Path, mode: str) -> str:
+    """优化前 _translate_dstd_file 的逐行逻辑（文本模式 readlines），返回应写出的文本。"""
+    with open(dstd_path, 'r', encoding='utf-8') as file: lines = file.readlines()
+    translated_lines = []
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith('ins_'):
+            func_part = stripped.split('(')[0]
+            args_part = stripped[len(func_part):]
+            ins_id = func_part.replace('ins_', '')
+            if ins_id == '1':
+                match = _PAIR_RE.search(stripped)
+                if match:
+                    offset_arg, time_arg = match.group(1).strip(), match.group(2).strip()
+                    translated_lines.append(f"    jmp({time_arg}, {offset_arg});\n")
+                else:
+                    translated_lines.append(line)
+            else:
+                new_func_name = _NAME_BY_ID.get(ins_id, func_part)
+                translated_lines.append(f"    {new_func_name}{args_part}\n")
+            if mode == 'default':
+                desc = _DESC_BY_ID.get(ins_id, 'No description available')
+                translated_lines.append(f"    // {desc.strip()}\n")
+        else:
+            translated_lines.append(line)
+    return ''.join(translated_lines)
+
+
+class TranslateDstdFileTest(unittest.TestCase):
+    # 随机拼接的片段；包含只有 splitlines 才认作换行、readlines 不认的字符
+    TOKENS = ['\n', '\n', '\r\n', '\r', '\t', ' ', 'ins_1', 'ins_3', 'ins_7', 'ins_9', 'foo',
+              '(', ')', ',', ';', '1', '@lbl', ':', '//',
+              '\v', '\f', '\x1c', '\x1d', '\x1e', '\x85', '\u2028', '\u2029']
+
+    def setUp(self):
+        self.wrapper = ThstdWrapper.__new__(ThstdWrapper)
+        self.wrapper._name_by_id = _NAME_BY_ID
+        self.wrapper._desc_by_id = _DESC_BY_ID
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.dstd_path = Path(self._tmpdir.name) / 'temp.dstd'
+        self.out_path = Path(self._tmpdir.name) / 'out.txt'
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _check(self, text: str, mode: str):
+        self.dstd_path.write_bytes(text.encode('utf-8'))
+        self.wrapper._translate_dstd_file(self.dstd_path, self.out_path, mode)
+        # 两者都以文本模式写出：'\n' 转换为平台换行符
+        expected = _baseline_translate(self.dstd_path, mode).replace('\n', os.linesep)
+        self.assertEqual(self.out_path.read_bytes().decode('utf-8'), expected, repr(text))
+
+    def test_form_feed_does_not_split_line(self):
+        self._check('ins_5(a);\x0c\nins_3(1, 2);\n', 'raw')
+        self._check('ins_5(a);\x0c\nins_3(1, 2);\n', 'default')
+
+    def test_matches_baseline_line_logic(self):
+        rng = random.Random(5)
+        for _ in range(2000):
+            text = ''.join(rng.choice(self.TOKENS) for _ in range(rng.randint(0, 30)))
+            self._check(text, rng.choice(('raw', 'default')))
+
+
+if __name__ == '__main__':
+    unittest.main()